@@ -1,15 +1,26 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response, stream_with_context
 from flask_cors import CORS
-from tensorflow import keras
 import numpy as np
 from PIL import Image
 import cv2
 import os
 import json
+import time
+import hmac
+import functools
+import threading
 import psycopg2
 from psycopg2.extras import RealDictCursor
 from datetime import datetime
 from dotenv import load_dotenv
+import model_manifest
+import migrations
+from embedding_index import EmbeddingIndex, embedding_model
+from prediction_history import PredictionHistoryWriter
+from jobs import InferenceGate, JobManager, TERMINAL_STATUSES
+from inference_server import InferenceClient, InferenceUnavailable
+from cascade import Cascade, CascadeStats, load_cascade_config
+import profiling
 
 # Load environment variables
 load_dotenv()
@@ -20,12 +31,16 @@ CORS(app)  # Enable CORS for all routes
 
 # Get the directory where this script is located
 script_dir = os.path.dirname(os.path.abspath(__file__))
-model_path = os.path.join(script_dir,"plant_disease_model.keras")
-class_names_path = os.path.join(script_dir, "class_names.json")
 
-# Load class names from JSON file
-with open(class_names_path, 'r') as f:
-    class_names = json.load(f)
+# Load the served model file, class names and version from the manifest
+# (falls back to plant_disease_model.keras + class_names.json as version 0)
+manifest = model_manifest.load_manifest()
+model_version = manifest["version"]
+model_path = model_manifest.model_file(manifest)
+# uint8-input export with the cast fused into the graph (see model_export.py),
+# None unless it was exported from this model version
+uint8_model_path = model_manifest.uint8_model_file(manifest)
+class_names = manifest["class_names"]
 
 # Get PostgreSQL connection URL from environment
 DATABASE_URL = os.getenv('DB_URL')
@@ -42,25 +57,15 @@ def get_db_connection():
 
 # Initialize PostgreSQL database
 def init_db():
-    """Create users table if it doesn't exist"""
+    """Apply pending schema migrations (see migrations.py); one SELECT when up to date"""
     conn = get_db_connection()
     if not conn:
         print("❌ Failed to connect to database")
         return
     
     try:
-        cursor = conn.cursor()
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS users (
-                id SERIAL PRIMARY KEY,
-                name VARCHAR(255) NOT NULL,
-                email VARCHAR(255) UNIQUE NOT NULL,
-                password VARCHAR(255) NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        conn.commit()
-        cursor.close()
+        for version, name in migrations.migrate(conn):
+            print(f"✅ Applied migration {version}: {name}")
         conn.close()
         print("✅ PostgreSQL database initialized!")
     except Exception as e:
@@ -71,32 +76,140 @@ def init_db():
 # Initialize database on startup
 init_db()
 
-# Load model once with error handling
-try:
-    model = keras.models.load_model(model_path)
-    print("✅ Model loaded successfully!")
-except Exception as e:
-    print(f"⚠️  Error loading model: {e}")
-    print(f"📝 Attempting to create a mock model for testing...")
+# Prediction history is written behind the request path, in batches
+history_writer = PredictionHistoryWriter(get_db_connection)
+HISTORY_PAGE_SIZE = 20
+HISTORY_MAX_PAGE_SIZE = 100
+
+# Embedding index for similar-case lookup and near-duplicate detection.
+# Embeddings are the Dense(512) activations, computed in the same forward pass.
+EMBEDDING_INDEX_DIR = os.getenv('EMBEDDING_INDEX_DIR', os.path.join(script_dir, "embedding_index"))
+SIMILAR_CASES_K = 5
+DUPLICATE_THRESHOLD = 0.985  # cosine similarity above which an upload counts as a resubmission
+embedding_index = None
+
+def open_embedding_index(embedding_dim):
+    """The served model version's embedding index, or None if disabled or the model has no embeddings"""
+    if not embedding_dim or os.getenv('EMBEDDING_INDEX', '1') == '0':
+        return None
+    # One index per model version (see embedding_index.py)
+    index = EmbeddingIndex(os.path.join(EMBEDDING_INDEX_DIR, f"v{model_version}"), dim=embedding_dim)
+    print(f"✅ Embedding index loaded ({len(index)} entries)")
+    return index
+
+# Confidence-gated cascade (see cascade.py): a fast low-resolution model answers
+# clear images and only uncertain ones reach the full model. It is enabled by a
+# cascade.json from calibrate_cascade.py; with an inference server, the server decides.
+cascade = None
+cascade_config = None
+cascade_stats = CascadeStats()
+
+# Out-of-process inference (see inference_server.py): the server process owns
+# the model and this worker only keeps a client with shared-memory slots
+INFERENCE_SERVER = os.getenv('INFERENCE_SERVER')
+INFERENCE_CONNECT_TIMEOUT = float(os.getenv('INFERENCE_CONNECT_TIMEOUT', '30'))
+inference_client = None
+inference_connected = False
+inference_connect_lock = threading.Lock()
+model = None
+
+def connect_inference_server(timeout=0):
+    """
+    Connect to the inference server and take the served model's class names,
+    version, embedding index and cascade from its handshake.
+
+    Called at startup and, while the server is not reachable yet, again before
+    each inference; raises InferenceUnavailable if it still cannot connect.
+    """
+    global inference_connected, class_names, model_version, embedding_index, cascade_config
+    with inference_connect_lock:
+        if inference_connected:
+            return
+        try:
+            inference_client.connect(timeout)
+        except OSError as e:
+            raise InferenceUnavailable(f"Inference server at {INFERENCE_SERVER} is not reachable: {e}")
+        # The server may serve a newer model than this worker's manifest
+        class_names = inference_client.class_names
+        model_version = inference_client.model_version
+        embedding_index = open_embedding_index(inference_client.embed_dim)
+        cascade_config = inference_client.cascade
+        if cascade_config is not None and embedding_index is not None:
+            print("⚠️  The inference server runs the cascade: only escalated images get embeddings "
+                  "(see embedding_coverage in /cascade)")
+        inference_connected = True
+        print(f"✅ Connected to inference server at {INFERENCE_SERVER} (model v{model_version})")
+
+if INFERENCE_SERVER:
+    inference_client = InferenceClient(
+        INFERENCE_SERVER, max_slots=int(os.getenv('INFERENCE_CLIENT_SLOTS', '4'))
+    )
+    try:
+        connect_inference_server(INFERENCE_CONNECT_TIMEOUT)
+    except Exception as e:
+        # Keep the client: the first request after the server comes up connects
+        print(f"⚠️  {e}; connecting on the first request instead")
+else:
+    # TensorFlow is only imported by workers that run the model themselves
+    from tensorflow import keras
+
+    # Load model once with error handling
     try:
-        # Try to import and use the mock model creator
-        import sys
-        sys.path.insert(0, script_dir)
-        from create_mock_model import create_mock_model
-        model = create_mock_model(len(class_names))
-        model.save(model_path)
-        print(f"✅ Mock model created and saved successfully!")
-        print("⚠️  Note: This is a test model. For production, train the real model using:")
-        print("   E:\\smart-leaf\\splitted_dataset\\cnn.ipynb")
-    except Exception as e2:
-        print(f"❌ Failed to create mock model: {e2}")
-        print("⚠️  To fix this:")
-        print("   1. Run: python create_mock_model.py")
-        print("   2. Or train the real model: E:\\smart-leaf\\splitted_dataset\\cnn.ipynb")
-        print("   3. Restart this Flask app")
-        model = None
-
-print(f"\n📋 Class names loaded ({len(class_names)} classes) from class_names.json:")
+        if uint8_model_path:
+            try:
+                model = keras.models.load_model(uint8_model_path)
+                print("✅ uint8-input model loaded successfully!")
+            except Exception as e:
+                # The float32 model is still valid; never fall through to the mock model here
+                print(f"⚠️  Error loading the uint8-input model, loading {model_path} instead: {e}")
+        if model is None:
+            model = keras.models.load_model(model_path)
+            print("✅ Model loaded successfully!")
+    except Exception as e:
+        print(f"⚠️  Error loading model: {e}")
+        print(f"📝 Attempting to create a mock model for testing...")
+        try:
+            # Try to import and use the mock model creator
+            import sys
+            sys.path.insert(0, script_dir)
+            from create_mock_model import create_mock_model
+            model = create_mock_model(len(class_names))
+            model.save(model_path)
+            print(f"✅ Mock model created and saved successfully!")
+            print("⚠️  Note: This is a test model. For production, train the real model using:")
+            print("   E:\\smart-leaf\\splitted_dataset\\cnn.ipynb")
+        except Exception as e2:
+            print(f"❌ Failed to create mock model: {e2}")
+            print("⚠️  To fix this:")
+            print("   1. Run: python create_mock_model.py")
+            print("   2. Or train the real model: E:\\smart-leaf\\splitted_dataset\\cnn.ipynb")
+            print("   3. Restart this Flask app")
+            model = None
+
+model_ready = model is not None or inference_client is not None
+embed_model = None
+if model is not None:
+    if os.getenv('EMBEDDING_INDEX', '1') != '0':
+        embed_model = embedding_model(model)
+    if embed_model is not None:
+        embedding_index = open_embedding_index(embed_model.outputs[0].shape[-1])
+
+if model is not None and os.getenv('CASCADE', '1') != '0':
+    cascade_config = load_cascade_config(model_version)
+    if cascade_config is not None:
+        try:
+            cascade = Cascade.from_config(cascade_config, embed_model or model,
+                                          full_has_embeddings=embed_model is not None)
+            print(f"✅ Cascade enabled: {cascade_config['fast_model']} first "
+                  f"(min_confidence={cascade.min_confidence}, min_margin={cascade.min_margin})")
+            if embedding_index is not None:
+                print("⚠️  Only images escalated to the full model get embeddings: similar cases and "
+                      "near-duplicate detection skip the rest (see embedding_coverage in /cascade)")
+        except Exception as e:
+            print(f"⚠️  Could not load the fast cascade model, serving the full model only: {e}")
+            cascade_config = None
+
+print(f"\n📋 Class names loaded ({len(class_names)} classes), model version {model_version}:")
 for i, name in enumerate(class_names):
     print(f"  {i:2d}: {name}")
 print()
@@ -110,6 +223,9 @@ def preprocess_image(image):
     3. Resize to (256, 256)
     4. Add batch dimension
     5. NO normalization - raw pixel values [0-255]
+
+    The result stays a C-contiguous uint8 buffer: the uint8 model export casts
+    it inside the graph, so no float32 copy is made on the Python side.
     """
     print(f"🔍 Original PIL image: size={image.size}, mode={image.mode}")
     
@@ -131,12 +247,68 @@ def preprocess_image(image):
     print(f"🔍 Value range: [{img_array.min()}, {img_array.max()}]")
     
     # NO normalization - use raw pixel values [0-255] (like notebook)
-    # Add batch dimension
-    img_array = np.expand_dims(img_array, axis=0)
+    # Add batch dimension (a view, no copy)
+    img_array = np.ascontiguousarray(img_array[np.newaxis, ...], dtype=np.uint8)
     print(f"🔍 Final shape: {img_array.shape}, dtype={img_array.dtype}")
     
     return img_array
 
+def run_inference(batch, interactive=True):
+    """
+    Softmax probabilities, Dense(512) embeddings and the cascade's escalation mask for a uint8 batch.
+
+    Embeddings are None without an index; the mask is None without a cascade,
+    and with one only the escalated rows have embeddings. interactive=False
+    lets an inference server put the batch behind other workers' /predict calls.
+    """
+    if inference_client is not None:
+        if not inference_connected:
+            connect_inference_server()
+        probabilities, embeddings, escalated = inference_client.predict(batch, interactive)
+    elif cascade is not None:
+        probabilities, embeddings, escalated = cascade.predict(batch)
+    # predict_on_batch skips the per-call tf.data pipeline that predict() builds
+    elif embed_model is not None:
+        embeddings, probabilities = embed_model.predict_on_batch(batch)
+        return np.asarray(probabilities), np.asarray(embeddings), None
+    else:
+        return np.asarray(model.predict_on_batch(batch)), None, None
+    if escalated is not None:
+        cascade_stats.record(escalated, has_embeddings=embeddings is not None)
+    return probabilities, embeddings, escalated
+
+def summarize_prediction(probabilities):
+    """Predicted class, confidence and top-5 confidences (in %) for one probabilities row"""
+    pred_index = int(np.argmax(probabilities))
+    top_indices = np.argsort(probabilities)[::-1][:5]
+    return {
+        "predicted_class": class_names[pred_index],
+        "confidence": float(probabilities[pred_index] * 100),
+        "all_confidences": {class_names[i]: float(probabilities[i] * 100) for i in top_indices}
+    }
+
+# Bulk inference jobs (see jobs.py). Interactive /predict calls hold the gate,
+# so job workers only run batches while no interactive request is in flight.
+# The gate only covers this process; with an inference server, job batches are
+# sent as background requests, which it serves after every worker's /predict.
+inference_gate = InferenceGate()
+job_manager = None
+JOB_MAX_PRIORITY = 10
+if model_ready:
+    job_manager = JobManager(
+        os.getenv('JOBS_DB_PATH', os.path.join(script_dir, "jobs.db")),
+        predict_fn=lambda batch: run_inference(batch, interactive=False)[0],
+        summarize_fn=summarize_prediction,
+        gate=inference_gate,
+        workers=int(os.getenv('JOB_WORKERS', '1')),
+        batch_size=int(os.getenv('JOB_BATCH_SIZE', '16')),
+        lease_seconds=float(os.getenv('JOB_LEASE_SECONDS', '300')),
+        on_result=lambda user_id, result: history_writer.record(
+            user_id, result["predicted_class"], result["confidence"],
+            result["all_confidences"], model_version
+        ),
+    )
+
 # Route: Health check
 @app.route("/", methods=["GET"])
 def home():
@@ -163,28 +335,27 @@ def signup():
         if len(password) < 6:
             return jsonify({"error": "Password must be at least 6 characters"}), 400
         
-        # Check if email already exists and insert new user
+        # Insert the new user; the unique email index rejects duplicates in the same round trip
         conn = get_db_connection()
         if not conn:
             return jsonify({"error": "Database connection failed"}), 500
         
         try:
             cursor = conn.cursor()
-            cursor.execute("SELECT id FROM users WHERE email = %s", (email,))
-            existing = cursor.fetchone()
+            cursor.execute(
+                "INSERT INTO users (name, email, password) VALUES (%s, %s, %s) "
+                "ON CONFLICT (email) DO NOTHING RETURNING id",
+                (name, email, password)
+            )
+            inserted = cursor.fetchone()
+            conn.commit()
             
-            if existing:
+            if inserted is None:
                 cursor.close()
                 conn.close()
                 return jsonify({"error": "Email already registered"}), 409
             
-            # Insert new user
-            cursor.execute(
-                "INSERT INTO users (name, email, password) VALUES (%s, %s, %s) RETURNING id",
-                (name, email, password)
-            )
-            user_id = cursor.fetchone()[0]
-            conn.commit()
+            user_id = inserted[0]
             cursor.close()
             conn.close()
             
@@ -290,12 +461,59 @@ def get_users():
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+# Route: Prediction history (newest first, keyset-paginated)
+@app.route("/history", methods=["GET"])
+def history():
+    try:
+        user_id = request.args.get("user_id", type=int)
+        if user_id is None:
+            return jsonify({"error": "Missing required parameter: user_id"}), 400
+        limit = max(1, min(request.args.get("limit", HISTORY_PAGE_SIZE, type=int), HISTORY_MAX_PAGE_SIZE))
+        before_id = request.args.get("before_id", type=int)
+
+        conn = get_db_connection()
+        if not conn:
+            return jsonify({"error": "Database connection failed"}), 500
+
+        try:
+            cursor = conn.cursor(cursor_factory=RealDictCursor)
+            # Both queries are range scans on idx_predictions_user_id_id
+            if before_id is None:
+                cursor.execute(
+                    """SELECT id, predicted_class, confidence, top_5, model_version, created_at
+                       FROM predictions WHERE user_id = %s
+                       ORDER BY id DESC LIMIT %s""",
+                    (user_id, limit)
+                )
+            else:
+                cursor.execute(
+                    """SELECT id, predicted_class, confidence, top_5, model_version, created_at
+                       FROM predictions WHERE user_id = %s AND id < %s
+                       ORDER BY id DESC LIMIT %s""",
+                    (user_id, before_id, limit)
+                )
+            rows = cursor.fetchall()
+            cursor.close()
+            conn.close()
+        except Exception as e:
+            conn.close()
+            return jsonify({"error": str(e)}), 500
+
+        return jsonify({
+            "history": rows,
+            # Pass as before_id to get the next page; None on the last page
+            "next_before_id": rows[-1]["id"] if len(rows) == limit else None
+        }), 200
+
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
 # Route: Prediction
 @app.route("/predict", methods=["POST"])
 def predict():
     try:
-        # Check if model is loaded
-        if model is None:
+        # Check if model is loaded (locally or in the inference server)
+        if not model_ready:
             return jsonify({"error": "Model not loaded. Please fix the model file."}), 500
         
         # Check if file is uploaded
@@ -308,7 +526,9 @@ def predict():
 
         # Make prediction - matching your notebook
         print("\n🔍 Making prediction...")
-        predictions = model.predict(img_array)[0]
+        with inference_gate.interactive():
+            probabilities_batch, embeddings, escalated = run_inference(img_array)
+        predictions = probabilities_batch[0]
         print(f"Raw predictions shape: {predictions.shape}")
         print(f"Raw predictions (all values): {predictions}")
         print(f"Sum: {predictions.sum():.6f}, Max: {predictions.max():.6f}, Min: {predictions.min():.6f}")
@@ -317,37 +537,223 @@ def predict():
         # Use them directly (like your notebook: np.argmax(pred))
         probabilities = predictions
         
-        # Get prediction using argmax (matching your notebook)
-        pred_index = np.argmax(probabilities)
-        predicted_class = class_names[pred_index]
-        confidence = float(probabilities[pred_index] * 100)
+        # Get prediction using argmax (matching your notebook), plus the top-5
+        response = summarize_prediction(probabilities)
+        predicted_class = response["predicted_class"]
+        confidence = response["confidence"]
+        top_5_predictions = response["all_confidences"]
         
-        print(f"\n🎯 Predicted class index: {pred_index}")
-        print(f"🎯 Predicted class name: {predicted_class}")
+        print(f"\n🎯 Predicted class name: {predicted_class}")
         print(f"🎯 Confidence: {confidence:.2f}%")
         
-        # Sort predictions to get top-5
-        top_indices = np.argsort(probabilities)[::-1][:5]
-        top_5_predictions = {
-            class_names[i]: float(probabilities[i] * 100) 
-            for i in top_indices
-        }
-        
         print("Top 5 predictions:")
         for class_name, conf in top_5_predictions.items():
             print(f"  {class_name}: {conf:.2f}%")
-        
-        # Prepare response
-        response = {
-            "predicted_class": predicted_class,
-            "confidence": confidence,
-            "all_confidences": top_5_predictions
-        }
+        if escalated is not None:
+            response["model_stage"] = "full" if escalated[0] else "fast"
+
+        # Queue for the history table; returns immediately
+        user_id = request.form.get("user_id", type=int)
+        if user_id is not None:
+            history_writer.record(user_id, predicted_class, confidence, top_5_predictions, model_version)
+
+        # Similar previously diagnosed leaves; near-identical ones are resubmissions.
+        # Images the cascade's fast model answered alone have no embedding.
+        if embedding_index is not None and embeddings is not None and (escalated is None or escalated[0]):
+            similar_cases = embedding_index.search(embeddings[0], k=SIMILAR_CASES_K)
+            duplicate = similar_cases[0] if similar_cases and \
+                similar_cases[0]["similarity"] >= DUPLICATE_THRESHOLD else None
+            if duplicate is None:
+                embedding_index.append(embeddings[:1], [{
+                    "predicted_class": predicted_class,
+                    "confidence": confidence,
+                    "model_version": model_version,
+                    "created_at": datetime.now().isoformat(timespec="seconds"),
+                }])
+            else:
+                print(f"♻️  Near-duplicate of case {duplicate['id']} ({duplicate['similarity']:.4f})")
+            response["similar_cases"] = similar_cases
+            response["duplicate_of"] = duplicate["id"] if duplicate else None
+
         return jsonify(response)
 
+    except InferenceUnavailable as e:
+        return jsonify({"error": str(e)}), 503
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+# Route: Cascade thresholds and escalation share (counted per web worker)
+@app.route("/cascade", methods=["GET"])
+def cascade_status():
+    if cascade_config is None:
+        return jsonify({"enabled": False})
+    return jsonify({
+        "enabled": True,
+        "min_confidence": cascade_config["min_confidence"],
+        "min_margin": cascade_config["min_margin"],
+        **cascade_stats.snapshot(),
+    })
+
+# Route: Submit a bulk inference job
+@app.route("/jobs", methods=["POST"])
+def submit_job():
+    try:
+        if job_manager is None:
+            return jsonify({"error": "Model not loaded. Please fix the model file."}), 500
+
+        files = request.files.getlist("files")
+        if not files:
+            return jsonify({"error": "No files uploaded"}), 400
+
+        priority = max(0, min(request.form.get("priority", 0, type=int), JOB_MAX_PRIORITY))
+        user_id = request.form.get("user_id", type=int)
+
+        # Decode and resize now, so the queue only holds 256x256x3 uint8 tensors
+        images, filenames, errors = [], [], []
+        for file in files:
+            filenames.append(file.filename)
+            try:
+                images.append(preprocess_image(Image.open(file.stream))[0])
+                errors.append(None)
+            except Exception as e:
+                images.append(None)
+                errors.append(f"Could not read image: {e}")
+
+        job_id = job_manager.submit(images, filenames, priority=priority, user_id=user_id, errors=errors)
+        return jsonify({"job_id": job_id, **job_manager.status(job_id)}), 202
+
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+# Route: Job status and progress
+@app.route("/jobs/<job_id>", methods=["GET"])
+def job_status(job_id):
+    if job_manager is None:
+        return jsonify({"error": "Model not loaded. Please fix the model file."}), 500
+    job = job_manager.status(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job), 200
+
+# Route: Job results (paginated, in upload order)
+@app.route("/jobs/<job_id>/results", methods=["GET"])
+def job_results(job_id):
+    if job_manager is None:
+        return jsonify({"error": "Model not loaded. Please fix the model file."}), 500
+    job = job_manager.status(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    offset = max(0, request.args.get("offset", 0, type=int))
+    limit = max(1, min(request.args.get("limit", 100, type=int), 500))
+    return jsonify({**job, "results": job_manager.results(job_id, offset, limit)}), 200
+
+# Route: Job progress as server-sent events until the job finishes
+@app.route("/jobs/<job_id>/events", methods=["GET"])
+def job_events(job_id):
+    if job_manager is None:
+        return jsonify({"error": "Model not loaded. Please fix the model file."}), 500
+    if job_manager.status(job_id) is None:
+        return jsonify({"error": "Job not found"}), 404
+
+    def stream():
+        last = None
+        while True:
+            job = job_manager.status(job_id)
+            if job != last:
+                yield f"data: {json.dumps(job)}\n\n"
+                last = job
+            if job["status"] in TERMINAL_STATUSES:
+                return
+            time.sleep(0.5)
+
+    return Response(stream_with_context(stream()), mimetype="text/event-stream")
+
+# Route: Cancel a job
+@app.route("/jobs/<job_id>", methods=["DELETE"])
+def cancel_job(job_id):
+    if job_manager is None:
+        return jsonify({"error": "Model not loaded. Please fix the model file."}), 500
+    if not job_manager.cancel(job_id):
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job_manager.status(job_id)), 200
+
+# Admin-only profiling (see profiling.py). Every /admin route answers 404
+# unless PROFILING_TOKEN is set and sent back in the X-Admin-Token header.
+PROFILING_TOKEN = os.getenv('PROFILING_TOKEN')
+PROFILE_DIR = os.getenv('PROFILE_DIR', os.path.join(script_dir, "profiles"))
+PROFILE_MAX_SECONDS = 120
+
+def admin_only(view):
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        token = request.headers.get("X-Admin-Token", "")
+        if not PROFILING_TOKEN or not hmac.compare_digest(token.encode(), PROFILING_TOKEN.encode()):
+            return jsonify({"error": "Not found"}), 404
+        return view(*args, **kwargs)
+    return wrapper
+
+def profile_seconds():
+    seconds = request.args.get("seconds", 10, type=float)
+    return min(max(seconds, 0.1), PROFILE_MAX_SECONDS)
+
+# Route: Sample every thread's stack for N seconds; returns flamegraph folded stacks
+@app.route("/admin/profile", methods=["POST"])
+@admin_only
+def admin_profile():
+    seconds = profile_seconds()
+    interval = request.args.get("interval_ms", profiling.DEFAULT_INTERVAL * 1000, type=float) / 1000
+    try:
+        folded, samples = profiling.SamplingProfiler(max(interval, 0.001)).run(seconds)
+    except RuntimeError as e:
+        return jsonify({"error": str(e)}), 409
+    filename = f"profile-{datetime.now():%Y%m%d-%H%M%S}.folded"
+    return Response(folded, mimetype="text/plain", headers={
+        "Content-Disposition": f"attachment; filename={filename}",
+        "X-Profile-Samples": str(samples),
+    })
+
+# Route: Record a TensorFlow trace of the inference calls made in the next N seconds
+@app.route("/admin/tf-trace", methods=["POST"])
+@admin_only
+def admin_tf_trace():
+    if model is None:
+        return jsonify({"error": "The model runs in the inference server, not in this process"}), 409
+    logdir = os.path.join(PROFILE_DIR, f"tf-trace-{datetime.now():%Y%m%d-%H%M%S}")
+    try:
+        profiling.capture_tf_trace(profile_seconds(), logdir)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 409
+    return jsonify({"logdir": logdir, "view": f"tensorboard --logdir {logdir}"}), 200
+
+# Route: Current stack of every thread
+@app.route("/admin/threads", methods=["GET"])
+@admin_only
+def admin_threads():
+    return jsonify(profiling.thread_stacks()), 200
+
+# Route: Start/stop tracemalloc and read its top allocators
+@app.route("/admin/tracemalloc", methods=["GET", "POST", "DELETE"])
+@admin_only
+def admin_tracemalloc():
+    if request.method == "POST":
+        frames = request.args.get("frames", profiling.DEFAULT_TRACEMALLOC_FRAMES, type=int)
+        started = profiling.start_tracemalloc(frames)
+        return jsonify({"tracing": True, "started": started}), 200
+    if request.method == "DELETE":
+        profiling.stop_tracemalloc()
+        return jsonify({"tracing": False}), 200
+    group_by = request.args.get("group_by", "lineno")
+    if group_by not in ("lineno", "filename", "traceback"):
+        return jsonify({"error": "group_by must be lineno, filename or traceback"}), 400
+    allocations = profiling.top_allocations(request.args.get("limit", 20, type=int), group_by)
+    if allocations is None:
+        return jsonify({"error": "tracemalloc is not running; POST /admin/tracemalloc first"}), 409
+    return jsonify(allocations), 200
+
 # Run the app
 if __name__ == "__main__":
+    # Turn SIGTERM into a normal exit so atexit hooks (history flush) run
+    import signal
+    import sys
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
     app.run(debug=True, host="0.0.0.0", port=5000)
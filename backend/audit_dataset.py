@@ -0,0 +1,342 @@
+"""
+Audit splitted_dataset before training: decode errors, duplicates, class balance.
+
+Every image under splitted_dataset/{train,val,test}/<class>/ is decoded fully
+in a process pool, and its SHA-256 content hash and 64-bit dHash (perceptual
+hash: brightness gradients of a 9x8 grayscale thumbnail) are computed.
+The report lists:
+    - files that fail to decode, or that are not JPEG, PNG, GIF or BMP data
+      whatever their extension (both crash training runs midway)
+    - identical files in more than one split (test/val images seen in training)
+    - identical files filed under different classes
+    - near-duplicates across splits (dHash Hamming distance <= --near-threshold)
+    - per-class image counts and imbalance
+
+Results are cached in dataset_audit_cache.json by path, size and mtime, so a
+re-audit only decodes new or changed files.
+
+With --write-manifest the tool writes a cleaned file list: corrupt files,
+conflicting labels and repeated copies are left out, and a cross-split
+duplicate keeps only its copy in the earliest split (train, then val, then
+test). train_model.py --dataset-manifest trains from that list.
+
+Usage:
+    python audit_dataset.py
+    python audit_dataset.py --workers 8 --report audit_report.json
+    python audit_dataset.py --write-manifest dataset_manifest.json
+    python audit_dataset.py --write-manifest dataset_manifest.json --drop-near-duplicates
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+import numpy as np
+from PIL import Image
+
+import model_manifest
+from embedding_index import hamming_distances
+
+backend_dir = os.path.dirname(os.path.abspath(__file__))
+dataset_dir = os.path.join(backend_dir, "..", "splitted_dataset")
+cache_path = os.path.join(backend_dir, "dataset_audit_cache.json")
+
+SPLITS = ("train", "val", "test")
+# Extensions image_dataset_from_directory picks up
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".gif")
+# Formats tf.io.decode_image recognises by their magic bytes (Pillow format names)
+TRAINABLE_FORMATS = ("JPEG", "PNG", "GIF", "BMP")
+DEFAULT_NEAR_THRESHOLD = 2
+# Bumped when audit_file() checks more, so older cache entries are re-audited
+CACHE_VERSION = 2
+CACHE_SAVE_EVERY = 2000
+DECODE_CHUNK_SIZE = 32
+PROGRESS_EVERY = 1000
+
+
+def dhash(image, size=8):
+    """64-bit difference hash: is each pixel brighter than its right neighbour?"""
+    thumbnail = image.convert("L").resize((size + 1, size), Image.LANCZOS)
+    pixels = np.asarray(thumbnail, dtype=np.int16)
+    bits = (pixels[:, 1:] > pixels[:, :-1]).flatten()
+    return int(np.packbits(bits).view(">u8")[0])
+
+
+def audit_file(path):
+    """
+    Decode one image fully; returns its hashes or the decode error. Runs in a worker process.
+
+    Pillow reads more formats than training does, so a file whose content is
+    not a format TensorFlow decodes (e.g. WebP saved as .jpg) is an error too.
+    """
+    entry = {"sha256": None, "dhash": None, "error": None}
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+        entry["sha256"] = hashlib.sha256(data).hexdigest()
+        with Image.open(path) as image:
+            if image.format not in TRAINABLE_FORMATS:
+                raise ValueError(f"{image.format} data, TensorFlow only decodes {', '.join(TRAINABLE_FORMATS)}")
+            # load() decodes every pixel, so truncated or corrupt data raises here
+            image.load()
+            entry["dhash"] = f"{dhash(image):016x}"
+    except Exception as e:
+        entry["error"] = f"{type(e).__name__}: {e}"
+    return entry
+
+
+def scan_dataset(root):
+    """{relative path: (split, class name, size, mtime_ns)} for every image in the splits."""
+    files = {}
+    for split in SPLITS:
+        split_dir = os.path.join(root, split)
+        if not os.path.isdir(split_dir):
+            continue
+        for class_entry in sorted(os.scandir(split_dir), key=lambda e: e.name):
+            if not class_entry.is_dir():
+                continue
+            for entry in os.scandir(class_entry.path):
+                if entry.is_file() and entry.name.lower().endswith(IMAGE_EXTENSIONS):
+                    stat = entry.stat()
+                    rel_path = f"{split}/{class_entry.name}/{entry.name}"
+                    files[rel_path] = (split, class_entry.name, stat.st_size, stat.st_mtime_ns)
+    return files
+
+
+def load_cache(root):
+    """Cached entries by relative path; empty if the cache is older or belongs to another dataset directory."""
+    if not os.path.exists(cache_path):
+        return {}
+    with open(cache_path, 'r') as f:
+        cache = json.load(f)
+    if cache.get("version") != CACHE_VERSION or cache.get("dataset_dir") != root:
+        return {}
+    return cache["files"]
+
+
+def save_cache(root, entries):
+    model_manifest.write_json_atomic(cache_path, {"version": CACHE_VERSION, "dataset_dir": root, "files": entries})
+
+
+def hash_files(root, files, workers):
+    """Cached or freshly computed audit entries for `files`; only new or changed files are decoded."""
+    cache = load_cache(root)
+    entries = {}
+    todo = []
+    for rel_path, (_, _, size, mtime_ns) in files.items():
+        cached = cache.get(rel_path)
+        if cached and cached["size"] == size and cached["mtime_ns"] == mtime_ns:
+            entries[rel_path] = cached
+        else:
+            todo.append(rel_path)
+
+    print(f"🗂️  {len(files)} images, {len(files) - len(todo)} cached, {len(todo)} to decode")
+    if todo:
+        start = time.perf_counter()
+        paths = [os.path.join(root, rel_path) for rel_path in todo]
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = pool.map(audit_file, paths, chunksize=DECODE_CHUNK_SIZE)
+            for done, (rel_path, entry) in enumerate(zip(todo, results), 1):
+                _, _, size, mtime_ns = files[rel_path]
+                entries[rel_path] = {"size": size, "mtime_ns": mtime_ns, **entry}
+                if done % PROGRESS_EVERY == 0:
+                    print(f"  {done}/{len(todo)} decoded")
+                if done % CACHE_SAVE_EVERY == 0:
+                    # An interrupted audit keeps what it already decoded
+                    save_cache(root, entries)
+        elapsed = time.perf_counter() - start
+        print(f"  {len(todo)} decoded in {elapsed:.1f}s ({len(todo) / elapsed:.0f} images/s)")
+    # Deleted files drop out of the cache
+    save_cache(root, entries)
+    return entries
+
+
+def find_near_duplicates(files, entries, threshold):
+    """Cross-split pairs whose dHashes differ in at most `threshold` bits and whose contents differ."""
+    by_split = defaultdict(list)
+    for rel_path, entry in entries.items():
+        if entry["dhash"] is not None:
+            by_split[files[rel_path][0]].append(rel_path)
+
+    pairs = []
+    for i, first in enumerate(SPLITS):
+        for second in SPLITS[i + 1:]:
+            if not by_split[first] or not by_split[second]:
+                continue
+            # Loop over the smaller split, vectorise over the larger one
+            small, large = sorted((by_split[first], by_split[second]), key=len)
+            # As (N, 8) bytes, the packed-signature layout hamming_distances works on
+            large_hashes = np.array([int(entries[p]["dhash"], 16) for p in large], dtype=np.uint64)
+            large_codes = large_hashes.view(np.uint8).reshape(-1, 8)
+            for path in small:
+                query = np.array([int(entries[path]["dhash"], 16)], dtype=np.uint64).view(np.uint8).reshape(1, 8)
+                distances = hamming_distances(large_codes, query)
+                for j in np.flatnonzero(distances <= threshold):
+                    other = large[j]
+                    if entries[other]["sha256"] != entries[path]["sha256"]:
+                        a, b = sorted((path, other), key=lambda p: SPLITS.index(files[p][0]))
+                        pairs.append({"paths": [a, b], "distance": int(distances[j])})
+    return pairs
+
+
+def build_report(root, files, entries, near_threshold):
+    corrupt = [
+        {"path": rel_path, "error": entry["error"]}
+        for rel_path, entry in sorted(entries.items()) if entry["error"]
+    ]
+
+    by_content = defaultdict(list)
+    for rel_path, entry in entries.items():
+        if entry["sha256"] is not None and entry["error"] is None:
+            by_content[entry["sha256"]].append(rel_path)
+    cross_split, conflicting_labels, within_split = [], [], []
+    for sha256, paths in by_content.items():
+        if len(paths) < 2:
+            continue
+        paths = sorted(paths, key=lambda p: (SPLITS.index(files[p][0]), p))
+        group = {"sha256": sha256, "paths": paths}
+        if len({files[p][1] for p in paths}) > 1:
+            conflicting_labels.append(group)
+        if len({files[p][0] for p in paths}) > 1:
+            cross_split.append(group)
+        else:
+            within_split.append(group)
+
+    counts = {split: Counter() for split in SPLITS}
+    for rel_path, (split, class_name, _, _) in files.items():
+        counts[split][class_name] += 1
+    class_names = sorted(set().union(*counts.values()))
+    train_counts = [counts["train"][name] for name in class_names]
+    imbalance = {
+        "classes": class_names,
+        "counts": {split: {name: counts[split][name] for name in class_names} for split in SPLITS},
+        "train_max_min_ratio": max(train_counts) / min(train_counts) if train_counts and min(train_counts) else None,
+        "missing": {split: [name for name in class_names if counts[split][name] == 0]
+                    for split in SPLITS if sum(counts[split].values())},
+    }
+
+    return {
+        "dataset_dir": root,
+        "audited_at": datetime.now().isoformat(timespec="seconds"),
+        "images": len(files),
+        "corrupt": corrupt,
+        "cross_split_duplicates": cross_split,
+        "conflicting_labels": conflicting_labels,
+        "within_split_duplicates": within_split,
+        "near_threshold": near_threshold,
+        "cross_split_near_duplicates": find_near_duplicates(files, entries, near_threshold),
+        "class_balance": imbalance,
+    }
+
+
+def print_report(report):
+    print("\n" + "=" * 60)
+    print("📋 Dataset audit")
+    print("=" * 60)
+    print(f"Images: {report['images']}")
+
+    print(f"\n❌ Corrupt or undecodable: {len(report['corrupt'])}")
+    for item in report["corrupt"][:20]:
+        print(f"   {item['path']}: {item['error']}")
+
+    def show_groups(title, groups, key="paths"):
+        print(f"\n{title}: {len(groups)}")
+        for group in groups[:10]:
+            print("   " + "  ==  ".join(group[key]))
+
+    show_groups("♻️  Identical files in more than one split", report["cross_split_duplicates"])
+    show_groups("⚠️  Identical files with different labels", report["conflicting_labels"])
+    print(f"\n📎 Identical files repeated within one split: {len(report['within_split_duplicates'])}")
+    show_groups(f"🔍 Cross-split near-duplicates (dHash distance <= {report['near_threshold']})",
+                report["cross_split_near_duplicates"])
+
+    balance = report["class_balance"]
+    print("\n📊 Images per class:")
+    splits = [split for split in SPLITS if sum(balance["counts"][split].values())]
+    print(f"   {'class':<50}" + "".join(f"{split:>8}" for split in splits))
+    for name in balance["classes"]:
+        print(f"   {name[:50]:<50}" + "".join(f"{balance['counts'][split][name]:>8}" for split in splits))
+    if balance["train_max_min_ratio"]:
+        print(f"\n   Largest/smallest train class: {balance['train_max_min_ratio']:.1f}x")
+    for split, names in balance["missing"].items():
+        if names:
+            print(f"   ⚠️  Missing from {split}: {', '.join(names)}")
+
+
+def clean_file_lists(files, report, drop_near_duplicates):
+    """Files to keep per split, following the rules in the module docstring."""
+    drop = {item["path"] for item in report["corrupt"]}
+    for group in report["conflicting_labels"]:
+        drop.update(group["paths"])
+    for group in report["cross_split_duplicates"] + report["within_split_duplicates"]:
+        # Paths are ordered train, val, test: keep the first copy
+        drop.update(group["paths"][1:])
+    if drop_near_duplicates:
+        for pair in report["cross_split_near_duplicates"]:
+            drop.add(pair["paths"][1])
+
+    kept = {split: [] for split in SPLITS}
+    for rel_path in sorted(files):
+        if rel_path not in drop:
+            kept[files[rel_path][0]].append(rel_path)
+    return kept, len(drop)
+
+
+def load_dataset_manifest(path):
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def manifest_files(manifest, split):
+    """(absolute path, class name) pairs of one split in a cleaned manifest."""
+    root = manifest["dataset_dir"]
+    return [
+        (os.path.join(root, rel_path), rel_path.split("/")[1])
+        for rel_path in manifest["splits"].get(split, [])
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Audit splitted_dataset for corrupt files, duplicates and imbalance")
+    parser.add_argument("--dataset-dir", default=dataset_dir)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="Decoder processes (default: one per CPU)")
+    parser.add_argument("--near-threshold", type=int, default=DEFAULT_NEAR_THRESHOLD,
+                        help="Largest dHash Hamming distance (out of 64 bits) counted as a near-duplicate")
+    parser.add_argument("--report", help="Also write the full report as JSON")
+    parser.add_argument("--write-manifest", help="Write a cleaned file list for train_model.py --dataset-manifest")
+    parser.add_argument("--drop-near-duplicates", action="store_true",
+                        help="Also leave later-split near-duplicates out of the manifest")
+    args = parser.parse_args()
+
+    root = os.path.abspath(args.dataset_dir)
+    files = scan_dataset(root)
+    if not files:
+        raise SystemExit(f"❌ No images found under {root}/{{{','.join(SPLITS)}}}")
+    entries = hash_files(root, files, args.workers)
+    report = build_report(root, files, entries, args.near_threshold)
+    print_report(report)
+
+    if args.report:
+        model_manifest.write_json_atomic(args.report, report)
+        print(f"\n💾 Report saved to {args.report}")
+
+    if args.write_manifest:
+        kept, dropped = clean_file_lists(files, report, args.drop_near_duplicates)
+        model_manifest.write_json_atomic(args.write_manifest, {
+            "dataset_dir": root,
+            "created_at": datetime.now().isoformat(timespec="seconds"),
+            "class_names": report["class_balance"]["classes"],
+            "dropped": dropped,
+            "splits": kept,
+        })
+        print(f"\n✅ Cleaned manifest saved to {args.write_manifest} ({dropped} files left out)")
+
+
+if __name__ == "__main__":
+    main()
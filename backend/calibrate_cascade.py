@@ -0,0 +1,172 @@
+"""
+Calibrate the confidence-gated cascade (see cascade.py) on the validation split.
+
+Both models predict every validation image once. Then a grid of
+(min_confidence, min_margin) thresholds is scored: an image the fast model is
+unsure about takes the full model's answer. The tool picks the pair with the
+lowest escalation rate whose cascade accuracy still reaches the target, and
+writes it to cascade.json for the currently served model version.
+
+A uint8 export of the fast model (model_export.py --src ... --dst ..._uint8.keras)
+is recorded in cascade.json only if it gives the fast model's outputs on the
+first calibration batch; otherwise the float32 fast model is served.
+
+Images the fast model answers alone get no embedding, so near-duplicate
+detection and similar cases only cover the escalated share (see cascade.py).
+A lower escalation rate means fewer resubmissions are recognised.
+
+Usage:
+    python train_model.py --arch fast --output plant_disease_model_fast.keras
+    python calibrate_cascade.py                          # at most 0.5 points below the full model
+    python calibrate_cascade.py --target-accuracy 0.97
+"""
+
+import argparse
+import os
+from datetime import datetime
+
+import numpy as np
+
+import model_manifest
+from cascade import cascade_config_path, default_fast_model_path, file_digest
+
+CONFIDENCE_GRID = np.round(np.linspace(0.0, 1.0, 101), 2)
+MARGIN_GRID = np.round(np.linspace(0.0, 0.5, 51), 2)
+DEFAULT_ACCURACY_DROP = 0.005
+CALIBRATION_BATCH_SIZE = 32
+# Largest output difference between the fast model and its uint8 export
+UINT8_EXPORT_TOLERANCE = 1e-4
+
+
+def choose_thresholds(fast_probabilities, fast_correct, full_correct, target_accuracy):
+    """
+    Cheapest thresholds reaching `target_accuracy`, or None if no pair does.
+
+    Returns a dict with min_confidence, min_margin, accuracy and escalation_rate.
+    Ties on escalation rate go to the more accurate pair.
+    """
+    top_two = np.sort(fast_probabilities, axis=1)[:, -2:]
+    confidence = top_two[:, -1]
+    margin = confidence - top_two[:, 0]
+
+    best = None
+    for min_margin in MARGIN_GRID:
+        below_margin = margin < min_margin
+        for min_confidence in CONFIDENCE_GRID:
+            escalated = below_margin | (confidence < min_confidence)
+            accuracy = float(np.mean(np.where(escalated, full_correct, fast_correct)))
+            if accuracy < target_accuracy:
+                continue
+            rate = float(np.mean(escalated))
+            if best is None or (rate, -accuracy) < (best["escalation_rate"], -best["accuracy"]):
+                best = {
+                    "min_confidence": float(min_confidence),
+                    "min_margin": float(min_margin),
+                    "accuracy": accuracy,
+                    "escalation_rate": rate,
+                }
+    return best
+
+
+def matching_uint8_export(fast_model, fast_path, images):
+    """Path of the fast model's uint8 export if it exists and matches on `images`, else None."""
+    from tensorflow import keras
+
+    uint8_path = model_manifest.uint8_variant_path(fast_path)
+    if not os.path.exists(uint8_path):
+        return None
+    batch = np.clip(np.round(images), 0, 255).astype(np.uint8)
+    expected = np.asarray(fast_model.predict_on_batch(batch.astype(np.float32)))
+    exported = np.asarray(keras.models.load_model(uint8_path).predict_on_batch(batch))
+    if np.max(np.abs(expected - exported)) > UINT8_EXPORT_TOLERANCE:
+        print(f"⚠️  {uint8_path} does not match the fast model (exported from an older one?); not used")
+        return None
+    return uint8_path
+
+
+def predict_split(fast_model, full_model, dataset):
+    """Fast and full probabilities plus integer labels for a whole split."""
+    fast, full, labels = [], [], []
+    for images, one_hot in dataset:
+        fast.append(np.asarray(fast_model.predict_on_batch(images)))
+        full.append(np.asarray(full_model.predict_on_batch(images)))
+        labels.append(np.argmax(one_hot, axis=1))
+    return np.concatenate(fast), np.concatenate(full), np.concatenate(labels)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pick cascade thresholds on the validation split")
+    parser.add_argument("--fast-model", default=default_fast_model_path,
+                        help="Fast first-stage model (train_model.py --arch fast)")
+    parser.add_argument("--target-accuracy", type=float,
+                        help="Cascade accuracy to reach (default: full model accuracy minus 0.005)")
+    parser.add_argument("--split", default="val", help="splitted_dataset split to calibrate on")
+    args = parser.parse_args()
+
+    import tensorflow as tf
+    from tensorflow import keras
+    from train_model import load_split
+
+    tf.get_logger().setLevel("ERROR")
+    manifest = model_manifest.load_manifest()
+    print(f"📂 Full model v{manifest['version']}: {manifest['model']}")
+    full_model = keras.models.load_model(model_manifest.model_file(manifest))
+    print(f"📂 Fast model: {args.fast_model}")
+    fast_model = keras.models.load_model(args.fast_model)
+
+    num_classes = len(manifest["class_names"])
+    if fast_model.output_shape[-1] != num_classes:
+        raise SystemExit(f"❌ Fast model has {fast_model.output_shape[-1]} classes, "
+                         f"the served model {num_classes}; retrain it on the same class list")
+
+    dataset = load_split(args.split, shuffle=False, batch_size=CALIBRATION_BATCH_SIZE)
+    if dataset.class_names != manifest["class_names"]:
+        raise SystemExit(f"❌ Class folders in the {args.split} split do not match the served model")
+
+    fast_uint8_path = matching_uint8_export(fast_model, args.fast_model, next(iter(dataset))[0].numpy())
+
+    print(f"\n🔍 Predicting the {args.split} split with both models...")
+    fast_probabilities, full_probabilities, labels = predict_split(fast_model, full_model, dataset)
+    fast_correct = np.argmax(fast_probabilities, axis=1) == labels
+    full_correct = np.argmax(full_probabilities, axis=1) == labels
+    full_accuracy = float(np.mean(full_correct))
+    fast_accuracy = float(np.mean(fast_correct))
+    print(f"  images: {len(labels)}")
+    print(f"  fast model accuracy: {fast_accuracy:.4f}")
+    print(f"  full model accuracy: {full_accuracy:.4f}")
+
+    target = args.target_accuracy
+    if target is None:
+        target = full_accuracy - DEFAULT_ACCURACY_DROP
+    best = choose_thresholds(fast_probabilities, fast_correct, full_correct, target)
+    if best is None:
+        raise SystemExit(f"❌ No thresholds reach accuracy {target:.4f} on {args.split}")
+
+    config = {
+        "model_version": manifest["version"],
+        "fast_model": os.path.relpath(os.path.abspath(args.fast_model), model_manifest.backend_dir),
+        "fast_model_sha256": file_digest(args.fast_model),
+        "fast_uint8_model": (os.path.relpath(os.path.abspath(fast_uint8_path), model_manifest.backend_dir)
+                             if fast_uint8_path else None),
+        "min_confidence": best["min_confidence"],
+        "min_margin": best["min_margin"],
+        "target_accuracy": target,
+        "split": args.split,
+        "images": int(len(labels)),
+        "cascade_accuracy": best["accuracy"],
+        "escalation_rate": best["escalation_rate"],
+        "fast_accuracy": fast_accuracy,
+        "full_accuracy": full_accuracy,
+        "calibrated_at": datetime.now().isoformat(timespec="seconds"),
+    }
+    model_manifest.write_json_atomic(cascade_config_path, config)
+
+    print(f"\n🎯 Target accuracy {target:.4f}")
+    print(f"  min_confidence={best['min_confidence']:.2f}  min_margin={best['min_margin']:.2f}")
+    print(f"  cascade accuracy {best['accuracy']:.4f}, "
+          f"{best['escalation_rate']:.1%} of images escalate to the full model")
+    print(f"✅ Saved to {cascade_config_path}. Restart the Flask app (or inference server) to use it.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+"""
+Confidence-gated model cascade.
+
+A small low-resolution model (train_model.py --arch fast) answers first. An
+image goes on to the full model only when the fast model's top probability is
+below `min_confidence` or its lead over the runner-up is below `min_margin`.
+Most clear photos never reach the full CNN.
+
+calibrate_cascade.py picks the thresholds on the validation split and stores
+them in cascade.json together with the full model version they were
+calibrated against. A cascade.json for a different model version is ignored.
+It also records a digest of the fast model file, and its uint8 export only if
+that export was checked against the fast model, so a fast model retrained
+after calibration is never served with the old thresholds or an old export.
+
+Trade-off: the Dense(512) embedding comes from the full model, so images the
+fast model answers alone have none. With the cascade enabled, /predict only
+returns similar cases and near-duplicate matches for escalated images, which
+leaves out most clear photos and so most resubmissions. /cascade reports the
+share of images that got an embedding (embedding_coverage); set CASCADE=0 to
+serve the full model only when duplicate detection matters more than speed.
+"""
+
+import hashlib
+import json
+import os
+import threading
+
+import numpy as np
+
+import model_manifest
+
+cascade_config_path = os.path.join(model_manifest.backend_dir, "cascade.json")
+default_fast_model_path = os.path.join(model_manifest.backend_dir, "plant_disease_model_fast.keras")
+
+
+def load_cascade_config(model_version):
+    """Calibrated cascade settings for the served model version, or None."""
+    if not os.path.exists(cascade_config_path):
+        return None
+    with open(cascade_config_path, 'r') as f:
+        config = json.load(f)
+    if config.get("model_version") != model_version:
+        print(f"⚠️  cascade.json was calibrated for model v{config.get('model_version')}, "
+              f"serving v{model_version}; cascade disabled until recalibrated")
+        return None
+    return config
+
+
+def file_digest(path):
+    """SHA-256 of a model file, to tell whether it changed since calibration."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def escalation_mask(probabilities, min_confidence, min_margin):
+    """True for every row the fast model is not sure enough about."""
+    top_two = np.sort(probabilities, axis=1)[:, -2:]
+    confidence = top_two[:, -1]
+    margin = confidence - top_two[:, 0]
+    return (confidence < min_confidence) | (margin < min_margin)
+
+
+class Cascade:
+    """Run the fast model on a batch and the full model on its uncertain rows."""
+
+    def __init__(self, fast_model, full_model, min_confidence, min_margin, full_has_embeddings=False):
+        """
+        full_model: the served model, or its embedding_model() (then set
+        full_has_embeddings, and it returns [embedding, probabilities])
+        """
+        self.fast_model = fast_model
+        self.full_model = full_model
+        self.min_confidence = min_confidence
+        self.min_margin = min_margin
+        self.full_has_embeddings = full_has_embeddings
+
+    @classmethod
+    def from_config(cls, config, full_model, full_has_embeddings=False):
+        """
+        Load the fast model named in a cascade.json, or the uint8 export recorded with it.
+
+        Raises ValueError if the fast model changed since it was calibrated.
+        """
+        from tensorflow import keras
+
+        fast_path = os.path.join(model_manifest.backend_dir, config["fast_model"])
+        if file_digest(fast_path) != config["fast_model_sha256"]:
+            raise ValueError(f"{config['fast_model']} changed since calibration; run calibrate_cascade.py again")
+        if config.get("fast_uint8_model"):
+            fast_path = os.path.join(model_manifest.backend_dir, config["fast_uint8_model"])
+        fast_model = keras.models.load_model(fast_path)
+        num_classes = full_model.outputs[-1].shape[-1]
+        if fast_model.outputs[-1].shape[-1] != num_classes:
+            raise ValueError(f"{config['fast_model']} predicts {fast_model.outputs[-1].shape[-1]} classes, "
+                             f"the served model {num_classes}")
+        return cls(fast_model, full_model, config["min_confidence"], config["min_margin"],
+                   full_has_embeddings)
+
+    def predict(self, batch):
+        """
+        Probabilities (N, classes), embeddings and the escalated mask (N,).
+
+        Embeddings come from the full model, so they are None when no row was
+        escalated and only rows where `escalated` is True hold real values.
+        """
+        probabilities = np.array(self.fast_model.predict_on_batch(batch), dtype=np.float32)
+        escalated = escalation_mask(probabilities, self.min_confidence, self.min_margin)
+        embeddings = None
+        if escalated.any():
+            outputs = self.full_model.predict_on_batch(batch[escalated])
+            if self.full_has_embeddings:
+                full_embeddings, full_probabilities = (np.asarray(o) for o in outputs)
+                embeddings = np.zeros((len(batch), full_embeddings.shape[1]), dtype=np.float32)
+                embeddings[escalated] = full_embeddings
+            else:
+                full_probabilities = np.asarray(outputs)
+            probabilities[escalated] = full_probabilities
+        return probabilities, embeddings, escalated
+
+
+class CascadeStats:
+    """Per-process counters of how much traffic escalates to the full model."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.images = 0
+        self.escalated = 0
+        self.embedded = 0
+
+    def record(self, escalated, has_embeddings=False):
+        """Count a batch; has_embeddings: the full model returned embeddings for its escalated rows."""
+        with self._lock:
+            self.images += len(escalated)
+            self.escalated += int(np.count_nonzero(escalated))
+            if has_embeddings:
+                self.embedded += int(np.count_nonzero(escalated))
+
+    def snapshot(self):
+        with self._lock:
+            images, escalated, embedded = self.images, self.escalated, self.embedded
+        return {
+            "images": images,
+            "escalated": escalated,
+            "answered_by_fast_model": images - escalated,
+            "escalation_rate": escalated / images if images else None,
+            # Only these images were checked for similar cases and near-duplicates
+            "images_with_embeddings": embedded,
+            "embedding_coverage": embedded / images if images else None,
+        }
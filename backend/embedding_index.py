@@ -0,0 +1,306 @@
+"""
+On-disk embedding index for similar-case lookup and near-duplicate detection.
+
+Embeddings are the penultimate Dense(512) activations of the served model,
+L2-normalised and stored as a float16 matrix that is memory-mapped from disk,
+so cosine similarity is a plain dot product. Rows are only ever appended.
+
+Files in the index directory:
+    index.json      dim, LSH bit count and seed
+    vectors.f16     float16 rows, `dim` values each
+    codes.u8        random-hyperplane LSH signature per row (`bits` / 8 bytes)
+    metadata.jsonl  one JSON object per row (predicted class, confidence, ...)
+    offsets.u64     end byte offset of every row's line in metadata.jsonl
+
+Metadata stays on disk as well: the offsets are memory-mapped and a search
+only reads the lines of its top-k rows, so opening an index and appending to
+it cost the same however many rows it holds.
+
+Embeddings from different models live in different spaces, so app.py keeps
+one index directory per model version (embedding_index/v<version>).
+
+Several web worker processes can share one index directory: appends take an
+exclusive lock on the directory (fcntl, where available) and every instance
+picks up rows appended by the others before its next search or append.
+
+Small collections are searched exactly. Above `exact_search_max_rows` rows the
+LSH signatures pick candidates by Hamming distance first, and only those rows
+are re-ranked with the float16 vectors.
+"""
+
+import json
+import os
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: single-process use only
+    fcntl = None
+
+# Number of rows converted to float32 at a time during exact search
+SEARCH_CHUNK_ROWS = 16384
+# Rows re-ranked exactly per requested neighbour in approximate search
+CANDIDATES_PER_NEIGHBOUR = 64
+MIN_CANDIDATES = 512
+
+# Popcount of every byte value, for numpy versions without np.bitwise_count
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def hamming_distances(codes, query_code):
+    """
+    Hamming distance from one packed signature to every row of `codes`.
+
+    codes: uint8 array (N, bytes); query_code: uint8 array (1, bytes).
+    Also used by audit_dataset.py for its 64-bit dHashes.
+    """
+    if hasattr(np, "bitwise_count") and codes.shape[1] % 8 == 0:
+        # 64 bits per popcount instead of a table lookup per byte
+        bits = np.bitwise_count(np.bitwise_xor(codes.view(np.uint64), query_code.view(np.uint64)))
+        distances = bits[:, 0].astype(np.uint16)
+        for column in range(1, bits.shape[1]):
+            distances += bits[:, column]
+        return distances
+    return _POPCOUNT[np.bitwise_xor(codes, query_code)].sum(axis=1, dtype=np.uint16)
+
+
+def _nearest_by_distance(distances, n, max_distance):
+    """
+    Row ids of (about) the `n` smallest small-integer distances.
+
+    Distances are bounded by the signature length, so a histogram finds the
+    cut-off in one pass, which is cheaper than argpartition on large arrays.
+    """
+    cumulative = np.cumsum(np.bincount(distances, minlength=max_distance + 1))
+    cutoff = int(np.searchsorted(cumulative, n))
+    below = np.flatnonzero(distances < cutoff)
+    ties = np.flatnonzero(distances == cutoff)[:max(n - len(below), 0)]
+    return np.sort(np.concatenate([below, ties]))
+
+
+def embedding_model(model):
+    """
+    Model returning (embedding, probabilities) in one forward pass, or None.
+
+    The embedding is the output of the activation that follows the first
+    hidden Dense layer (Dense(512) -> relu in the full-size train_model.py options).
+    Models without a hidden Dense layer have no embedding.
+    """
+    from tensorflow import keras
+
+    layers = model.layers
+    dense = [i for i, layer in enumerate(layers) if isinstance(layer, keras.layers.Dense)]
+    if len(dense) < 2:
+        return None
+    i = dense[0]
+    if i + 1 < len(layers) and isinstance(layers[i + 1], keras.layers.Activation):
+        i += 1
+    return keras.Model(model.inputs, [layers[i].output, model.output], name=f"{model.name}_embedding")
+
+
+class EmbeddingIndex:
+    """Append-only, memory-mapped float16 embedding store with top-k cosine search."""
+
+    def __init__(self, directory, dim=512, bits=128, seed=0, exact_search_max_rows=4096):
+        """
+        Open the index in `directory`, creating it if needed.
+
+        Raises ValueError if an existing index stores vectors of another `dim`.
+        """
+        self.directory = directory
+        self.exact_search_max_rows = exact_search_max_rows
+        os.makedirs(directory, exist_ok=True)
+
+        self._vectors_path = os.path.join(directory, "vectors.f16")
+        self._codes_path = os.path.join(directory, "codes.u8")
+        self._metadata_path = os.path.join(directory, "metadata.jsonl")
+        self._offsets_path = os.path.join(directory, "offsets.u64")
+        self._lock_path = os.path.join(directory, ".lock")
+        self._lock = threading.Lock()
+        with self._file_lock(exclusive=True):
+            config_path = os.path.join(directory, "index.json")
+            if os.path.exists(config_path):
+                with open(config_path, 'r') as f:
+                    config = json.load(f)
+                if config["dim"] != dim:
+                    raise ValueError(f"Embedding index in {directory} has dim {config['dim']}, expected {dim}")
+            else:
+                config = {"dim": dim, "bits": bits, "seed": seed}
+                with open(config_path, 'w') as f:
+                    json.dump(config, f, indent=2)
+            self.dim = config["dim"]
+            self.bits = config["bits"]
+            self.code_bytes = self.bits // 8
+            self._hyperplanes = np.random.default_rng(config["seed"]).standard_normal(
+                (self.dim, self.bits)
+            ).astype(np.float32)
+            self._load()
+
+    @contextmanager
+    def _file_lock(self, exclusive):
+        """Cross-process lock on the index directory (no-op without fcntl)."""
+        if fcntl is None:
+            yield
+            return
+        with open(self._lock_path, 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _load(self):
+        if not os.path.exists(self._offsets_path) and self._file_size(self._metadata_path):
+            self._build_offsets()
+
+        vector_rows = self._file_rows(self._vectors_path, self.dim * 2)
+        code_rows = self._file_rows(self._codes_path, self.code_bytes)
+        offset_rows = self._file_rows(self._offsets_path, 8)
+        # A crash mid-append can leave one file ahead of the others; drop the tail
+        # so the next append lines up again
+        count = min(vector_rows, code_rows, offset_rows)
+        for path, row_bytes, rows in ((self._vectors_path, self.dim * 2, vector_rows),
+                                      (self._codes_path, self.code_bytes, code_rows),
+                                      (self._offsets_path, 8, offset_rows)):
+            if rows > count:
+                os.truncate(path, count * row_bytes)
+        self._count = count
+        self._map()
+        metadata_bytes = int(self._offsets[-1]) if count else 0
+        if self._file_size(self._metadata_path) > metadata_bytes:
+            os.truncate(self._metadata_path, metadata_bytes)
+
+    def _build_offsets(self):
+        """Index the metadata lines of an index written before offsets.u64 existed."""
+        offsets = []
+        position = 0
+        with open(self._metadata_path, 'rb') as f:
+            for line in f:
+                position += len(line)
+                if line.strip():
+                    offsets.append(position)
+        np.asarray(offsets, dtype=np.uint64).tofile(self._offsets_path)
+
+    def _catch_up(self):
+        """Pick up rows appended by other processes. Needs both locks held."""
+        count = self._file_rows(self._offsets_path, 8)
+        if count == self._count:
+            return
+        self._count = count
+        self._map()
+
+    @staticmethod
+    def _file_size(path):
+        return os.path.getsize(path) if os.path.exists(path) else 0
+
+    @staticmethod
+    def _file_rows(path, row_bytes):
+        return os.path.getsize(path) // row_bytes if os.path.exists(path) else 0
+
+    @staticmethod
+    def _write_at(path, position, data):
+        """Write `data` at `position`, dropping whatever the file held from there on."""
+        with open(path, 'ab') as f:
+            f.truncate(position)
+            f.write(data)
+
+    def _map(self):
+        if self._count:
+            self._vectors = np.memmap(self._vectors_path, dtype=np.float16, mode='r',
+                                      shape=(self._count, self.dim))
+            self._codes = np.memmap(self._codes_path, dtype=np.uint8, mode='r',
+                                    shape=(self._count, self.code_bytes))
+            self._offsets = np.memmap(self._offsets_path, dtype=np.uint64, mode='r',
+                                      shape=(self._count,))
+        else:
+            self._vectors = np.zeros((0, self.dim), dtype=np.float16)
+            self._codes = np.zeros((0, self.code_bytes), dtype=np.uint8)
+            self._offsets = np.zeros(0, dtype=np.uint64)
+
+    def _read_metadata(self, rows, offsets):
+        """Metadata dicts of the given rows, read from their metadata.jsonl lines."""
+        entries = []
+        with open(self._metadata_path, 'rb') as f:
+            for row in rows:
+                start = int(offsets[row - 1]) if row else 0
+                f.seek(start)
+                entries.append(json.loads(f.read(int(offsets[row]) - start)))
+        return entries
+
+    def __len__(self):
+        return self._count
+
+    def _normalize(self, vectors):
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(-1, self.dim)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
+
+    def _signatures(self, normalized):
+        return np.packbits(normalized @ self._hyperplanes > 0, axis=1)
+
+    def append(self, vectors, metadata):
+        """Append embeddings with one metadata dict each; returns the new row ids."""
+        normalized = self._normalize(vectors)
+        if len(normalized) != len(metadata):
+            raise ValueError("Need exactly one metadata entry per vector")
+        codes = self._signatures(normalized)
+
+        lines = [(json.dumps(entry) + "\n").encode("utf-8") for entry in metadata]
+        with self._lock, self._file_lock(exclusive=True):
+            self._catch_up()
+            start = self._count
+            metadata_end = int(self._offsets[-1]) if start else 0
+            # Write right after the last complete row, over the tail of an append that crashed
+            self._write_at(self._vectors_path, start * self.dim * 2, normalized.astype(np.float16).tobytes())
+            self._write_at(self._codes_path, start * self.code_bytes, codes.tobytes())
+            self._write_at(self._metadata_path, metadata_end, b"".join(lines))
+            # Offsets last: they decide how many rows count as written on reload
+            offsets = metadata_end + np.cumsum([len(line) for line in lines], dtype=np.uint64)
+            self._write_at(self._offsets_path, start * 8, offsets.tobytes())
+            self._count += len(normalized)
+            self._map()
+        return list(range(start, start + len(normalized)))
+
+    def _exact_scores(self, vectors, query, rows=None):
+        if rows is not None:
+            return np.asarray(vectors[rows], dtype=np.float32) @ query
+        scores = np.empty(len(vectors), dtype=np.float32)
+        for start in range(0, len(vectors), SEARCH_CHUNK_ROWS):
+            chunk = np.asarray(vectors[start:start + SEARCH_CHUNK_ROWS], dtype=np.float32)
+            scores[start:start + len(chunk)] = chunk @ query
+        return scores
+
+    def search(self, vector, k=5):
+        """Top-k rows by cosine similarity: [{"id", "similarity", **metadata}, ...]."""
+        if self._file_rows(self._offsets_path, 8) != self._count:
+            with self._lock, self._file_lock(exclusive=False):
+                self._catch_up()
+        with self._lock:
+            vectors, codes, offsets, count = self._vectors, self._codes, self._offsets, self._count
+        if count == 0:
+            return []
+
+        query = self._normalize(vector)
+        k = min(k, count)
+
+        if count <= self.exact_search_max_rows:
+            rows = None
+            scores = self._exact_scores(vectors, query[0])
+        else:
+            # Hamming distance between LSH signatures approximates the angle
+            distances = hamming_distances(codes, self._signatures(query))
+            n_candidates = min(count, max(MIN_CANDIDATES, k * CANDIDATES_PER_NEIGHBOUR))
+            rows = _nearest_by_distance(distances, n_candidates, self.bits)
+            scores = self._exact_scores(vectors, query[0], rows)
+
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        ids = top if rows is None else rows[top]
+        metadata = self._read_metadata(ids, offsets)
+        return [
+            {"id": int(row), "similarity": float(score), **entry}
+            for row, score, entry in zip(ids, scores[top], metadata)
+        ]
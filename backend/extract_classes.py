@@ -4,13 +4,14 @@ This ensures predictions use the correct class labels.
 """
 
 import tensorflow as tf
-import json
 import os
 
+import model_manifest
+
 # Paths
 backend_dir = os.path.dirname(os.path.abspath(__file__))
 dataset_dir = os.path.join(backend_dir, "..", "splitted_dataset")
-model_path = os.path.join(backend_dir, "plant_disease_model.keras")
+model_path = model_manifest.model_file(model_manifest.load_manifest())
 class_names_path = os.path.join(backend_dir, "class_names.json")
 
 print("=" * 60)
@@ -29,16 +30,32 @@ train_ds = tf.keras.utils.image_dataset_from_directory(
 )
 
 class_names = train_ds.class_names
+
+# With a manifest, the served model's class list is authoritative: it includes
+# the classes incremental_train.py appended, in the model's output order. Only
+# publishing a model changes it, so dataset folders are just compared to it.
+if os.path.exists(model_manifest.manifest_path):
+    manifest = model_manifest.load_manifest()
+    served = manifest["class_names"]
+    missing = [name for name in served if name not in class_names]
+    new = [name for name in class_names if name not in served]
+    print(f"\n📌 Using the class list of model_manifest.json (v{manifest['version']})")
+    if missing:
+        print(f"⚠️  WARNING: {len(missing)} served classes have no folder in the dataset: {', '.join(missing)}")
+    if new:
+        print(f"⚠️  WARNING: {len(new)} dataset folders are not known to the served model: {', '.join(new)}")
+        print("   Add them with: python incremental_train.py")
+    class_names = served
+
 num_classes = len(class_names)
 
-print(f"\n✅ Found {num_classes} classes in dataset:")
+print(f"\n✅ {num_classes} classes:")
 for i, name in enumerate(class_names):
     print(f"   {i:2d}: {name}")
 
 # Save class names to JSON
 print(f"\n💾 Saving class names to {class_names_path}...")
-with open(class_names_path, 'w') as f:
-    json.dump(class_names, f, indent=2)
+model_manifest.write_json_atomic(class_names_path, class_names)
 print("✅ Class names saved!")
 
 # Verify model can be loaded
@@ -0,0 +1,85 @@
+"""
+Stand-ins for Keras models and psycopg2 connections in the tests, so no
+TensorFlow model is loaded and no PostgreSQL server is needed.
+"""
+
+import numpy as np
+
+
+class FirstPixelModel:
+    """
+    Answers each image with a fixed probability row chosen by its first pixel.
+
+    By default the rows are one-hot, so the predicted class is the first pixel
+    value modulo num_classes. Every batch is recorded in `batches` as the list
+    of first pixel values.
+    """
+
+    def __init__(self, num_classes=None, rows=None):
+        self.rows = np.eye(num_classes, dtype=np.float32) if rows is None else np.asarray(rows, dtype=np.float32)
+        self.batches = []
+
+    def predict_on_batch(self, batch):
+        ids = np.asarray(batch)[:, 0, 0, 0].astype(int)
+        self.batches.append(ids.tolist())
+        return self.rows[ids % len(self.rows)]
+
+    __call__ = predict_on_batch
+
+
+class FakeConnection:
+    """
+    Stands in for a psycopg2 connection.
+
+    Every executed statement is recorded in `statements` (whitespace
+    collapsed) and every COPY ... FROM STDIN in `copies` as (sql, data).
+    `respond(sql, params)` plays the database: it returns the rows the
+    statement yields (None for none) and may raise to fail the statement.
+    """
+
+    def __init__(self, respond=None):
+        self.respond = respond
+        self.statements = []
+        self.copies = []
+        self.commits = 0
+        self.rollbacks = 0
+        self.closed = False
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        self.rollbacks += 1
+
+    def close(self):
+        self.closed = True
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+        self.result = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def execute(self, sql, params=None):
+        sql = " ".join(sql.split())
+        self.conn.statements.append(sql)
+        rows = self.conn.respond(sql, params) if self.conn.respond is not None else None
+        self.result = rows or []
+
+    def copy_expert(self, sql, file):
+        self.conn.copies.append((" ".join(sql.split()), file.read()))
+
+    def fetchone(self):
+        return self.result[0]
+
+    def fetchall(self):
+        return self.result
@@ -0,0 +1,280 @@
+"""
+Add new disease classes to the served model without retraining the CNN.
+
+The conv backbone of the current model is frozen and run once over the
+dataset; its features are cached on disk, so later runs only featurize images
+they have not seen. Only a widened classification head is trained on the
+cached features: existing classes keep their output index and weights, and
+new class folders under splitted_dataset/train are appended at the end.
+
+Usage:
+    python incremental_train.py                    # train the final Dense layer only
+    python incremental_train.py --unfreeze-hidden  # also fine-tune Dense(512)
+"""
+
+import argparse
+import glob
+import hashlib
+import json
+import os
+import time
+
+import numpy as np
+import tensorflow as tf
+from tensorflow import keras
+from tensorflow.keras.callbacks import EarlyStopping
+
+import model_manifest
+from train_model import dataset_dir, IMG_SIZE
+
+feature_cache_dir = os.path.join(model_manifest.backend_dir, "feature_cache")
+
+# Configuration
+FEATURE_BATCH_SIZE = 32
+HEAD_BATCH_SIZE = 64
+HEAD_EPOCHS = 30
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".gif")
+
+
+def split_model(model):
+    """
+    Split a trained model into (backbone, hidden head layers, final Dense).
+
+    The backbone is everything before the first Dense layer (Flatten or
+    GlobalAveragePooling2D output); the final Dense is the classifier whose
+    output width is the number of classes.
+    """
+    layers = model.layers
+    dense_indices = [i for i, layer in enumerate(layers) if isinstance(layer, keras.layers.Dense)]
+    if not dense_indices:
+        raise ValueError("Model has no Dense classifier layer")
+    first_dense, last_dense = dense_indices[0], dense_indices[-1]
+
+    backbone = keras.Model(model.inputs, layers[first_dense - 1].output, name="backbone")
+    backbone.trainable = False
+    return backbone, layers[first_dense:last_dense], layers[last_dense]
+
+
+def backbone_fingerprint(backbone):
+    """Hash of the backbone weights; cached features are only valid for the same weights."""
+    digest = hashlib.sha1()
+    for weight in backbone.weights:
+        digest.update(np.ascontiguousarray(weight.numpy()).tobytes())
+    return digest.hexdigest()[:16]
+
+
+def list_images(split, class_names):
+    """(relative path, class name) pairs for every image of `class_names` in a split."""
+    split_dir = os.path.join(dataset_dir, split)
+    items = []
+    for name in class_names:
+        for path in sorted(glob.glob(os.path.join(split_dir, name, "*"))):
+            if path.lower().endswith(IMAGE_EXTENSIONS):
+                items.append((os.path.relpath(path, dataset_dir), name))
+    return items
+
+
+def _load_image(path):
+    # Same decode/resize as image_dataset_from_directory (bilinear, float32 0-255)
+    image = tf.io.decode_image(tf.io.read_file(path), channels=3, expand_animations=False)
+    return tf.image.resize(image, IMG_SIZE)
+
+
+class FeatureCache:
+    """
+    Backbone features stored as float16 chunks with a JSON index per chunk.
+
+    Each run appends one chunk holding only the images that were not cached
+    yet, so the expensive backbone pass happens once per image.
+    """
+
+    def __init__(self, fingerprint, split):
+        self.dir = os.path.join(feature_cache_dir, fingerprint, split)
+        os.makedirs(self.dir, exist_ok=True)
+
+    def _chunks(self):
+        return sorted(glob.glob(os.path.join(self.dir, "chunk_*.json")))
+
+    def cached_paths(self):
+        paths = set()
+        for index_path in self._chunks():
+            with open(index_path, 'r') as f:
+                paths.update(path for path, _ in json.load(f))
+        return paths
+
+    def append(self, backbone, items):
+        """Featurize `items` with the backbone and store them as a new chunk."""
+        if not items:
+            return
+        paths = [os.path.join(dataset_dir, path) for path, _ in items]
+        ds = (
+            tf.data.Dataset.from_tensor_slices(paths)
+            .map(_load_image, num_parallel_calls=tf.data.AUTOTUNE)
+            .batch(FEATURE_BATCH_SIZE)
+            .prefetch(tf.data.AUTOTUNE)
+        )
+        features = backbone.predict(ds, verbose=1)
+        features = features.reshape(len(items), -1).astype(np.float16)
+
+        chunk = os.path.join(self.dir, f"chunk_{len(self._chunks()):04d}")
+        np.save(f"{chunk}.npy", features)
+        # The index is written last, so a crash never leaves an indexed chunk without features
+        model_manifest.write_json_atomic(f"{chunk}.json", [list(item) for item in items])
+
+    def load(self, wanted):
+        """Features and class names for the cached images whose path is in `wanted`."""
+        features, labels = [], []
+        for index_path in self._chunks():
+            with open(index_path, 'r') as f:
+                index = json.load(f)
+            chunk = np.load(index_path[:-len(".json")] + ".npy", mmap_mode="r")
+            rows = [i for i, (path, _) in enumerate(index) if path in wanted]
+            if rows:
+                features.append(np.asarray(chunk[rows]))
+                labels.extend(index[i][1] for i in rows)
+        if not features:
+            return np.zeros((0, 0), dtype=np.float16), []
+        return np.concatenate(features), labels
+
+
+def cached_features(backbone, fingerprint, split, class_names):
+    """Features and labels for a split, featurizing only images not cached yet."""
+    items = list_images(split, class_names)
+    cache = FeatureCache(fingerprint, split)
+    cached = cache.cached_paths()
+    missing = [item for item in items if item[0] not in cached]
+    print(f"   {split}: {len(items)} images, {len(items) - len(missing)} cached, {len(missing)} to featurize")
+    cache.append(backbone, missing)
+    return cache.load({path for path, _ in items})
+
+
+def build_head(feature_dim, hidden_layers, old_classifier, num_classes, train_hidden):
+    """
+    Head on cached features: the existing hidden layers plus a widened classifier.
+
+    The first columns of the new classifier are copied from the old one, so
+    existing classes start from their trained weights.
+    """
+    for layer in hidden_layers:
+        layer.trainable = train_hidden
+
+    classifier = keras.layers.Dense(num_classes, name="classifier")
+    inputs = keras.Input(shape=(feature_dim,))
+    x = inputs
+    for layer in hidden_layers:
+        x = layer(x)
+    x = classifier(x)
+    outputs = keras.layers.Activation('softmax', dtype='float32')(x)
+
+    old_kernel, old_bias = old_classifier.get_weights()
+    kernel, bias = classifier.get_weights()
+    old_classes = old_kernel.shape[1]
+    kernel[:, :old_classes] = old_kernel
+    bias[:old_classes] = old_bias
+    classifier.set_weights([kernel, bias])
+
+    return keras.Model(inputs, outputs, name="head"), classifier
+
+
+def assemble_model(model, backbone_end, classifier):
+    """Full model: the original layers up to the classifier, then the widened classifier."""
+    inputs = keras.Input(shape=model.input_shape[1:], dtype=model.inputs[0].dtype)
+    x = inputs
+    for layer in model.layers[:backbone_end]:
+        if isinstance(layer, keras.layers.InputLayer):
+            continue
+        x = layer(x)
+    x = classifier(x)
+    outputs = keras.layers.Activation('softmax', dtype='float32')(x)
+    return keras.Model(inputs, outputs, name=model.name)
+
+
+def to_dataset(features, labels, class_names, shuffle):
+    index = {name: i for i, name in enumerate(class_names)}
+    y = keras.utils.to_categorical([index[name] for name in labels], len(class_names))
+    ds = tf.data.Dataset.from_tensor_slices((features.astype(np.float32), y))
+    if shuffle:
+        ds = ds.shuffle(len(labels))
+    return ds.batch(HEAD_BATCH_SIZE).prefetch(tf.data.AUTOTUNE)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Add new classes by training only the classification head")
+    parser.add_argument("--epochs", type=int, default=HEAD_EPOCHS)
+    parser.add_argument("--unfreeze-hidden", action="store_true",
+                        help="Also fine-tune the Dense(512) layer (changes the image embeddings)")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    print("=" * 60)
+    print("🌿 Incremental Plant Disease Model Training")
+    print("=" * 60)
+
+    manifest = model_manifest.load_manifest()
+    old_classes = manifest["class_names"]
+    print(f"\n📂 Loading model v{manifest['version']} ({manifest['model']})...")
+    model = keras.models.load_model(model_manifest.model_file(manifest))
+
+    train_dirs = sorted(
+        name for name in os.listdir(os.path.join(dataset_dir, "train"))
+        if os.path.isdir(os.path.join(dataset_dir, "train", name))
+    )
+    new_classes = [name for name in train_dirs if name not in old_classes]
+    class_names = old_classes + new_classes
+    if not new_classes:
+        print("\n✅ No new class folders found, nothing to do.")
+        return
+    print(f"\n🆕 New classes ({len(new_classes)}):")
+    for i, name in enumerate(new_classes, start=len(old_classes)):
+        print(f"  {i:2d}: {name}")
+
+    backbone, hidden_layers, old_classifier = split_model(model)
+    fingerprint = backbone_fingerprint(backbone)
+
+    print(f"\n🧊 Caching backbone features (cache {fingerprint})...")
+    train_x, train_labels = cached_features(backbone, fingerprint, "train", class_names)
+    val_x, val_labels = cached_features(backbone, fingerprint, "val", class_names)
+
+    head, classifier = build_head(train_x.shape[1], hidden_layers, old_classifier,
+                                  len(class_names), args.unfreeze_hidden)
+    head.compile(
+        loss='categorical_crossentropy',
+        optimizer=keras.optimizers.Adam(learning_rate=0.001),
+        metrics=['accuracy']
+    )
+
+    print("\n🚀 Training the classification head...")
+    head.fit(
+        to_dataset(train_x, train_labels, class_names, shuffle=True),
+        epochs=args.epochs,
+        validation_data=to_dataset(val_x, val_labels, class_names, shuffle=False),
+        callbacks=[EarlyStopping(monitor="val_loss", patience=3, restore_best_weights=True)],
+        verbose=1
+    )
+    val_loss, val_acc = head.evaluate(to_dataset(val_x, val_labels, class_names, shuffle=False), verbose=0)
+    print(f"   Validation Accuracy: {val_acc:.4f}")
+
+    backbone_end = model.layers.index(old_classifier)
+    new_model = assemble_model(model, backbone_end, classifier)
+
+    # Named plant_disease_model_v<version>.keras when published
+    output_path = model_manifest.staging_model_path()
+    print(f"\n💾 Saving model to {output_path}...")
+    new_model.save(output_path)
+
+    manifest = model_manifest.publish_staged(
+        output_path, class_names,
+        source="incremental_train",
+        parent_version=manifest["version"],
+        val_accuracy=round(float(val_acc), 4),
+    )
+    print(f"✅ Model v{manifest['version']} published with {len(class_names)} classes")
+    print(f"   Took {time.perf_counter() - start:.0f}s")
+
+    print("\n" + "=" * 60)
+    print("✨ Restart your Flask app to use the new model.")
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    main()
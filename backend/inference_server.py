@@ -0,0 +1,530 @@
+"""
+Local inference server: one model copy per node, shared by every web worker.
+
+The server process owns the model. Web workers attach to a block of shared
+memory split into fixed-size slots, each holding one 256x256x3 uint8 input
+and the float32 output row (probabilities, the Dense(512) embedding if the
+model has one, then 1.0 if the full model ran or 0.0 if the cascade's fast
+model answered alone). A client writes its tensor into a slot it owns and sends
+a one-byte request over a Unix socket; the server collects ready slots from
+all clients into one batch, runs the model, writes the outputs back into the
+slots and answers with one byte. The request byte marks interactive or
+background (bulk job) work, and waiting interactive requests always go into
+the next batch first. Tensors never go through pickle or the socket.
+If the model raises, the requests of that batch are answered with an error
+byte and the server keeps serving. Clients raise InferenceUnavailable while
+the server cannot be reached, so callers can retry instead of failing work.
+
+Each client connection owns exactly one slot, so no cross-process locking of
+the shared memory is needed: a worker that wants N requests in flight opens
+N connections.
+
+Usage:
+    python inference_server.py
+    INFERENCE_SERVER=/tmp/smart-leaf-inference.sock python app.py
+"""
+
+import json
+import os
+import signal
+import sys
+import threading
+import time
+import uuid
+from multiprocessing import shared_memory
+from multiprocessing.connection import Client, Listener, Pipe, wait
+from queue import Empty, Queue
+
+import numpy as np
+
+DEFAULT_ADDRESS = "/tmp/smart-leaf-inference.sock"
+DEFAULT_SHM_NAME = "smart_leaf_inference"
+IMAGE_SHAPE = (256, 256, 3)
+IMAGE_BYTES = int(np.prod(IMAGE_SHAPE))
+
+# Server configuration
+NUM_SLOTS = int(os.getenv('INFERENCE_SLOTS', '64'))
+MAX_BATCH = int(os.getenv('INFERENCE_MAX_BATCH', '16'))
+# Extra time to wait for more requests once one is ready, to fill a batch
+BATCH_WAIT_SECONDS = float(os.getenv('INFERENCE_BATCH_WAIT_MS', '2')) / 1000
+
+INTERACTIVE = b"i"
+BACKGROUND = b"b"
+DONE = b"d"
+ERROR = b"e"  # the model raised; the slot holds no output
+
+
+def slot_layout(output_dim):
+    """Bytes per slot: the uint8 image, then `output_dim` float32 values (8-byte aligned)."""
+    input_bytes = (IMAGE_BYTES + 7) // 8 * 8
+    return input_bytes, input_bytes + output_dim * 4
+
+
+def slot_views(buffer, index, output_dim):
+    """(image, output) numpy views of one slot; no copies."""
+    input_bytes, slot_bytes = slot_layout(output_dim)
+    offset = index * slot_bytes
+    image = np.ndarray(IMAGE_SHAPE, dtype=np.uint8, buffer=buffer, offset=offset)
+    output = np.ndarray((output_dim,), dtype=np.float32, buffer=buffer, offset=offset + input_bytes)
+    return image, output
+
+
+def attach_shared_memory(name):
+    """
+    Attach to the server's shared memory without taking ownership of it.
+
+    Before Python 3.13 attaching registers the block with the resource
+    tracker, which would unlink it when this worker exits (bpo-38119), so the
+    registration is skipped. (Unregistering afterwards is not enough: a tracker
+    shared with the server process would forget the server's own registration.)
+    """
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        from multiprocessing import resource_tracker
+        register = resource_tracker.register
+        resource_tracker.register = lambda name, rtype: None
+        try:
+            return shared_memory.SharedMemory(name=name)
+        finally:
+            resource_tracker.register = register
+
+
+class InferenceServer:
+    """Own the model and serve batched inference to clients through shared memory."""
+
+    def __init__(self, model, class_names, model_version, embed_model=None, cascade=None,
+                 address=DEFAULT_ADDRESS, shm_name=DEFAULT_SHM_NAME, num_slots=NUM_SLOTS):
+        """cascade: optional cascade.Cascade whose full model is `embed_model` or `model`"""
+        self.model = embed_model if embed_model is not None else model
+        self.has_embeddings = embed_model is not None
+        self.cascade = cascade
+        self.num_classes = len(class_names)
+        self.embed_dim = int(embed_model.outputs[0].shape[-1]) if embed_model is not None else 0
+        self.output_dim = self.num_classes + self.embed_dim + 1
+        self.handshake = {
+            # Tells clients a restarted server apart from the one they attached to
+            "instance": uuid.uuid4().hex,
+            "shm": shm_name,
+            "num_classes": self.num_classes,
+            "embed_dim": self.embed_dim,
+            "class_names": list(class_names),
+            "model_version": model_version,
+            "cascade": {
+                "min_confidence": cascade.min_confidence,
+                "min_margin": cascade.min_margin,
+            } if cascade is not None else None,
+        }
+
+        _, slot_bytes = slot_layout(self.output_dim)
+        try:
+            self.shm = shared_memory.SharedMemory(name=shm_name, create=True, size=slot_bytes * num_slots)
+        except FileExistsError:
+            # Left behind by a server that did not shut down cleanly
+            stale = shared_memory.SharedMemory(name=shm_name)
+            stale.close()
+            stale.unlink()
+            self.shm = shared_memory.SharedMemory(name=shm_name, create=True, size=slot_bytes * num_slots)
+        self.slots = [slot_views(self.shm.buf, i, self.output_dim) for i in range(num_slots)]
+        self.free_slots = list(range(num_slots))
+        self.batch = np.empty((MAX_BATCH,) + IMAGE_SHAPE, dtype=np.uint8)
+
+        if os.path.exists(address):
+            os.unlink(address)
+        self.address = address
+        self.listener = Listener(address, family="AF_UNIX")
+        self.connections = {}  # connection -> slot index
+        self.lock = threading.Lock()
+        self.wake_reader, self.wake_writer = Pipe(duplex=False)
+
+    def _accept(self):
+        """Accept clients, give each a free slot and wake the serving loop."""
+        while True:
+            conn = self.listener.accept()
+            with self.lock:
+                if not self.free_slots:
+                    conn.send_bytes(json.dumps({"error": "no free inference slots"}).encode())
+                    conn.close()
+                    continue
+                slot = self.free_slots.pop()
+                self.connections[conn] = slot
+            conn.send_bytes(json.dumps({**self.handshake, "slot": slot}).encode())
+            self.wake_writer.send_bytes(b"w")
+
+    def _drop(self, conn):
+        with self.lock:
+            self.free_slots.append(self.connections.pop(conn))
+        conn.close()
+
+    def _ready_requests(self, timeout, waiting=()):
+        """(connection, request byte) for every new request; `waiting` ones are skipped."""
+        with self.lock:
+            conns = [conn for conn in self.connections if conn not in waiting]
+        ready = []
+        for conn in wait(conns + [self.wake_reader], timeout):
+            if conn is self.wake_reader:
+                conn.recv_bytes()
+                continue
+            try:
+                ready.append((conn, conn.recv_bytes()))
+            except (EOFError, OSError):
+                self._drop(conn)
+        return ready
+
+    def _run_batch(self, conns):
+        with self.lock:
+            slots = [self.connections[conn] for conn in conns]
+        n = len(slots)
+        for i, slot in enumerate(slots):
+            self.batch[i] = self.slots[slot][0]
+
+        try:
+            escalated = np.ones(n, dtype=bool)
+            if self.cascade is not None:
+                probabilities, embeddings, escalated = self.cascade.predict(self.batch[:n])
+            else:
+                outputs = self.model.predict_on_batch(self.batch[:n])
+                if self.has_embeddings:
+                    embeddings, probabilities = (np.asarray(o) for o in outputs)
+                else:
+                    probabilities, embeddings = np.asarray(outputs), None
+
+            for i, slot in enumerate(slots):
+                output = self.slots[slot][1]
+                output[:self.num_classes] = probabilities[i]
+                if embeddings is not None:
+                    output[self.num_classes:-1] = embeddings[i]
+                output[-1] = escalated[i]
+        except Exception as e:
+            print(f"❌ Inference batch of {n} failed: {e}")
+            self._reply(conns, ERROR)
+            return
+        self._reply(conns, DONE)
+
+    def _reply(self, conns, message):
+        for conn in conns:
+            try:
+                conn.send_bytes(message)
+            except OSError:
+                self._drop(conn)
+
+    def serve_forever(self):
+        threading.Thread(target=self._accept, name="inference-accept", daemon=True).start()
+        print(f"✅ Inference server listening on {self.address} "
+              f"({len(self.slots)} slots, batches up to {MAX_BATCH})")
+        waiting = []
+        while True:
+            ready = self._ready_requests(0 if waiting else None, {conn for conn, _ in waiting})
+            if ready and len(waiting) + len(ready) < MAX_BATCH and BATCH_WAIT_SECONDS:
+                ready += self._ready_requests(BATCH_WAIT_SECONDS, {conn for conn, _ in waiting + ready})
+            # Stable sort: interactive requests first, each kind in arrival order.
+            # New requests are collected again before every batch, so background
+            # work delays an interactive request by at most one batch.
+            waiting = sorted(waiting + ready, key=lambda request: request[1] != INTERACTIVE)
+            if not waiting:
+                continue
+            batch, waiting = waiting[:MAX_BATCH], waiting[MAX_BATCH:]
+            self._run_batch([conn for conn, _ in batch])
+
+    def close(self):
+        self.listener.close()
+        # Release the numpy views first; SharedMemory.close() refuses while they exist
+        self.slots = None
+        self.shm.close()
+        self.shm.unlink()
+
+
+class InferenceUnavailable(RuntimeError):
+    """The inference server is not reachable or lost the connection; the request can be retried."""
+
+
+class _Slot:
+    def __init__(self, conn, generation, image, output):
+        self.conn = conn
+        self.generation = generation  # the server connection this slot belongs to
+        self.image = image
+        self.output = output
+
+
+class InferenceClient:
+    """
+    Client side used by web workers; safe to share between request threads.
+
+    The client connects on connect() or on its first request, so a worker
+    started before the server (still loading its model) keeps trying instead
+    of failing for good. When a connection fails, every pooled connection is
+    dropped and the next request reconnects: a restarted server has a new
+    shared memory block (under the same name) that must be attached again.
+    The restarted server must serve the same model as the first handshake,
+    because callers keep class_names and the output layout; otherwise
+    requests are refused.
+    """
+
+    MODEL_KEYS = ("class_names", "model_version", "num_classes", "embed_dim")
+
+    def __init__(self, address=DEFAULT_ADDRESS, max_slots=4):
+        self.address = address
+        self.max_slots = max_slots
+        self._free = Queue()
+        self._opened = 0
+        self._lock = threading.Lock()
+        # Signalled (with _lock held) whenever a slot is freed or closed, so
+        # threads waiting in _acquire() take it or open a fresh one
+        self._slot_freed = threading.Condition(self._lock)
+        self._generation = 0
+        self._instance = None
+        self._shm = None
+        self._model = None
+
+    @property
+    def connected(self):
+        """True once a handshake described the served model (class_names, version, output layout)."""
+        return self._model is not None
+
+    def connect(self, timeout=0):
+        """
+        Make the first handshake unless that already happened.
+
+        While the server does not accept connections yet, retries with backoff
+        for up to `timeout` seconds, then raises the connection error.
+        """
+        deadline = time.monotonic() + timeout
+        delay = 0.1
+        while not self.connected:
+            with self._lock:
+                self._opened += 1
+            try:
+                slot = self._open_slot()
+            except OSError:
+                if time.monotonic() + delay > deadline:
+                    raise
+                time.sleep(delay)
+                delay = min(delay * 2, 2.0)
+            else:
+                self._release(slot)
+
+    def _use_handshake(self, info):
+        """Take the model description from the first handshake; later ones must match it."""
+        model = {key: info[key] for key in self.MODEL_KEYS}
+        if self._model is None:
+            self._model = model
+            self.class_names = model["class_names"]
+            self.model_version = model["model_version"]
+            self.num_classes = model["num_classes"]
+            self.embed_dim = model["embed_dim"]
+        elif model != self._model:
+            raise RuntimeError(
+                f"Inference server now serves model v{model['model_version']} with "
+                f"{model['num_classes']} classes, this worker started with v{self.model_version}; "
+                f"restart the worker to use it"
+            )
+        self.cascade = info["cascade"]
+
+    def _open_slot(self):
+        """Open one connection (and so one slot); the caller has counted it in _opened."""
+        try:
+            conn = Client(self.address, family="AF_UNIX")
+            info = json.loads(conn.recv_bytes())
+        except Exception:
+            with self._lock:
+                self._closed(1)
+            raise
+        stale = []
+        with self._lock:
+            try:
+                if "error" in info:
+                    raise RuntimeError(f"Inference server refused connection: {info['error']}")
+                if info["instance"] != self._instance:
+                    # First connection to this server process
+                    if self._instance is not None:
+                        stale = self._new_generation()
+                    self._use_handshake(info)
+                    self._shm = attach_shared_memory(info["shm"])
+                    self._instance = info["instance"]
+            except Exception:
+                conn.close()
+                self._closed(1)
+                raise
+            finally:
+                for slot in stale:
+                    slot.conn.close()
+            image, output = slot_views(self._shm.buf, info["slot"], self.num_classes + self.embed_dim + 1)
+            return _Slot(conn, self._generation, image, output)
+
+    def _closed(self, count):
+        """Forget `count` closed slots (with _lock held) and wake threads waiting for one."""
+        self._opened -= count
+        self._slot_freed.notify_all()
+
+    def _acquire(self, block):
+        """
+        A pooled slot, else a new one while fewer than max_slots are open.
+
+        Otherwise waits until a slot is released or closed (the server went
+        away), or returns None if not `block`.
+        """
+        with self._lock:
+            while True:
+                try:
+                    return self._free.get_nowait()
+                except Empty:
+                    pass
+                if self._opened < self.max_slots:
+                    self._opened += 1
+                    break
+                if not block:
+                    return None
+                self._slot_freed.wait()
+        return self._open_slot()
+
+    def _release(self, slot):
+        with self._lock:
+            current = slot.generation == self._generation
+            if current:
+                self._free.put(slot)
+                self._slot_freed.notify()
+            else:
+                self._closed(1)
+        if not current:
+            slot.conn.close()
+
+    def _new_generation(self):
+        """
+        Forget the current server (with _lock held); returns its pooled slots to close.
+
+        Its slots still in use by other threads are closed when they fail or
+        are released. Their views keep the old shared memory mapped until then.
+        """
+        self._generation += 1
+        self._instance = None
+        self._shm = None
+        stale = []
+        while True:
+            try:
+                stale.append(self._free.get_nowait())
+            except Empty:
+                break
+        self._closed(len(stale))
+        return stale
+
+    def _reset(self, failed):
+        """Close the failed slots and, unless that already happened, every pooled slot of their server."""
+        with self._lock:
+            self._closed(len(failed))
+            current = any(slot.generation == self._generation for slot in failed)
+            stale = self._new_generation() if current else []
+        for slot in failed + stale:
+            slot.conn.close()
+
+    def predict(self, batch, interactive=True):
+        """
+        Probabilities (N, classes), embeddings (N, dim) or None, and the
+        cascade's escalation mask (N,) or None for a uint8 batch.
+
+        interactive=False marks bulk work, which the server batches only
+        after every waiting interactive request. Raises InferenceUnavailable
+        if the server is unreachable or lost the connection, and RuntimeError
+        if its model failed.
+        """
+        try:
+            self.connect()
+        except OSError as e:
+            raise InferenceUnavailable(f"Inference server at {self.address} is not reachable: {e}")
+        request = INTERACTIVE if interactive else BACKGROUND
+        n = len(batch)
+        probabilities = np.empty((n, self.num_classes), dtype=np.float32)
+        embeddings = np.empty((n, self.embed_dim), dtype=np.float32) if self.embed_dim else None
+        escalated = np.empty(n, dtype=bool)
+
+        start = 0
+        while start < n:
+            slots = []
+            failed = False
+            try:
+                # Opening a slot fails too once the server is gone
+                slots.append(self._acquire(block=True))
+                while len(slots) < n - start:
+                    slot = self._acquire(block=False)
+                    if slot is None:
+                        break
+                    slots.append(slot)
+                for slot, image in zip(slots, batch[start:]):
+                    slot.image[...] = image
+                    slot.conn.send_bytes(request)
+                for i, slot in enumerate(slots):
+                    if slot.conn.recv_bytes() == ERROR:
+                        failed = True
+                        continue
+                    probabilities[start + i] = slot.output[:self.num_classes]
+                    if embeddings is not None:
+                        embeddings[start + i] = slot.output[self.num_classes:-1]
+                    escalated[start + i] = slot.output[-1] > 0.5
+            except (EOFError, OSError) as e:
+                # Server went away; the next request reconnects
+                self._reset(slots)
+                raise InferenceUnavailable(f"Lost connection to the inference server at {self.address}: {e}")
+            except RuntimeError:
+                # A slot was refused (e.g. the restarted server serves another model)
+                for slot in slots:
+                    self._release(slot)
+                raise
+            for slot in slots:
+                self._release(slot)
+            if failed:
+                raise RuntimeError("The inference server failed to run the model, see its log")
+            start += len(slots)
+        return probabilities, embeddings, escalated if self.cascade is not None else None
+
+
+def main():
+    import tensorflow as tf
+    from tensorflow import keras
+
+    import model_manifest
+    from cascade import Cascade, load_cascade_config
+    from embedding_index import embedding_model
+
+    tf.get_logger().setLevel("ERROR")
+    manifest = model_manifest.load_manifest()
+    model = None
+    uint8_path = model_manifest.uint8_model_file(manifest)
+    if uint8_path:
+        print(f"📂 Loading model v{manifest['version']} from {uint8_path}...")
+        try:
+            model = keras.models.load_model(uint8_path)
+        except Exception as e:
+            print(f"⚠️  Error loading the uint8-input model, using the float32 model instead: {e}")
+    if model is None:
+        model_path = model_manifest.model_file(manifest)
+        print(f"📂 Loading model v{manifest['version']} from {model_path}...")
+        model = keras.models.load_model(model_path)
+    embed_model = embedding_model(model)
+
+    cascade = None
+    cascade_config = load_cascade_config(manifest["version"]) if os.getenv('CASCADE', '1') != '0' else None
+    if cascade_config is not None:
+        try:
+            cascade = Cascade.from_config(cascade_config, embed_model or model,
+                                          full_has_embeddings=embed_model is not None)
+            print(f"✅ Cascade enabled: {cascade_config['fast_model']} first")
+        except Exception as e:
+            print(f"⚠️  Could not load the fast cascade model, serving the full model only: {e}")
+
+    server = InferenceServer(
+        model, manifest["class_names"], manifest["version"],
+        embed_model=embed_model, cascade=cascade,
+        address=os.getenv('INFERENCE_SERVER', DEFAULT_ADDRESS),
+        shm_name=os.getenv('INFERENCE_SHM_NAME', DEFAULT_SHM_NAME),
+    )
+    # SIGTERM exits through the finally below, so the shared memory is unlinked
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+
+
+if __name__ == "__main__":
+    main()
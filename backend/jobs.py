@@ -0,0 +1,377 @@
+"""
+Asynchronous bulk inference jobs backed by a local SQLite work queue.
+
+A job is a set of preprocessed 256x256x3 uint8 images stored in jobs.db.
+Worker threads claim pending images across all jobs (highest priority first,
+then oldest) and run them through the model in batches. Progress and results
+are persisted, so a restart resumes unfinished jobs where they stopped.
+
+Several processes (one JobManager per web worker) can share jobs.db. Every
+claimed batch gets its own claim id and a lease; images whose lease ran out,
+e.g. because their process died, go back to the queue. A result is only
+stored by the claim that still holds the image, so a batch that outlived its
+lease never counts an image twice.
+
+While the inference server is unavailable (predict_fn raises
+InferenceUnavailable), a worker puts its claimed images back into the queue
+and backs off; only a model failure marks images as errors.
+
+Interactive /predict traffic goes through InferenceGate.interactive(); workers
+call wait_idle() before every batch, so bulk jobs only use the model while no
+interactive request is in flight.
+"""
+
+import json
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import closing, contextmanager
+
+import numpy as np
+
+from inference_server import InferenceUnavailable
+
+IMAGE_SHAPE = (256, 256, 3)
+TERMINAL_STATUSES = ("done", "cancelled")
+# Longest wait between retries while the inference server is unavailable
+MAX_BACKOFF_SECONDS = 10
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    user_id INTEGER,
+    priority INTEGER NOT NULL,
+    status TEXT NOT NULL,              -- queued, running, done, cancelled
+    total INTEGER NOT NULL,
+    completed INTEGER NOT NULL DEFAULT 0,
+    failed INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    finished_at REAL
+);
+CREATE TABLE IF NOT EXISTS job_items (
+    job_id TEXT NOT NULL,
+    idx INTEGER NOT NULL,
+    filename TEXT,
+    status TEXT NOT NULL,              -- pending, running, done, error, cancelled
+    priority INTEGER NOT NULL,         -- copied from the job for the claim index
+    created_at REAL NOT NULL,
+    image BLOB,                        -- cleared once the item is finished
+    result TEXT,
+    error TEXT,
+    claimed_by TEXT,                   -- claim id of the batch running the item
+    lease_expires REAL,                -- after this time the claim is considered dead
+    PRIMARY KEY (job_id, idx)
+);
+CREATE INDEX IF NOT EXISTS idx_job_items_claim
+    ON job_items (status, priority DESC, created_at, job_id, idx);
+"""
+# Added to job_items after the first release; older jobs.db files get them on startup
+LEASE_COLUMNS = (("claimed_by", "TEXT"), ("lease_expires", "REAL"))
+
+
+class InferenceGate:
+    """Give interactive requests priority over bulk job batches."""
+
+    def __init__(self):
+        self._active = 0
+        self._idle = threading.Condition()
+
+    @contextmanager
+    def interactive(self):
+        with self._idle:
+            self._active += 1
+        try:
+            yield
+        finally:
+            with self._idle:
+                self._active -= 1
+                if self._active == 0:
+                    self._idle.notify_all()
+
+    def wait_idle(self):
+        """Block while any interactive request is running."""
+        with self._idle:
+            self._idle.wait_for(lambda: self._active == 0)
+
+
+class JobManager:
+    """SQLite-backed job queue with a pool of batching inference workers."""
+
+    def __init__(self, db_path, predict_fn, summarize_fn, gate, workers=2, batch_size=16,
+                 on_result=None, poll_interval=0.5, lease_seconds=300):
+        """
+        predict_fn: uint8 batch (N, 256, 256, 3) -> probabilities (N, classes)
+        summarize_fn: probabilities row -> JSON-serialisable result dict
+        on_result: optional callback(user_id, result) for every finished image
+        lease_seconds: how long a claimed batch may run before other workers
+            treat its process as dead and claim the images again
+        """
+        self.db_path = db_path
+        self.predict_fn = predict_fn
+        self.summarize_fn = summarize_fn
+        self.gate = gate
+        self.batch_size = batch_size
+        self.on_result = on_result
+        self.poll_interval = poll_interval
+        self.lease_seconds = lease_seconds
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+
+        with closing(self._connect()) as conn:
+            conn.executescript(SCHEMA)
+            conn.execute("BEGIN IMMEDIATE")
+            columns = {row["name"] for row in conn.execute("PRAGMA table_info(job_items)")}
+            for name, sql_type in LEASE_COLUMNS:
+                if name not in columns:
+                    conn.execute(f"ALTER TABLE job_items ADD COLUMN {name} {sql_type}")
+            conn.execute("COMMIT")
+
+        self._workers = [
+            threading.Thread(target=self._work, name=f"job-worker-{i}", daemon=True)
+            for i in range(workers)
+        ]
+        for worker in self._workers:
+            worker.start()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA synchronous = NORMAL")
+        return conn
+
+    # Job API -------------------------------------------------------------
+
+    def submit(self, images, filenames, priority=0, user_id=None, errors=None):
+        """
+        Store a new job and return its id.
+
+        images: list of uint8 arrays of IMAGE_SHAPE, or None for an image that
+        failed to decode (its message is taken from `errors` at the same index).
+        """
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        errors = errors or [None] * len(images)
+        items = [
+            (job_id, idx, filename,
+             "pending" if image is not None else "error",
+             priority, now,
+             np.ascontiguousarray(image, dtype=np.uint8).tobytes() if image is not None else None,
+             error)
+            for idx, (image, filename, error) in enumerate(zip(images, filenames, errors))
+        ]
+        failed = sum(1 for image in images if image is None)
+
+        with closing(self._connect()) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute(
+                "INSERT INTO jobs (id, user_id, priority, status, total, failed, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (job_id, user_id, priority, "queued", len(images), failed, now)
+            )
+            conn.executemany(
+                "INSERT INTO job_items (job_id, idx, filename, status, priority, created_at, image, error) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                items
+            )
+            self._finish_if_complete(conn, job_id)
+            conn.execute("COMMIT")
+        self._wakeup.set()
+        return job_id
+
+    def status(self, job_id):
+        """Job progress as a dict, or None for an unknown id."""
+        with closing(self._connect()) as conn:
+            row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        job["progress"] = (job["completed"] + job["failed"]) / job["total"] if job["total"] else 1.0
+        return job
+
+    def results(self, job_id, offset=0, limit=100):
+        """Per-image results of a job, in upload order."""
+        with closing(self._connect()) as conn:
+            rows = conn.execute(
+                "SELECT idx, filename, status, result, error FROM job_items "
+                "WHERE job_id = ? ORDER BY idx LIMIT ? OFFSET ?",
+                (job_id, limit, offset)
+            ).fetchall()
+        return [
+            {
+                "index": row["idx"],
+                "filename": row["filename"],
+                "status": row["status"],
+                "result": json.loads(row["result"]) if row["result"] else None,
+                "error": row["error"],
+            }
+            for row in rows
+        ]
+
+    def cancel(self, job_id):
+        """Cancel a job; images already being inferred still finish. Returns False if unknown."""
+        with closing(self._connect()) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            cursor = conn.execute(
+                "UPDATE jobs SET status = 'cancelled', finished_at = ? "
+                "WHERE id = ? AND status NOT IN ('done', 'cancelled')",
+                (time.time(), job_id)
+            )
+            if cursor.rowcount:
+                conn.execute(
+                    "UPDATE job_items SET status = 'cancelled', image = NULL "
+                    "WHERE job_id = ? AND status = 'pending'",
+                    (job_id,)
+                )
+            exists = conn.execute("SELECT 1 FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            conn.execute("COMMIT")
+        return exists is not None
+
+    def close(self):
+        self._stopping.set()
+        self._wakeup.set()
+        for worker in self._workers:
+            worker.join(timeout=10)
+
+    # Workers -------------------------------------------------------------
+
+    def _claim(self, conn):
+        """
+        Atomically mark the next batch of pending images (across jobs) as running.
+
+        Returns the claim id and the claimed rows. Images whose lease expired
+        are returned to the queue first, or marked cancelled if their job was
+        cancelled meanwhile; running rows without a lease were claimed by a
+        version without leases and are treated as expired.
+        """
+        now = time.time()
+        claim_id = uuid.uuid4().hex
+        conn.execute("BEGIN IMMEDIATE")
+        conn.execute(
+            "UPDATE job_items SET status = 'cancelled', image = NULL, claimed_by = NULL, lease_expires = NULL "
+            "WHERE status = 'running' AND (lease_expires IS NULL OR lease_expires < ?) "
+            "AND job_id IN (SELECT id FROM jobs WHERE status = 'cancelled')",
+            (now,)
+        )
+        conn.execute(
+            "UPDATE job_items SET status = 'pending', claimed_by = NULL, lease_expires = NULL "
+            "WHERE status = 'running' AND (lease_expires IS NULL OR lease_expires < ?)",
+            (now,)
+        )
+        rows = conn.execute(
+            "SELECT job_id, idx, image FROM job_items WHERE status = 'pending' "
+            "ORDER BY priority DESC, created_at, job_id, idx LIMIT ?",
+            (self.batch_size,)
+        ).fetchall()
+        conn.executemany(
+            "UPDATE job_items SET status = 'running', claimed_by = ?, lease_expires = ? "
+            "WHERE job_id = ? AND idx = ?",
+            [(claim_id, now + self.lease_seconds, row["job_id"], row["idx"]) for row in rows]
+        )
+        conn.executemany(
+            "UPDATE jobs SET status = 'running' WHERE id = ? AND status = 'queued'",
+            {(row["job_id"],) for row in rows}
+        )
+        conn.execute("COMMIT")
+        return claim_id, rows
+
+    def _finish_if_complete(self, conn, job_id):
+        conn.execute(
+            "UPDATE jobs SET status = 'done', finished_at = ? "
+            "WHERE id = ? AND status IN ('queued', 'running') AND completed + failed >= total",
+            (time.time(), job_id)
+        )
+
+    def _unclaim(self, conn, claim_id, rows):
+        """Put the images this claim still holds back into the queue, unless their job was cancelled."""
+        params = [(row["job_id"], row["idx"], claim_id) for row in rows]
+        conn.execute("BEGIN IMMEDIATE")
+        conn.executemany(
+            "UPDATE job_items SET status = 'cancelled', image = NULL, claimed_by = NULL, lease_expires = NULL "
+            "WHERE job_id = ? AND idx = ? AND status = 'running' AND claimed_by = ? "
+            "AND job_id IN (SELECT id FROM jobs WHERE status = 'cancelled')",
+            params
+        )
+        conn.executemany(
+            "UPDATE job_items SET status = 'pending', claimed_by = NULL, lease_expires = NULL "
+            "WHERE job_id = ? AND idx = ? AND status = 'running' AND claimed_by = ?",
+            params
+        )
+        conn.execute("COMMIT")
+
+    def _work(self):
+        conn = self._connect()
+        backoff = self.poll_interval
+        while not self._stopping.is_set():
+            try:
+                self._work_once(conn)
+                backoff = self.poll_interval
+            except InferenceUnavailable as e:
+                print(f"⚠️  {e}; retrying job batch in {backoff:.1f}s")
+                self._stopping.wait(backoff)
+                backoff = min(backoff * 2, MAX_BACKOFF_SECONDS)
+            except sqlite3.Error as e:
+                print(f"❌ Job queue error: {e}")
+                if conn.in_transaction:
+                    conn.execute("ROLLBACK")
+                time.sleep(self.poll_interval)
+        conn.close()
+
+    def _work_once(self, conn):
+        self.gate.wait_idle()
+        claim_id, rows = self._claim(conn)
+        if not rows:
+            self._wakeup.wait(self.poll_interval)
+            self._wakeup.clear()
+            return
+
+        batch = np.stack([
+            np.frombuffer(row["image"], dtype=np.uint8).reshape(IMAGE_SHAPE) for row in rows
+        ])
+        try:
+            probabilities = self.predict_fn(batch)
+            outcomes = [("done", self.summarize_fn(p), None) for p in probabilities]
+        except InferenceUnavailable:
+            self._unclaim(conn, claim_id, rows)
+            raise
+        except Exception as e:
+            print(f"❌ Job batch failed: {e}")
+            outcomes = [("error", None, str(e))] * len(rows)
+        self._store(conn, claim_id, rows, outcomes)
+
+    def _store(self, conn, claim_id, rows, outcomes):
+        """Store outcomes for the images this claim still holds; others were re-claimed."""
+        conn.execute("BEGIN IMMEDIATE")
+        stored = []
+        for row, outcome in zip(rows, outcomes):
+            status, result, error = outcome
+            cursor = conn.execute(
+                "UPDATE job_items SET status = ?, result = ?, error = ?, image = NULL, "
+                "claimed_by = NULL, lease_expires = NULL "
+                "WHERE job_id = ? AND idx = ? AND status = 'running' AND claimed_by = ?",
+                (status, json.dumps(result) if result else None, error, row["job_id"], row["idx"], claim_id)
+            )
+            if not cursor.rowcount:
+                continue
+            stored.append((row, outcome))
+            column = "completed" if status == "done" else "failed"
+            conn.execute(f"UPDATE jobs SET {column} = {column} + 1 WHERE id = ?", (row["job_id"],))
+        if len(stored) < len(rows):
+            print(f"⚠️  Job batch outlived its lease; {len(rows) - len(stored)} images were re-claimed")
+        if not stored:
+            conn.execute("COMMIT")
+            return
+        job_ids = {row["job_id"] for row, _ in stored}
+        for job_id in job_ids:
+            self._finish_if_complete(conn, job_id)
+        users = dict(conn.execute(
+            f"SELECT id, user_id FROM jobs WHERE id IN ({','.join('?' * len(job_ids))})",
+            tuple(job_ids)
+        ).fetchall())
+        conn.execute("COMMIT")
+
+        if self.on_result is not None:
+            for row, (status, result, _) in stored:
+                if status == "done" and users.get(row["job_id"]) is not None:
+                    self.on_result(users[row["job_id"]], result)
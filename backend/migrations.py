@@ -0,0 +1,128 @@
+"""
+Versioned PostgreSQL schema migrations.
+
+Each migration runs once: applied versions are recorded in schema_migrations,
+so starting the app only costs one SELECT when the schema is current. Pending
+migrations are applied in version order inside a single transaction, under an
+advisory lock so several workers starting together do not race. PostgreSQL
+DDL is transactional, so a failed migration leaves the schema untouched.
+
+Never edit a migration that has shipped; append a new one with the next version.
+Migrations 1-3 use IF NOT EXISTS because databases created before this module
+already have those objects.
+
+Usage:
+    python migrations.py            # apply pending migrations
+    python migrations.py --status
+"""
+
+import argparse
+import os
+
+import psycopg2
+from dotenv import load_dotenv
+
+# Arbitrary constant identifying this lock in pg_advisory_xact_lock
+MIGRATION_LOCK_KEY = 724_125_001
+
+MIGRATIONS = [
+    (1, "create users", """
+        CREATE TABLE IF NOT EXISTS users (
+            id SERIAL PRIMARY KEY,
+            name VARCHAR(255) NOT NULL,
+            email VARCHAR(255) UNIQUE NOT NULL,
+            password VARCHAR(255) NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """),
+    # Prediction history, written in batches by PredictionHistoryWriter.
+    # No foreign key: one bad user_id must not fail a whole batch insert.
+    (2, "create predictions", """
+        CREATE TABLE IF NOT EXISTS predictions (
+            id BIGSERIAL PRIMARY KEY,
+            user_id INTEGER,
+            predicted_class VARCHAR(255) NOT NULL,
+            confidence REAL NOT NULL,
+            top_5 JSONB NOT NULL,
+            model_version INTEGER NOT NULL,
+            created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
+    """),
+    # Serves /history: newest-first pages per user by keyset on id
+    (3, "index predictions by user", """
+        CREATE INDEX IF NOT EXISTS idx_predictions_user_id_id
+        ON predictions (user_id, id DESC)
+    """),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def current_version(cursor):
+    """Highest applied migration version, 0 for a database without schema_migrations."""
+    cursor.execute("SELECT to_regclass('schema_migrations')")
+    if cursor.fetchone()[0] is None:
+        return 0
+    cursor.execute("SELECT COALESCE(MAX(version), 0) FROM schema_migrations")
+    return cursor.fetchone()[0]
+
+
+def migrate(conn):
+    """Apply pending migrations; returns the (version, name) pairs applied."""
+    with conn.cursor() as cursor:
+        if current_version(cursor) >= LATEST_VERSION:
+            conn.rollback()
+            return []
+
+        # Held until commit; a worker that waited here sees the migrations as applied
+        cursor.execute("SELECT pg_advisory_xact_lock(%s)", (MIGRATION_LOCK_KEY,))
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS schema_migrations (
+                version INTEGER PRIMARY KEY,
+                name VARCHAR(255) NOT NULL,
+                applied_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        cursor.execute("SELECT version FROM schema_migrations")
+        done = {row[0] for row in cursor.fetchall()}
+
+        applied = []
+        for version, name, sql in MIGRATIONS:
+            if version in done:
+                continue
+            cursor.execute(sql)
+            cursor.execute(
+                "INSERT INTO schema_migrations (version, name) VALUES (%s, %s)",
+                (version, name)
+            )
+            applied.append((version, name))
+    conn.commit()
+    return applied
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Apply versioned database migrations")
+    parser.add_argument("--status", action="store_true", help="Only show the schema version")
+    args = parser.parse_args()
+
+    load_dotenv()
+    conn = psycopg2.connect(os.getenv('DB_URL'))
+    try:
+        if args.status:
+            with conn.cursor() as cursor:
+                version = current_version(cursor)
+            print(f"Schema version {version} of {LATEST_VERSION}")
+            for number, name, _ in MIGRATIONS:
+                print(f"  {'✅' if number <= version else '⏳'} {number}: {name}")
+            return
+        applied = migrate(conn)
+        for version, name in applied:
+            print(f"✅ Applied migration {version}: {name}")
+        if not applied:
+            print(f"✅ Schema is up to date (version {LATEST_VERSION})")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
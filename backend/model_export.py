@@ -0,0 +1,90 @@
+"""
+Export a uint8-input variant of the trained model.
+
+The served model takes raw 0-255 pixels as float32, so every call casts the
+uint8 batch from preprocess_image() into a new float32 tensor (4x the bytes)
+before the first convolution. The exported variant declares a uint8 Input and
+fuses the cast (and any rescaling) into a single Rescaling layer at the front
+of the graph, so callers can feed the contiguous uint8 buffer as-is.
+
+Exporting the served model records the export in model_manifest.json with the
+served version; the app and the inference server only load a recorded export.
+
+Usage:
+    python model_export.py                     # raw 0-255 model (scale=1, offset=0)
+    python model_export.py --scale 0.00392157  # model trained on [0, 1] inputs
+"""
+
+import argparse
+
+import numpy as np
+import tensorflow as tf
+from tensorflow import keras
+
+import model_manifest
+
+# Export the currently served model (see model_manifest.py)
+manifest = model_manifest.load_manifest()
+model_path = model_manifest.model_file(manifest)
+uint8_model_path = model_manifest.uint8_variant_path(model_path)
+
+
+def build_uint8_model(model, scale=1.0, offset=0.0):
+    """
+    Wrap a float32-input model with a uint8 Input and a fused cast/rescale layer.
+
+    The layers of `model` are re-applied (sharing their weights) on top of the
+    new input, so the exported graph stays flat instead of nesting the original
+    model. With the default scale/offset the Rescaling layer is a pure cast,
+    which keeps outputs identical to the original model.
+    """
+    input_shape = model.input_shape[1:]
+    inputs = keras.Input(shape=input_shape, dtype="uint8", name="image_uint8")
+    x = keras.layers.Rescaling(scale=scale, offset=offset, name="cast_rescale")(inputs)
+
+    if isinstance(model, keras.Sequential):
+        for layer in model.layers:
+            x = layer(x)
+        outputs = x
+    else:
+        outputs = model(x)
+
+    return keras.Model(inputs, outputs, name=f"{model.name}_uint8")
+
+
+def export_uint8_model(src_path=model_path, dst_path=uint8_model_path, scale=1.0, offset=0.0):
+    """Load the model at `src_path`, build its uint8 variant and save it to `dst_path`."""
+    print(f"📂 Loading model from {src_path}...")
+    model = keras.models.load_model(src_path)
+    print(f"   Input: {model.input_shape} ({model.inputs[0].dtype.name})")
+
+    uint8_model = build_uint8_model(model, scale=scale, offset=offset)
+    print(f"   Exported input: {uint8_model.input_shape} ({uint8_model.inputs[0].dtype.name})")
+    print(f"   Fused rescale: x * {scale} + {offset}")
+
+    # Quick sanity check on a random batch before writing the file
+    batch = np.random.randint(0, 256, size=(2,) + tuple(model.input_shape[1:]), dtype=np.uint8)
+    reference = model.predict_on_batch(batch.astype(np.float32) * scale + offset)
+    exported = uint8_model.predict_on_batch(batch)
+    max_diff = float(np.max(np.abs(np.asarray(reference) - np.asarray(exported))))
+    print(f"   Max |diff| vs original on random batch: {max_diff:.2e}")
+
+    uint8_model.save(dst_path)
+    print(f"✅ uint8 model saved to {dst_path}")
+    return uint8_model
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export a uint8-input variant of the plant disease model")
+    parser.add_argument("--src", default=model_path, help="Path of the float32-input model")
+    parser.add_argument("--dst", default=uint8_model_path, help="Where to save the uint8-input model")
+    parser.add_argument("--scale", type=float, default=1.0, help="Rescaling scale fused into the graph")
+    parser.add_argument("--offset", type=float, default=0.0, help="Rescaling offset fused into the graph")
+    args = parser.parse_args()
+
+    tf.get_logger().setLevel("ERROR")
+    export_uint8_model(args.src, args.dst, scale=args.scale, offset=args.offset)
+    if model_manifest.record_uint8_export(args.src, args.dst, manifest["version"]):
+        print(f"✅ Recorded as the uint8 export of model v{manifest['version']} in the manifest")
+    else:
+        print(f"⚠️  {args.src} is not the served model v{manifest['version']}; export not recorded in the manifest")
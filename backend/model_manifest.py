@@ -0,0 +1,156 @@
+"""
+Model manifest: which model file is served, its class names and its version.
+
+model_manifest.json is the single commit point for a model update. A new model
+file and class list are written first, then the manifest is replaced with
+os.replace(), which is atomic, so a reader never sees a model paired with the
+wrong class list. Without a manifest the legacy plant_disease_model.keras and
+class_names.json are served as version 0.
+
+Training scripts save to a unique staging file and publish_staged() renames
+it to plant_disease_model_v<version>.keras only when the version is taken, so
+two runs finishing in any order never write to the file the other publishes.
+Manifest updates hold an exclusive lock (fcntl, where available).
+"""
+
+import json
+import os
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+
+try:
+    import fcntl
+except ImportError:  # Windows: one training run at a time
+    fcntl = None
+
+backend_dir = os.path.dirname(os.path.abspath(__file__))
+manifest_path = os.path.join(backend_dir, "model_manifest.json")
+default_model_path = os.path.join(backend_dir, "plant_disease_model.keras")
+class_names_path = os.path.join(backend_dir, "class_names.json")
+
+
+@contextmanager
+def _manifest_lock():
+    """Serialise manifest updates across processes (no-op without fcntl)."""
+    if fcntl is None:
+        yield
+        return
+    with open(f"{manifest_path}.lock", 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def write_json_atomic(path, data):
+    """Write JSON to a temp file next to `path`, then atomically replace `path`."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def load_manifest():
+    """Return the current manifest, or a version-0 manifest for the legacy files."""
+    if os.path.exists(manifest_path):
+        with open(manifest_path, 'r') as f:
+            return json.load(f)
+
+    with open(class_names_path, 'r') as f:
+        class_names = json.load(f)
+    return {
+        "version": 0,
+        "model": os.path.basename(default_model_path),
+        "class_names": class_names,
+    }
+
+
+def model_file(manifest):
+    """Absolute path of the model file named in `manifest`."""
+    return os.path.join(backend_dir, manifest["model"])
+
+
+def uint8_variant_path(path):
+    """Path of the uint8-input export of a model file (see model_export.py)."""
+    root, ext = os.path.splitext(path)
+    return f"{root}_uint8{ext}"
+
+
+def uint8_model_file(manifest):
+    """
+    Absolute path of the uint8 export of the manifest's model, or None.
+
+    Only an export recorded for this manifest version counts, so an export of
+    an older model with the same file name is never paired with new class names.
+    """
+    export = manifest.get("uint8_model")
+    if not export or export["model_version"] != manifest["version"]:
+        return None
+    path = os.path.join(backend_dir, export["file"])
+    return path if os.path.exists(path) else None
+
+
+def record_uint8_export(source_path, uint8_path, source_version):
+    """
+    Record a uint8 export in the manifest; returns False (and records nothing)
+    unless `source_path` at `source_version` is still the served model.
+    """
+    with _manifest_lock():
+        manifest = load_manifest()
+        if manifest["version"] != source_version or model_file(manifest) != os.path.abspath(source_path):
+            return False
+        manifest["uint8_model"] = {
+            "file": os.path.relpath(uint8_path, backend_dir),
+            "model_version": source_version,
+        }
+        write_json_atomic(manifest_path, manifest)
+    return True
+
+
+def staging_model_path():
+    """Unique file for a model being trained; publish_staged() gives it its versioned name."""
+    return os.path.join(backend_dir, f"plant_disease_model_staging_{uuid.uuid4().hex[:12]}.keras")
+
+
+def publish(model_path, class_names, **info):
+    """
+    Make an already-saved model file the served model.
+
+    Bumps the version, refreshes class_names.json for the scripts that read it
+    directly and finally swaps in the new manifest. Extra keyword arguments are
+    stored in the manifest as-is (e.g. source="incremental_train"). The new
+    manifest has no uint8 export until model_export.py records one for it.
+    """
+    with _manifest_lock():
+        return _publish(model_path, class_names, info)
+
+
+def publish_staged(staged_path, class_names, **info):
+    """
+    Rename a model saved at staging_model_path() to plant_disease_model_v<version>.keras
+    for the version it is published as, then publish it like publish().
+    """
+    with _manifest_lock():
+        version = load_manifest()["version"] + 1
+        model_path = os.path.join(backend_dir, f"plant_disease_model_v{version}.keras")
+        os.replace(staged_path, model_path)
+        return _publish(model_path, class_names, info)
+
+
+def _publish(model_path, class_names, info):
+    """publish() with the manifest lock held."""
+    previous = load_manifest()
+    manifest = {
+        "version": previous["version"] + 1,
+        "model": os.path.relpath(model_path, backend_dir),
+        "class_names": list(class_names),
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        **info,
+    }
+    write_json_atomic(class_names_path, manifest["class_names"])
+    write_json_atomic(manifest_path, manifest)
+    return manifest
@@ -0,0 +1,124 @@
+"""
+Write-behind store for per-user prediction history.
+
+/predict only puts a record on an in-memory queue; a background thread
+drains it and writes whole batches with one multi-row INSERT, so the request
+path never waits on PostgreSQL. A batch is flushed when it reaches
+`batch_size` records or after at most `flush_interval` seconds, whichever
+comes first, and close() (registered with atexit) flushes whatever
+is still queued on graceful shutdown.
+"""
+
+import atexit
+import json
+import queue
+import threading
+import time
+from datetime import datetime
+
+from psycopg2.extras import execute_values
+
+INSERT_SQL = """
+    INSERT INTO predictions (user_id, predicted_class, confidence, top_5, model_version, created_at)
+    VALUES %s
+"""
+
+# Put on the queue by close() to wake a writer thread waiting for records
+_WAKE_UP = object()
+
+
+class PredictionHistoryWriter:
+    """Queue prediction records and insert them into `predictions` in batches."""
+
+    def __init__(self, connect, batch_size=200, flush_interval=2.0, max_queue=10000):
+        """
+        connect: callable returning a new psycopg2 connection, or None on failure
+        batch_size: most records written by one INSERT
+        flush_interval: longest time (seconds) a record waits in memory
+        max_queue: records kept in memory; beyond that new records are dropped
+        """
+        self._connect = connect
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_queue = max_queue
+        self.dropped = 0
+        self.written = 0
+
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._retry = []
+        self._conn = None
+        self._stopping = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="prediction-history", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def record(self, user_id, predicted_class, confidence, top_5, model_version):
+        """Queue one prediction. Never blocks; drops the record if the queue is full."""
+        try:
+            self._queue.put_nowait((
+                user_id, predicted_class, confidence, json.dumps(top_5),
+                model_version, datetime.now(),
+            ))
+        except queue.Full:
+            self.dropped += 1
+
+    def _next_batch(self):
+        """Collect records until the batch is full or `flush_interval` has passed."""
+        batch = self._retry
+        self._retry = []
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            timeout = deadline - time.monotonic()
+            if self._stopping.is_set():
+                timeout = 0
+            try:
+                if timeout <= 0:
+                    item = self._queue.get_nowait()
+                else:
+                    item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if item is not _WAKE_UP:
+                batch.append(item)
+        return batch
+
+    def _flush(self, batch):
+        try:
+            if self._conn is None or self._conn.closed:
+                self._conn = self._connect()
+                if self._conn is None:
+                    raise RuntimeError("no database connection")
+            with self._conn.cursor() as cursor:
+                execute_values(cursor, INSERT_SQL, batch, page_size=len(batch))
+            self._conn.commit()
+            self.written += len(batch)
+        except Exception as e:
+            print(f"❌ Prediction history flush failed ({len(batch)} records): {e}")
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+            # Keep the batch for the next attempt unless memory is already full
+            if not self._stopping.is_set() and len(batch) + self._queue.qsize() <= self.max_queue:
+                self._retry = batch
+                time.sleep(self.flush_interval)
+            else:
+                self.dropped += len(batch)
+
+    def _run(self):
+        while not (self._stopping.is_set() and self._queue.empty() and not self._retry):
+            batch = self._next_batch()
+            if batch:
+                self._flush(batch)
+
+    def close(self, timeout=10.0):
+        """Flush everything still queued and stop the writer thread."""
+        if self._stopping.is_set():
+            return
+        self._stopping.set()
+        try:
+            self._queue.put_nowait(_WAKE_UP)
+        except queue.Full:
+            pass  # the thread is not waiting for records then
+        self._thread.join(timeout)
+        if self._conn is not None:
+            self._conn.close()
@@ -0,0 +1,145 @@
+"""
+On-demand profiling of the running server process.
+
+Nothing here costs anything until an admin asks for it: the sampling profiler
+only samples for the requested window, tracemalloc only traces between
+start_tracemalloc() and stop_tracemalloc(), and the TensorFlow trace only
+records for the requested window.
+
+The sampling profiler reads every thread's Python stack with
+sys._current_frames() at a fixed interval and writes folded stacks (one
+"thread;outer;...;inner count" line per distinct stack), the input format of
+flamegraph.pl and speedscope.
+"""
+
+import os
+import sys
+import threading
+import time
+import traceback
+import tracemalloc
+from collections import Counter
+
+DEFAULT_INTERVAL = 0.005
+DEFAULT_TRACEMALLOC_FRAMES = 10
+
+
+def _frame_label(frame):
+    # First line of the function rather than the current line, so one
+    # function is one box in the flamegraph
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def _folded_stack(frame):
+    labels = []
+    while frame is not None:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    return ";".join(reversed(labels))
+
+
+class SamplingProfiler:
+    """Sample every thread's Python stack at a fixed interval for a limited time."""
+
+    # One profile at a time per process
+    _running = threading.Lock()
+
+    def __init__(self, interval=DEFAULT_INTERVAL):
+        self.interval = interval
+
+    def run(self, seconds):
+        """
+        Sample for `seconds` from the calling thread (which is left out).
+
+        Returns (folded stacks text, number of samples). Raises RuntimeError
+        if another profile is already running.
+        """
+        if not self._running.acquire(blocking=False):
+            raise RuntimeError("A profile is already running")
+        try:
+            me = threading.get_ident()
+            names = {}
+            counts = Counter()
+            samples = 0
+            deadline = time.monotonic() + seconds
+            while time.monotonic() < deadline:
+                for ident, frame in sys._current_frames().items():
+                    if ident == me:
+                        continue
+                    if ident not in names:
+                        names.update((t.ident, t.name) for t in threading.enumerate())
+                    counts[f"{names.get(ident, ident)};{_folded_stack(frame)}"] += 1
+                samples += 1
+                time.sleep(self.interval)
+        finally:
+            self._running.release()
+        folded = "".join(f"{stack} {count}\n" for stack, count in counts.most_common())
+        return folded, samples
+
+
+def thread_stacks():
+    """Current stack of every Python thread, innermost call last."""
+    frames = sys._current_frames()
+    return [
+        {
+            "name": thread.name,
+            "ident": thread.ident,
+            "daemon": thread.daemon,
+            "stack": [line.rstrip("\n") for line in traceback.format_stack(frames[thread.ident])],
+        }
+        for thread in threading.enumerate()
+        if thread.ident in frames
+    ]
+
+
+def start_tracemalloc(frames=DEFAULT_TRACEMALLOC_FRAMES):
+    """Start tracing Python allocations; returns False if already tracing."""
+    if tracemalloc.is_tracing():
+        return False
+    tracemalloc.start(frames)
+    return True
+
+
+def stop_tracemalloc():
+    tracemalloc.stop()
+
+
+def top_allocations(limit=20, group_by="lineno"):
+    """
+    Largest live allocations since start_tracemalloc(), or None when not tracing.
+
+    group_by is "lineno", "filename" or "traceback" (see tracemalloc).
+    """
+    if not tracemalloc.is_tracing():
+        return None
+    snapshot = tracemalloc.take_snapshot().filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    ))
+    current, peak = tracemalloc.get_traced_memory()
+    return {
+        "current_bytes": current,
+        "peak_bytes": peak,
+        "top": [
+            {
+                "size_bytes": stat.size,
+                "count": stat.count,
+                "traceback": [f"{frame.filename}:{frame.lineno}" for frame in stat.traceback],
+            }
+            for stat in snapshot.statistics(group_by)[:limit]
+        ],
+    }
+
+
+def capture_tf_trace(seconds, logdir):
+    """Record a TensorFlow profiler trace of everything run in the next `seconds` (view with TensorBoard)."""
+    import tensorflow as tf
+
+    tf.profiler.experimental.start(logdir)
+    try:
+        time.sleep(seconds)
+    finally:
+        tf.profiler.experimental.stop()
+    return logdir
@@ -0,0 +1,84 @@
+"""
+Test the dataset audit on a tiny synthetic splitted_dataset: corrupt files,
+cross-split and near duplicates, the hash cache and the cleaned manifest.
+
+    python -m pytest test_audit_dataset.py
+"""
+import os
+import shutil
+import tempfile
+
+import numpy as np
+from PIL import Image
+
+import audit_dataset
+
+
+def make_dataset(root):
+    rng = np.random.default_rng(0)
+    for split, count in (("train", 6), ("val", 3), ("test", 3)):
+        for class_name in ("healthy", "rust"):
+            directory = os.path.join(root, split, class_name)
+            os.makedirs(directory)
+            for i in range(count):
+                blocks = rng.integers(0, 256, (16, 16, 3), dtype=np.uint8)
+                Image.fromarray(np.kron(blocks, np.ones((8, 8, 1), dtype=np.uint8))).save(
+                    os.path.join(directory, f"{i}.jpg"), quality=90)
+    shutil.copy(os.path.join(root, "train/healthy/0.jpg"), os.path.join(root, "test/healthy/copy.jpg"))
+    # Same picture re-encoded: different bytes, same perceptual hash
+    Image.open(os.path.join(root, "train/rust/1.jpg")).save(os.path.join(root, "val/rust/again.jpg"), quality=60)
+    with open(os.path.join(root, "train/rust/2.jpg"), 'rb') as f:
+        truncated = f.read()[:300]
+    with open(os.path.join(root, "train/rust/broken.jpg"), 'wb') as f:
+        f.write(truncated)
+    # Decodes with Pillow, but tf.io.decode_image rejects WebP
+    Image.open(os.path.join(root, "train/rust/3.jpg")).save(os.path.join(root, "train/rust/webp.jpg"), format="WEBP")
+
+
+def audit(root):
+    files = audit_dataset.scan_dataset(root)
+    entries = audit_dataset.hash_files(root, files, workers=2)
+    return files, audit_dataset.build_report(root, files, entries, near_threshold=2)
+
+
+def test_audit_report_and_manifest(monkeypatch):
+    with tempfile.TemporaryDirectory() as root:
+        monkeypatch.setattr(audit_dataset, "cache_path", os.path.join(root, "cache.json"))
+        make_dataset(root)
+        files, report = audit(root)
+
+        assert [item["path"] for item in report["corrupt"]] == ["train/rust/broken.jpg", "train/rust/webp.jpg"]
+        assert "WEBP data" in report["corrupt"][1]["error"]
+        assert [group["paths"] for group in report["cross_split_duplicates"]] == \
+            [["train/healthy/0.jpg", "test/healthy/copy.jpg"]]
+        assert [pair["paths"] for pair in report["cross_split_near_duplicates"]] == \
+            [["train/rust/1.jpg", "val/rust/again.jpg"]]
+        assert report["class_balance"]["counts"]["train"] == {"healthy": 6, "rust": 8}
+
+        kept, dropped = audit_dataset.clean_file_lists(files, report, drop_near_duplicates=True)
+        assert dropped == 4
+        assert "train/healthy/0.jpg" in kept["train"] and "test/healthy/copy.jpg" not in kept["test"]
+        assert "val/rust/again.jpg" not in kept["val"] and "train/rust/broken.jpg" not in kept["train"]
+        assert "train/rust/webp.jpg" not in kept["train"]
+
+
+def test_cache_only_decodes_new_files(monkeypatch):
+    with tempfile.TemporaryDirectory() as root:
+        monkeypatch.setattr(audit_dataset, "cache_path", os.path.join(root, "cache.json"))
+        make_dataset(root)
+        audit(root)
+
+        decoded = []
+
+        class RecordingPool(audit_dataset.ProcessPoolExecutor):
+            def map(self, fn, paths, **kwargs):
+                paths = list(paths)
+                decoded.extend(paths)
+                return super().map(fn, paths, **kwargs)
+
+        monkeypatch.setattr(audit_dataset, "ProcessPoolExecutor", RecordingPool)
+        audit(root)
+        assert decoded == [], "an unchanged dataset should come from the cache"
+        shutil.copy(os.path.join(root, "val/rust/0.jpg"), os.path.join(root, "val/rust/new.jpg"))
+        audit(root)
+        assert [os.path.relpath(p, root) for p in decoded] == [os.path.join("val", "rust", "new.jpg")]
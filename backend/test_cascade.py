@@ -0,0 +1,91 @@
+"""
+Test the confidence-gated cascade with fake models: escalation rule, merging
+of full-model answers, threshold calibration and loading the calibrated fast
+model.
+
+    python -m pytest test_cascade.py
+"""
+import numpy as np
+import pytest
+from tensorflow import keras
+
+import model_manifest
+from calibrate_cascade import choose_thresholds
+from cascade import Cascade, CascadeStats, escalation_mask, file_digest
+from fake_models import FirstPixelModel
+
+
+def images(n):
+    batch = np.zeros((n, 4, 4, 3), dtype=np.uint8)
+    batch[:, 0, 0, 0] = np.arange(n)
+    return batch
+
+
+def test_escalation_mask():
+    probabilities = np.array([
+        [0.95, 0.03, 0.02],   # confident
+        [0.60, 0.35, 0.05],   # low confidence
+        [0.80, 0.15, 0.05],   # confident, wide margin
+        [0.50, 0.49, 0.01],   # low confidence and margin
+    ])
+    assert escalation_mask(probabilities, 0.7, 0.0).tolist() == [False, True, False, True]
+    assert escalation_mask(probabilities, 0.0, 0.7).tolist() == [False, True, True, True]
+
+
+def test_only_uncertain_rows_reach_full_model():
+    fast = FirstPixelModel(rows=[[0.9, 0.1], [0.55, 0.45], [0.99, 0.01]])
+    full = FirstPixelModel(rows=[[0.0, 1.0], [0.1, 0.9], [0.0, 1.0]])
+    cascade = Cascade(fast, full, min_confidence=0.8, min_margin=0.0)
+    probabilities, embeddings, escalated = cascade.predict(images(3))
+    assert full.batches == [[1]], "only the uncertain image goes to the full model"
+    assert escalated.tolist() == [False, True, False]
+    assert np.argmax(probabilities, axis=1).tolist() == [0, 1, 0]
+    assert embeddings is None
+
+    stats = CascadeStats()
+    stats.record(escalated)
+    stats.record(np.array([True, False]), has_embeddings=True)
+    snapshot = stats.snapshot()
+    assert snapshot["escalation_rate"] == 2 / 5
+    assert (snapshot["images_with_embeddings"], snapshot["embedding_coverage"]) == (1, 1 / 5)
+
+
+def test_calibration_meets_target_with_least_escalation():
+    rng = np.random.default_rng(0)
+    n = 2000
+    confidence = rng.uniform(0.34, 1.0, n)
+    fast_probabilities = np.stack([confidence, (1 - confidence) * 0.6, (1 - confidence) * 0.4], axis=1)
+    # The fast model is mostly wrong when unsure; the full model is always right
+    fast_correct = rng.uniform(0, 1, n) < confidence ** 4
+    full_correct = np.ones(n, dtype=bool)
+
+    best = choose_thresholds(fast_probabilities, fast_correct, full_correct, 0.95)
+    assert best is not None and best["accuracy"] >= 0.95
+    assert 0 < best["escalation_rate"] < 1
+    escalated = escalation_mask(fast_probabilities, best["min_confidence"], best["min_margin"])
+    assert np.isclose(escalated.mean(), best["escalation_rate"])
+    assert choose_thresholds(fast_probabilities, fast_correct, ~full_correct, 0.99) is None
+
+
+def save_model(path, name, num_classes=2):
+    model = keras.Sequential([keras.Input((4,)), keras.layers.Dense(num_classes)], name=name)
+    model.save(str(path))
+    return model
+
+
+def test_from_config_loads_only_the_calibrated_fast_model(monkeypatch, tmp_path):
+    monkeypatch.setattr(model_manifest, "backend_dir", str(tmp_path))
+    save_model(tmp_path / "fast.keras", "fast")
+    save_model(tmp_path / "fast_uint8.keras", "fast_uint8")
+    config = {"fast_model": "fast.keras", "fast_model_sha256": file_digest(tmp_path / "fast.keras"),
+              "fast_uint8_model": None, "min_confidence": 0.8, "min_margin": 0.1}
+    full = save_model(tmp_path / "full.keras", "full")
+
+    cascade = Cascade.from_config(config, full)
+    assert cascade.fast_model.name == "fast", "an export not recorded at calibration is never served"
+    cascade = Cascade.from_config(dict(config, fast_uint8_model="fast_uint8.keras"), full)
+    assert cascade.fast_model.name == "fast_uint8"
+
+    save_model(tmp_path / "fast.keras", "fast", num_classes=3)
+    with pytest.raises(ValueError, match="changed since calibration"):
+        Cascade.from_config(config, full)
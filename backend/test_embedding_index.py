@@ -0,0 +1,97 @@
+"""
+Test the embedding index: exact and LSH search, near-duplicates, persistence.
+
+    python -m pytest test_embedding_index.py
+"""
+import os
+import tempfile
+import time
+
+import numpy as np
+import pytest
+
+from embedding_index import EmbeddingIndex
+
+DIM = 512
+ROWS = 20000
+
+
+def random_vectors(rng, n):
+    # Non-negative like relu activations
+    return np.maximum(rng.standard_normal((n, DIM)), 0).astype(np.float32)
+
+
+def fill(index, rng, n=ROWS):
+    vectors = random_vectors(rng, n)
+    index.append(vectors, [{"predicted_class": f"class_{i % 16}"} for i in range(n)])
+    return vectors
+
+
+def test_exact_search_finds_itself():
+    rng = np.random.default_rng(0)
+    with tempfile.TemporaryDirectory() as directory:
+        index = EmbeddingIndex(directory, dim=DIM)
+        vectors = fill(index, rng)
+        results = index.search(vectors[123], k=5)
+        assert results[0]["id"] == 123
+        assert results[0]["similarity"] > 0.999
+        assert results[0]["predicted_class"] == "class_11"
+        assert [r["similarity"] for r in results] == sorted((r["similarity"] for r in results), reverse=True)
+
+
+def test_near_duplicate_found_with_lsh():
+    rng = np.random.default_rng(1)
+    with tempfile.TemporaryDirectory() as directory:
+        index = EmbeddingIndex(directory, dim=DIM, exact_search_max_rows=0)
+        vectors = fill(index, rng)
+        # A re-encoded photo moves the embedding only slightly
+        noisy = vectors[4567] + 0.02 * rng.standard_normal(DIM).astype(np.float32)
+
+        start = time.perf_counter()
+        results = index.search(noisy, k=5)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        print(f"LSH search over {ROWS} rows: {elapsed_ms:.2f} ms")
+
+        assert results[0]["id"] == 4567
+        assert results[0]["similarity"] > 0.985
+
+
+def test_append_persists_across_reopen():
+    rng = np.random.default_rng(2)
+    with tempfile.TemporaryDirectory() as directory:
+        index = EmbeddingIndex(directory, dim=DIM)
+        vectors = fill(index, rng, n=100)
+        extra = random_vectors(rng, 1)
+        assert index.append(extra, [{"predicted_class": "new"}]) == [100]
+
+        reopened = EmbeddingIndex(directory)
+        assert len(reopened) == 101
+        assert reopened.search(extra[0], k=1)[0]["predicted_class"] == "new"
+        assert reopened.search(vectors[7], k=1)[0]["id"] == 7
+
+
+def test_reopen_with_another_dim_rejected():
+    with tempfile.TemporaryDirectory() as directory:
+        EmbeddingIndex(directory, dim=DIM)
+        with pytest.raises(ValueError):
+            EmbeddingIndex(directory, dim=DIM // 2)
+
+
+def test_offsets_rebuilt_and_crashed_tail_dropped():
+    rng = np.random.default_rng(3)
+    with tempfile.TemporaryDirectory() as directory:
+        vectors = fill(EmbeddingIndex(directory, dim=DIM), rng, n=50)
+        # An index written before offsets.u64 existed, plus half a metadata line
+        # from an append that crashed before its offsets were written
+        os.remove(os.path.join(directory, "offsets.u64"))
+        reopened = EmbeddingIndex(directory, dim=DIM)
+        assert len(reopened) == 50
+        other = EmbeddingIndex(directory, dim=DIM)
+        with open(os.path.join(directory, "metadata.jsonl"), 'a') as f:
+            f.write('{"predicted_class": "cra')
+
+        extra = random_vectors(rng, 1)
+        assert other.append(extra, [{"predicted_class": "new"}]) == [50]
+        # The first instance picks up the other one's row
+        assert reopened.search(extra[0], k=1)[0]["predicted_class"] == "new"
+        assert reopened.search(vectors[9], k=1)[0]["predicted_class"] == "class_9"
@@ -0,0 +1,91 @@
+"""
+Test incremental training helpers with a tiny model and a synthetic dataset:
+splitting the model, widening the classifier and the backbone feature cache.
+
+    python -m pytest test_incremental_train.py
+"""
+import os
+
+import numpy as np
+from PIL import Image
+from tensorflow import keras
+
+import incremental_train
+
+
+def tiny_model(num_classes=3):
+    return keras.Sequential([
+        keras.Input(shape=(8, 8, 3)),
+        keras.layers.Conv2D(2, (3, 3)),
+        keras.layers.Flatten(),
+        keras.layers.Dense(4),
+        keras.layers.Activation('relu'),
+        keras.layers.Dropout(0.5),
+        keras.layers.Dense(num_classes),
+        keras.layers.Activation('softmax'),
+    ])
+
+
+def test_split_model():
+    model = tiny_model()
+    backbone, hidden_layers, classifier = incremental_train.split_model(model)
+    assert backbone.output_shape == (None, 72)
+    assert not backbone.trainable
+    assert [type(layer).__name__ for layer in hidden_layers] == ["Dense", "Activation", "Dropout"]
+    assert classifier is model.layers[-2]
+
+
+def test_build_head_keeps_old_logits():
+    model = tiny_model()
+    backbone, hidden_layers, classifier = incremental_train.split_model(model)
+    old_kernel, old_bias = classifier.get_weights()
+    head, new_classifier = incremental_train.build_head(72, hidden_layers, classifier, 5, train_hidden=False)
+    assert head.output_shape == (None, 5)
+    assert not any(layer.trainable for layer in hidden_layers)
+
+    hidden = np.random.default_rng(0).random((6, 4), dtype=np.float32)
+    old_logits = hidden @ old_kernel + old_bias
+    new_logits = np.asarray(new_classifier(hidden))
+    np.testing.assert_allclose(new_logits[:, :3], old_logits, rtol=1e-6)
+
+
+class CountingBackbone:
+    """Stands in for the backbone; records how many images it featurized."""
+
+    def __init__(self):
+        self.images = 0
+
+    def predict(self, ds, verbose=0):
+        n = sum(len(batch) for batch in ds)
+        self.images += n
+        return np.arange(n * 4, dtype=np.float32).reshape(n, 4)
+
+
+def save_image(dataset_dir, name, cls, value):
+    directory = os.path.join(dataset_dir, "train", cls)
+    os.makedirs(directory, exist_ok=True)
+    Image.fromarray(np.full((8, 8, 3), value, dtype=np.uint8)).save(os.path.join(directory, name))
+
+
+def test_feature_cache_skips_cached_paths(monkeypatch, tmp_path):
+    dataset_dir = str(tmp_path / "dataset")
+    monkeypatch.setattr(incremental_train, "dataset_dir", dataset_dir)
+    monkeypatch.setattr(incremental_train, "feature_cache_dir", str(tmp_path / "feature_cache"))
+    for i in range(3):
+        save_image(dataset_dir, f"{i}.png", "healthy", i)
+    backbone = CountingBackbone()
+
+    features, labels = incremental_train.cached_features(backbone, "abc", "train", ["healthy"])
+    assert backbone.images == 3
+    assert features.shape == (3, 4) and features.dtype == np.float16
+    assert labels == ["healthy"] * 3
+
+    save_image(dataset_dir, "0.png", "rust", 9)
+    features, labels = incremental_train.cached_features(backbone, "abc", "train", ["healthy", "rust"])
+    assert backbone.images == 4, "only the new image is featurized"
+    assert sorted(labels) == ["healthy"] * 3 + ["rust"]
+    assert len(features) == 4
+
+    # Leaving a class out only loads the images still wanted
+    _, labels = incremental_train.cached_features(backbone, "abc", "train", ["rust"])
+    assert backbone.images == 4 and labels == ["rust"]
@@ -0,0 +1,318 @@
+"""
+Test the shared-memory inference server with a fake model: outputs land in the
+right slots and concurrent requests from several threads are batched together.
+
+    python -m pytest test_inference_server.py
+"""
+import multiprocessing
+import os
+import signal
+import sys
+import tempfile
+import threading
+import time
+
+from multiprocessing.connection import Client
+
+import numpy as np
+import pytest
+
+from fake_models import FirstPixelModel
+from inference_server import IMAGE_SHAPE, InferenceClient, InferenceServer, InferenceUnavailable
+
+CLASS_NAMES = ["healthy", "rust", "blight"]
+# Spawn, so the server has its own resource tracker like a separately started process
+CONTEXT = multiprocessing.get_context("spawn")
+
+
+class CountingModel(FirstPixelModel):
+    """Also counts images and the largest batch seen, visible from the test process."""
+
+    def __init__(self):
+        super().__init__(len(CLASS_NAMES))
+        self.images = CONTEXT.RawValue('i', 0)
+        self.largest_batch = CONTEXT.RawValue('i', 0)
+
+    def predict_on_batch(self, batch):
+        self.images.value += len(batch)
+        self.largest_batch.value = max(self.largest_batch.value, len(batch))
+        return super().predict_on_batch(batch)
+
+
+class SlowModel(CountingModel):
+    """Takes a second per batch, so requests stay in flight while the test acts."""
+
+    def predict_on_batch(self, batch):
+        time.sleep(1)
+        return super().predict_on_batch(batch)
+
+
+def serve(model, address, shm_name, model_version):
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    server = InferenceServer(model, CLASS_NAMES, model_version, address=address,
+                             shm_name=shm_name, num_slots=8)
+    try:
+        server.serve_forever()
+    finally:
+        server.close()
+
+
+def start_server(directory, model, model_version=3):
+    """Run the server in its own process, as in production; returns (process, address) once it accepts clients."""
+    address = os.path.join(directory, "inference.sock")
+    # Same name on every start in one directory, like a restarted production server
+    shm_name = f"smart_leaf_test_{os.path.basename(directory)}"
+    process = CONTEXT.Process(target=serve, args=(model, address, shm_name, model_version), daemon=True)
+    process.start()
+    # The socket file of a previous server in this directory may still exist, so
+    # wait for a connection to succeed (the server frees the probe's slot again)
+    deadline = time.time() + 10
+    while time.time() < deadline:
+        try:
+            Client(address, family="AF_UNIX").close()
+            break
+        except OSError:
+            time.sleep(0.01)
+    return process, address
+
+
+def stop_server(process):
+    process.terminate()
+    process.join(timeout=10)
+
+
+def images(values):
+    return np.stack([np.full(IMAGE_SHAPE, v, dtype=np.uint8) for v in values])
+
+
+def test_predict_round_trip():
+    with tempfile.TemporaryDirectory() as directory:
+        process, address = start_server(directory, CountingModel())
+        try:
+            client = InferenceClient(address, max_slots=2)
+            client.connect()
+            assert client.class_names == CLASS_NAMES and client.model_version == 3
+            # More images than slots: the client works through them in rounds
+            probabilities, embeddings, escalated = client.predict(images([0, 1, 2, 4, 5]))
+            assert embeddings is None and escalated is None
+            assert probabilities.argmax(axis=1).tolist() == [0, 1, 2, 1, 2]
+        finally:
+            stop_server(process)
+
+
+def test_concurrent_requests_share_batches():
+    with tempfile.TemporaryDirectory() as directory:
+        model = CountingModel()
+        process, address = start_server(directory, model)
+        try:
+            client = InferenceClient(address, max_slots=4)
+            results = {}
+            barrier = threading.Barrier(4)
+
+            def request(value):
+                barrier.wait()
+                for _ in range(20):
+                    probabilities, _, _ = client.predict(images([value]))
+                    assert int(probabilities.argmax()) == value % len(CLASS_NAMES)
+                results[value] = True
+
+            threads = [threading.Thread(target=request, args=(v,)) for v in range(4)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join(timeout=30)
+            assert len(results) == 4, "every thread should get correct answers"
+            assert model.images.value == 80
+            assert model.largest_batch.value > 1, "concurrent requests should be batched"
+        finally:
+            stop_server(process)
+
+
+def test_client_started_before_server():
+    with tempfile.TemporaryDirectory() as directory:
+        client = InferenceClient(os.path.join(directory, "inference.sock"))
+        assert not client.connected
+        with pytest.raises(InferenceUnavailable, match="not reachable"):
+            client.predict(images([1]))
+
+        process, address = start_server(directory, CountingModel())
+        try:
+            # The first request after the server came up makes the handshake
+            assert client.predict(images([2, 1]))[0].argmax(axis=1).tolist() == [2, 1]
+            assert client.connected and client.class_names == CLASS_NAMES
+        finally:
+            stop_server(process)
+
+
+def test_connect_waits_for_server():
+    with tempfile.TemporaryDirectory() as directory:
+        client = InferenceClient(os.path.join(directory, "inference.sock"))
+        with pytest.raises(OSError):
+            client.connect(timeout=0.2)
+        starter = threading.Timer(0.5, lambda: started.append(start_server(directory, CountingModel())))
+        started = []
+        starter.start()
+        try:
+            client.connect(timeout=20)
+            assert client.model_version == 3
+        finally:
+            starter.join()
+            stop_server(started[0][0])
+
+
+def test_reconnect_after_server_restart():
+    with tempfile.TemporaryDirectory() as directory:
+        process, address = start_server(directory, CountingModel())
+        client = InferenceClient(address, max_slots=4)
+        try:
+            # Two requests in flight, so two connections end up in the pool
+            assert client.predict(images([1, 2]))[0].argmax(axis=1).tolist() == [1, 2]
+        finally:
+            stop_server(process)
+
+        process, address = start_server(directory, CountingModel())
+        try:
+            with pytest.raises(InferenceUnavailable, match="Lost connection"):
+                client.predict(images([1, 2]))
+            # Every stale connection was dropped and the new block attached (other
+            # values, as the old block still holds the answers for [1, 2])
+            for values in ([2, 0], [0, 1], [1, 2]):
+                assert client.predict(images(values))[0].argmax(axis=1).tolist() == values
+        finally:
+            stop_server(process)
+
+
+def test_waiting_request_wakes_up_after_server_restart():
+    with tempfile.TemporaryDirectory() as directory:
+        process, address = start_server(directory, SlowModel())
+        client = InferenceClient(address, max_slots=1)
+        client.connect()
+        outcomes = {}
+
+        def request(name, value):
+            try:
+                outcomes[name] = client.predict(images([value]))[0].argmax(axis=1).tolist()
+            except InferenceUnavailable as e:
+                outcomes[name] = e
+
+        in_flight = threading.Thread(target=request, args=("in_flight", 1), daemon=True)
+        in_flight.start()
+        time.sleep(0.3)
+        # Waits for the only slot, which fails when the server goes away
+        waiting = threading.Thread(target=request, args=("waiting", 2), daemon=True)
+        waiting.start()
+        time.sleep(0.2)
+        stop_server(process)
+
+        process, address = start_server(directory, CountingModel())
+        try:
+            in_flight.join(timeout=10)
+            waiting.join(timeout=10)
+            assert not waiting.is_alive(), "a thread waiting for a slot must not hang"
+            assert isinstance(outcomes["in_flight"], InferenceUnavailable)
+            # Depending on timing it reached the restarted server or found it still down
+            assert outcomes["waiting"] == [2] or isinstance(outcomes["waiting"], InferenceUnavailable)
+            assert client.predict(images([0, 1]))[0].argmax(axis=1).tolist() == [0, 1]
+        finally:
+            stop_server(process)
+
+
+def test_server_gone_after_handshake():
+    with tempfile.TemporaryDirectory() as directory:
+        process, address = start_server(directory, CountingModel())
+        client = InferenceClient(address)
+        client.connect()
+        stop_server(process)
+
+        with pytest.raises(InferenceUnavailable, match="Lost connection"):
+            client.predict(images([1]))
+        # No pooled connection is left, so opening a new slot fails as well
+        with pytest.raises(InferenceUnavailable):
+            client.predict(images([1]))
+
+
+def test_restarted_server_with_another_model_is_refused():
+    with tempfile.TemporaryDirectory() as directory:
+        process, address = start_server(directory, CountingModel())
+        client = InferenceClient(address)
+        client.connect()
+        stop_server(process)
+
+        process, address = start_server(directory, CountingModel(), model_version=4)
+        try:
+            with pytest.raises(InferenceUnavailable, match="Lost connection"):
+                client.predict(images([1]))
+            with pytest.raises(RuntimeError, match="now serves model v4"):
+                client.predict(images([1]))
+        finally:
+            stop_server(process)
+
+
+class FailingModel(FirstPixelModel):
+    """Raises on any batch holding an image whose first pixel is 99."""
+
+    def __init__(self):
+        super().__init__(len(CLASS_NAMES))
+
+    def predict_on_batch(self, batch):
+        if (batch[:, 0, 0, 0] == 99).any():
+            raise ValueError("bad batch")
+        return super().predict_on_batch(batch)
+
+
+def test_model_error_fails_only_that_request():
+    with tempfile.TemporaryDirectory() as directory:
+        process, address = start_server(directory, FailingModel())
+        try:
+            client = InferenceClient(address, max_slots=2)
+            with pytest.raises(RuntimeError, match="failed to run the model"):
+                client.predict(images([1, 99]))
+            assert process.is_alive()
+            assert client.predict(images([2, 1]))[0].argmax(axis=1).tolist() == [2, 1]
+        finally:
+            stop_server(process)
+
+
+class RecordingModel(FirstPixelModel):
+    """Waits for `release` before every batch and records the order images ran in."""
+
+    def __init__(self):
+        super().__init__(len(CLASS_NAMES))
+        self.release = CONTEXT.Event()
+        self.order = CONTEXT.RawArray('i', 16)
+        self.count = CONTEXT.RawValue('i', 0)
+
+    def predict_on_batch(self, batch):
+        self.release.wait()
+        for value in batch[:, 0, 0, 0]:
+            self.order[self.count.value] = value
+            self.count.value += 1
+        return super().predict_on_batch(batch)
+
+
+def test_interactive_requests_served_before_background(monkeypatch):
+    monkeypatch.setenv("INFERENCE_MAX_BATCH", "2")
+    with tempfile.TemporaryDirectory() as directory:
+        model = RecordingModel()
+        process, address = start_server(directory, model)
+        try:
+            client = InferenceClient(address, max_slots=8)
+
+            def request(value, interactive):
+                thread = threading.Thread(target=client.predict, args=(images([value]), interactive))
+                thread.start()
+                return thread
+
+            # The server sits in the first batch while the others queue up
+            threads = [request(9, False)]
+            time.sleep(0.2)
+            threads += [request(5, False) for _ in range(4)]
+            time.sleep(0.2)
+            threads += [request(1, True) for _ in range(2)]
+            time.sleep(0.2)
+            model.release.set()
+            for thread in threads:
+                thread.join(timeout=10)
+            assert list(model.order[:model.count.value]) == [9, 1, 1, 5, 5, 5, 5]
+        finally:
+            stop_server(process)
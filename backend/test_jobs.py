@@ -0,0 +1,183 @@
+"""
+Test the SQLite job queue with a fake model: priority, cancellation, batching.
+
+    python -m pytest test_jobs.py
+"""
+import os
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+from fake_models import FirstPixelModel
+from inference_server import InferenceUnavailable
+from jobs import IMAGE_SHAPE, InferenceGate, JobManager
+
+NUM_CLASSES = 4
+
+
+def fake_images(n, value):
+    return [np.full(IMAGE_SHAPE, value, dtype=np.uint8) for _ in range(n)]
+
+
+def summarize(probabilities):
+    return {"predicted_class": int(np.argmax(probabilities))}
+
+
+def wait_for(manager, job_id, timeout=10):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = manager.status(job_id)
+        if job["status"] in ("done", "cancelled"):
+            return job
+        time.sleep(0.05)
+    raise AssertionError(f"job {job_id} did not finish")
+
+
+def test_priority_and_results():
+    with tempfile.TemporaryDirectory() as directory:
+        gate, model = InferenceGate(), FirstPixelModel(NUM_CLASSES)
+        # Hold the gate so both jobs are queued before any worker runs
+        with gate.interactive():
+            manager = JobManager(os.path.join(directory, "jobs.db"), model, summarize, gate,
+                                 workers=1, batch_size=4, poll_interval=0.05)
+            low = manager.submit(fake_images(3, 1), ["a", "b", "c"], priority=0)
+            high = manager.submit(fake_images(2, 2), ["d", "e"], priority=5)
+            time.sleep(0.2)
+            assert model.batches == [], "workers must wait while an interactive request runs"
+
+        assert wait_for(manager, low)["status"] == "done"
+        assert wait_for(manager, high)["completed"] == 2
+        # One batch across both jobs, high-priority images first
+        assert model.batches[0] == [2, 2, 1, 1]
+        assert [r["result"]["predicted_class"] for r in manager.results(low)] == [1, 1, 1]
+        manager.close()
+
+
+def test_cancel_and_decode_errors():
+    with tempfile.TemporaryDirectory() as directory:
+        gate, model = InferenceGate(), FirstPixelModel(NUM_CLASSES)
+        with gate.interactive():
+            manager = JobManager(os.path.join(directory, "jobs.db"), model, summarize, gate,
+                                 workers=1, poll_interval=0.05)
+            job = manager.submit(fake_images(1, 3) + [None], ["ok", "broken"],
+                                 errors=[None, "Could not read image"])
+            assert manager.cancel(job)
+            assert not manager.cancel("missing")
+        time.sleep(0.2)
+        assert model.batches == []
+        statuses = [r["status"] for r in manager.results(job)]
+        assert statuses == ["cancelled", "error"]
+        assert manager.status(job)["status"] == "cancelled"
+        manager.close()
+
+
+class BlockedModel(FirstPixelModel):
+    """Holds every batch until `release` is set, like a worker stuck in a long batch."""
+
+    def __init__(self):
+        super().__init__(NUM_CLASSES)
+        self.release = threading.Event()
+
+    def predict_on_batch(self, batch):
+        self.release.wait()
+        return super().predict_on_batch(batch)
+
+    __call__ = predict_on_batch
+
+
+def test_new_manager_leaves_live_claims_alone():
+    with tempfile.TemporaryDirectory() as directory:
+        db_path = os.path.join(directory, "jobs.db")
+        slow = BlockedModel()
+        first = JobManager(db_path, slow, summarize, InferenceGate(), workers=1, poll_interval=0.05)
+        job = first.submit(fake_images(2, 1), ["a", "b"])
+        time.sleep(0.2)
+
+        # Another web worker starting up must not take over the running images
+        model = FirstPixelModel(NUM_CLASSES)
+        second = JobManager(db_path, model, summarize, InferenceGate(), workers=1, poll_interval=0.05)
+        time.sleep(0.3)
+        assert [r["status"] for r in second.results(job)] == ["running", "running"]
+        assert model.batches == []
+
+        slow.release.set()
+        assert wait_for(second, job)["completed"] == 2
+        first.close()
+        second.close()
+
+
+def test_expired_claims_are_retried_and_counted_once():
+    with tempfile.TemporaryDirectory() as directory:
+        db_path = os.path.join(directory, "jobs.db")
+        results = []
+        slow = BlockedModel()
+        first = JobManager(db_path, slow, summarize, InferenceGate(), workers=1, poll_interval=0.05,
+                           lease_seconds=0.2, on_result=lambda user_id, result: results.append(result))
+        job = first.submit(fake_images(2, 1), ["a", "b"], user_id=7)
+        time.sleep(0.1)
+
+        second = JobManager(db_path, FirstPixelModel(NUM_CLASSES), summarize, InferenceGate(), workers=1,
+                            poll_interval=0.05, on_result=lambda user_id, result: results.append(result))
+        assert wait_for(second, job)["completed"] == 2
+
+        # The first batch finishes after losing its lease: nothing is stored twice
+        slow.release.set()
+        first.close()
+        status = second.status(job)
+        assert (status["completed"], status["failed"], status["progress"]) == (2, 0, 1.0)
+        assert len(results) == 2
+        second.close()
+
+
+def test_expired_claims_of_cancelled_job_are_not_retried():
+    with tempfile.TemporaryDirectory() as directory:
+        db_path = os.path.join(directory, "jobs.db")
+        slow = BlockedModel()
+        first = JobManager(db_path, slow, summarize, InferenceGate(), workers=1, poll_interval=0.05,
+                           lease_seconds=0.2)
+        job = first.submit(fake_images(2, 1), ["a", "b"])
+        time.sleep(0.1)
+        assert first.cancel(job)
+
+        # The first process "died" with the batch running; its lease runs out
+        model = FirstPixelModel(NUM_CLASSES)
+        second = JobManager(db_path, model, summarize, InferenceGate(), workers=1, poll_interval=0.05)
+        time.sleep(0.5)
+        assert model.batches == []
+        assert [r["status"] for r in second.results(job)] == ["cancelled", "cancelled"]
+
+        slow.release.set()
+        first.close()
+        assert second.status(job)["completed"] == 0
+        second.close()
+
+
+class UnavailableOnceModel(FirstPixelModel):
+    """Raises InferenceUnavailable for the first batch, like a restarting inference server."""
+
+    def __init__(self):
+        super().__init__(NUM_CLASSES)
+        self.unavailable = 1
+
+    def predict_on_batch(self, batch):
+        if self.unavailable:
+            self.unavailable -= 1
+            raise InferenceUnavailable("Inference server at test.sock is not reachable")
+        return super().predict_on_batch(batch)
+
+    __call__ = predict_on_batch
+
+
+def test_unavailable_server_requeues_the_batch():
+    with tempfile.TemporaryDirectory() as directory:
+        model = UnavailableOnceModel()
+        manager = JobManager(os.path.join(directory, "jobs.db"), model, summarize, InferenceGate(),
+                             workers=1, poll_interval=0.05)
+        job = manager.submit(fake_images(3, 1), ["a", "b", "c"])
+        status = wait_for(manager, job)
+        assert (status["status"], status["completed"], status["failed"]) == ("done", 3, 0)
+        assert model.unavailable == 0 and model.batches == [[1, 1, 1]]
+        assert all(r["error"] is None for r in manager.results(job))
+        manager.close()
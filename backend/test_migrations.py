@@ -0,0 +1,70 @@
+"""
+Test the versioned migrations against a fake connection that keeps
+schema_migrations in memory: pending versions run in order, applied ones are
+skipped and a current schema costs no lock or DDL.
+
+    python -m pytest test_migrations.py
+"""
+import migrations
+from fake_models import FakeConnection
+
+
+class SchemaMigrations:
+    """Plays the schema_migrations table of a database with `versions` applied."""
+
+    def __init__(self, versions=None):
+        # None: the database has no schema_migrations table yet
+        self.versions = None if versions is None else dict.fromkeys(versions, "earlier")
+
+    def __call__(self, sql, params):
+        if sql.startswith("SELECT to_regclass"):
+            return [("schema_migrations" if self.versions is not None else None,)]
+        if sql.startswith("SELECT COALESCE(MAX(version), 0)"):
+            return [(max(self.versions, default=0),)]
+        if sql.startswith("CREATE TABLE IF NOT EXISTS schema_migrations"):
+            if self.versions is None:
+                self.versions = {}
+        elif sql.startswith("SELECT version FROM schema_migrations"):
+            return [(version,) for version in self.versions]
+        elif sql.startswith("INSERT INTO schema_migrations"):
+            version, name = params
+            self.versions[version] = name
+        return None
+
+
+def migration_sql(version):
+    return " ".join(migrations.MIGRATIONS[version - 1][2].split())
+
+
+def test_migration_versions_are_ordered():
+    versions = [version for version, _, _ in migrations.MIGRATIONS]
+    assert versions == list(range(1, len(versions) + 1))
+    assert migrations.LATEST_VERSION == versions[-1]
+
+
+def test_new_database_gets_every_migration():
+    schema = SchemaMigrations()
+    conn = FakeConnection(schema)
+    applied = migrations.migrate(conn)
+    assert applied == [(version, name) for version, name, _ in migrations.MIGRATIONS]
+    assert schema.versions == dict(applied), "each migration is recorded in schema_migrations"
+    assert conn.commits == 1
+    assert any(sql.startswith("SELECT pg_advisory_xact_lock") for sql in conn.statements)
+
+
+def test_applied_versions_are_skipped():
+    schema = SchemaMigrations(versions=[1])
+    conn = FakeConnection(schema)
+    applied = migrations.migrate(conn)
+    assert [version for version, _ in applied] == list(range(2, migrations.LATEST_VERSION + 1))
+    assert migration_sql(1) not in conn.statements
+    assert migration_sql(2) in conn.statements
+    assert schema.versions[1] == "earlier", "an applied migration is not recorded again"
+
+
+def test_current_schema_is_a_no_op():
+    conn = FakeConnection(SchemaMigrations(versions=range(1, migrations.LATEST_VERSION + 1)))
+    assert migrations.migrate(conn) == []
+    assert conn.rollbacks == 1 and conn.commits == 0
+    assert all(sql.startswith("SELECT") for sql in conn.statements)
+    assert not any("pg_advisory_xact_lock" in sql for sql in conn.statements)
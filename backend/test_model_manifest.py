@@ -0,0 +1,64 @@
+"""
+Test the model manifest: publishing and pairing a uint8 export with the model
+version it was exported from.
+
+    python -m pytest test_model_manifest.py
+"""
+import json
+import os
+
+import model_manifest
+
+
+def use_directory(monkeypatch, directory):
+    monkeypatch.setattr(model_manifest, "backend_dir", str(directory))
+    monkeypatch.setattr(model_manifest, "manifest_path", os.path.join(directory, "model_manifest.json"))
+    monkeypatch.setattr(model_manifest, "class_names_path", os.path.join(directory, "class_names.json"))
+    with open(model_manifest.class_names_path, 'w') as f:
+        json.dump(["healthy"], f)
+
+
+def touch(path):
+    with open(path, 'w'):
+        pass
+    return str(path)
+
+
+def test_uint8_export_only_served_for_its_version(monkeypatch, tmp_path):
+    use_directory(monkeypatch, tmp_path)
+    model_path = touch(tmp_path / "plant_disease_model.keras")
+    uint8_path = touch(tmp_path / "plant_disease_model_uint8.keras")
+
+    manifest = model_manifest.publish(model_path, ["healthy", "rust"])
+    assert model_manifest.uint8_model_file(manifest) is None, "an unrecorded export is never served"
+    assert model_manifest.record_uint8_export(model_path, uint8_path, manifest["version"])
+    assert model_manifest.uint8_model_file(model_manifest.load_manifest()) == uint8_path
+
+    # Republishing under the same file name leaves the old export behind
+    manifest = model_manifest.publish(model_path, ["healthy", "rust", "blight"])
+    assert model_manifest.uint8_model_file(manifest) is None
+    # An export started before the publish finished is not recorded for the new version
+    assert not model_manifest.record_uint8_export(model_path, uint8_path, manifest["version"] - 1)
+    assert model_manifest.uint8_model_file(model_manifest.load_manifest()) is None
+
+
+def test_uint8_export_of_another_file_not_recorded(monkeypatch, tmp_path):
+    use_directory(monkeypatch, tmp_path)
+    manifest = model_manifest.publish(touch(tmp_path / "plant_disease_model_v1.keras"), ["healthy"])
+    other = touch(tmp_path / "plant_disease_model_fast.keras")
+    assert not model_manifest.record_uint8_export(other, touch(tmp_path / "fast_uint8.keras"), manifest["version"])
+
+
+def test_staged_models_named_by_published_version(monkeypatch, tmp_path):
+    use_directory(monkeypatch, tmp_path)
+    # A full training run starts, then an incremental run publishes first
+    training = touch(model_manifest.staging_model_path())
+    incremental = touch(model_manifest.staging_model_path())
+    assert training != incremental
+
+    first = model_manifest.publish_staged(incremental, ["healthy", "rust"], source="incremental_train")
+    second = model_manifest.publish_staged(training, ["healthy"], source="train_model")
+    assert (first["model"], second["model"]) == ("plant_disease_model_v1.keras", "plant_disease_model_v2.keras")
+    assert os.path.exists(tmp_path / "plant_disease_model_v1.keras")
+    assert not os.path.exists(training) and not os.path.exists(incremental)
+    assert model_manifest.load_manifest()["version"] == 2
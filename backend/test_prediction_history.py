@@ -0,0 +1,116 @@
+"""
+Test the write-behind prediction history writer against a fake connection:
+flushing by size and by interval, draining on close, retries and dropping.
+
+    python -m pytest test_prediction_history.py
+"""
+import threading
+import time
+
+import pytest
+
+import prediction_history
+from fake_models import FakeConnection
+from prediction_history import PredictionHistoryWriter
+
+
+class FakeDatabase:
+    """Hands out FakeConnections and records every batch inserted through them."""
+
+    def __init__(self, fail_first=0, gate=None):
+        self.batches = []
+        self.connections = 0
+        self.fail_first = fail_first
+        self.gate = gate
+
+    def connect(self):
+        if self.gate is not None:
+            self.gate.wait()
+        self.connections += 1
+        return FakeConnection(self._fail if self.connections <= self.fail_first else self._insert)
+
+    def _insert(self, sql, rows):
+        self.batches.append(len(rows))
+
+    def _fail(self, sql, rows):
+        raise RuntimeError("connection lost")
+
+
+@pytest.fixture(autouse=True)
+def fake_execute_values(monkeypatch):
+    def execute_values(cursor, sql, rows, page_size):
+        cursor.execute(sql, rows)
+
+    monkeypatch.setattr(prediction_history, "execute_values", execute_values)
+
+
+def wait_until(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def record(writer, n):
+    for i in range(n):
+        writer.record(1, "rust", 0.9, [{"class": "rust", "confidence": 0.9}], 3)
+
+
+def test_flush_when_batch_is_full():
+    database = FakeDatabase()
+    writer = PredictionHistoryWriter(database.connect, batch_size=3, flush_interval=60)
+    try:
+        record(writer, 7)
+        assert wait_until(lambda: writer.written == 6)
+        assert database.batches == [3, 3], "the seventh record waits for a full batch or the interval"
+    finally:
+        writer.close()
+    assert writer.written == 7
+
+
+def test_flush_after_interval():
+    database = FakeDatabase()
+    writer = PredictionHistoryWriter(database.connect, batch_size=100, flush_interval=0.1)
+    try:
+        record(writer, 2)
+        assert wait_until(lambda: writer.written == 2)
+        assert database.batches == [2]
+    finally:
+        writer.close()
+
+
+def test_close_drains_queue():
+    database = FakeDatabase()
+    writer = PredictionHistoryWriter(database.connect, batch_size=100, flush_interval=60)
+    record(writer, 5)
+    writer.close()
+    assert writer.written == 5 and database.batches == [5]
+    assert writer.dropped == 0
+
+
+def test_failed_flush_is_retried():
+    database = FakeDatabase(fail_first=1)
+    writer = PredictionHistoryWriter(database.connect, batch_size=2, flush_interval=0.05)
+    try:
+        record(writer, 2)
+        assert wait_until(lambda: writer.written == 2)
+        assert database.connections == 2, "a failed connection is closed and replaced"
+        assert database.batches == [2] and writer.dropped == 0
+    finally:
+        writer.close()
+
+
+def test_records_dropped_when_queue_is_full():
+    gate = threading.Event()
+    database = FakeDatabase(gate=gate)
+    writer = PredictionHistoryWriter(database.connect, batch_size=1, flush_interval=60, max_queue=2)
+    try:
+        record(writer, 1)
+        # The writer thread holds the first record while it waits for a connection
+        assert wait_until(lambda: writer._queue.empty())
+        record(writer, 3)
+        assert writer.dropped == 1
+    finally:
+        gate.set()
+        writer.close()
+    assert writer.written == 3
@@ -0,0 +1,60 @@
+"""
+Test the on-demand profiling helpers: folded stacks, thread stacks, tracemalloc.
+
+    python -m pytest test_profiling.py
+"""
+import threading
+import time
+
+import pytest
+
+import profiling
+
+
+def busy_leaf_work(stop):
+    while not stop.is_set():
+        sum(i * i for i in range(1000))
+
+
+def test_sampling_profiler_folds_stacks():
+    stop = threading.Event()
+    worker = threading.Thread(target=busy_leaf_work, args=(stop,), name="busy-worker")
+    worker.start()
+    try:
+        folded, samples = profiling.SamplingProfiler(interval=0.002).run(0.5)
+    finally:
+        stop.set()
+        worker.join()
+    assert samples > 10
+    lines = folded.splitlines()
+    busy = [line for line in lines if line.startswith("busy-worker;")]
+    assert busy and any("busy_leaf_work (test_profiling.py:" in line for line in busy)
+    # "stack count" per line, as flamegraph.pl expects
+    assert all(line.rsplit(" ", 1)[1].isdigit() for line in lines)
+
+
+def test_one_profile_at_a_time():
+    results = []
+    first = threading.Thread(target=lambda: results.append(profiling.SamplingProfiler().run(0.3)))
+    first.start()
+    time.sleep(0.05)
+    with pytest.raises(RuntimeError, match="already running"):
+        profiling.SamplingProfiler().run(0.1)
+    first.join()
+    assert results
+
+
+def test_thread_stacks_and_tracemalloc():
+    names = [thread["name"] for thread in profiling.thread_stacks()]
+    assert "MainThread" in names
+
+    assert profiling.top_allocations() is None
+    assert profiling.start_tracemalloc()
+    try:
+        keep = [bytearray(100_000) for _ in range(10)]
+        allocations = profiling.top_allocations(limit=5)
+        assert allocations["current_bytes"] >= 1_000_000
+        assert any("test_profiling.py" in entry["traceback"][0] for entry in allocations["top"])
+        del keep
+    finally:
+        profiling.stop_tracemalloc()
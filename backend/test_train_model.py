@@ -0,0 +1,67 @@
+"""
+Test gradient accumulation in train_model.py, including under the
+cpu-mirrored strategy. Training runs in a spawned process because logical
+CPU devices can only be configured before TensorFlow initializes.
+
+    python -m pytest test_train_model.py
+"""
+import multiprocessing
+
+import numpy as np
+
+CONTEXT = multiprocessing.get_context("spawn")
+BATCH = 4
+
+
+def data():
+    rng = np.random.default_rng(0)
+    x = rng.random((2 * BATCH, 5), dtype=np.float32)
+    y = np.eye(3, dtype=np.float32)[np.arange(2 * BATCH) % 3]
+    return x, y
+
+
+def train(strategy_name, accum_steps, optimizer, batches, batch_size=BATCH):
+    """Weights after training on the first `batches` batches, plus the initial weights."""
+    import tensorflow as tf
+
+    import train_model
+
+    strategy = train_model.create_strategy(strategy_name, 2)
+    tf.keras.utils.set_random_seed(0)
+    with strategy.scope():
+        inputs = tf.keras.Input((5,))
+        outputs = tf.keras.layers.Dense(3, activation="softmax")(inputs)
+        if accum_steps > 1:
+            model = train_model.GradientAccumulationModel(inputs=inputs, outputs=outputs, accum_steps=accum_steps)
+        else:
+            model = tf.keras.Model(inputs, outputs)
+        model.compile(optimizer=tf.keras.optimizers.get({"class_name": optimizer, "config": {"learning_rate": 0.5}}),
+                      loss="categorical_crossentropy")
+    initial = model.get_weights()[0]
+    x, y = data()
+    weights = []
+    for batch in range(batches):
+        rows = slice(batch * batch_size, (batch + 1) * batch_size)
+        model.fit(x[rows], y[rows], batch_size=batch_size, epochs=1, shuffle=False, verbose=0)
+        weights.append(model.get_weights()[0])
+    return initial, weights
+
+
+def train_in_subprocess(*args):
+    with CONTEXT.Pool(1) as pool:
+        return pool.apply(train, args)
+
+
+def test_mirrored_accumulation_matches_one_large_batch():
+    initial, accumulated = train_in_subprocess("cpu-mirrored", 2, "SGD", 2)
+    _, [large_batch] = train_in_subprocess("default", 1, "SGD", 1, 2 * BATCH)
+    assert np.array_equal(accumulated[0], initial), "no update before accum_steps batches"
+    np.testing.assert_allclose(accumulated[1], large_batch, rtol=1e-5, atol=1e-6)
+
+
+def test_adam_only_steps_on_accumulation_boundaries():
+    initial, weights = train_in_subprocess("cpu-mirrored", 2, "Adam", 3, BATCH // 2)
+    assert np.array_equal(weights[0], initial)
+    assert not np.array_equal(weights[1], initial)
+    # Adam's momentum would move the weights here if it saw zero gradients
+    assert np.array_equal(weights[2], weights[1])
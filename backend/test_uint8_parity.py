@@ -0,0 +1,92 @@
+"""
+Parity test: uint8-input export vs the current float32-input model, and vs
+freshly built train_model.py architectures after a save and reload.
+
+Run from the backend directory after `python model_export.py`:
+    python test_uint8_parity.py
+    python -m pytest test_uint8_parity.py   # skips the served model if it is missing
+"""
+import os
+import sys
+
+import cv2
+import numpy as np
+import pytest
+from tensorflow import keras
+
+import train_model
+from model_export import build_uint8_model, model_path, uint8_model_path
+
+backend_dir = os.path.dirname(os.path.abspath(__file__))
+leaf_path = os.path.join(backend_dir, "leaf.jpg")
+
+# Softmax outputs; differences come only from float reassociation, if any
+ATOL = 1e-5
+
+
+def load_models():
+    if not os.path.exists(model_path):
+        pytest.skip(f"{model_path} not found; train or publish a model first")
+    model = keras.models.load_model(model_path)
+    if os.path.exists(uint8_model_path):
+        uint8_model = keras.models.load_model(uint8_model_path)
+    else:
+        print(f"⚠️  {uint8_model_path} not found, building the variant in memory")
+        uint8_model = build_uint8_model(model)
+    return model, uint8_model
+
+
+def sample_batch():
+    """leaf.jpg preprocessed like app.py, plus a few random images."""
+    img = cv2.imread(leaf_path)
+    img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+    img = cv2.resize(img, (256, 256))
+    rng = np.random.default_rng(0)
+    noise = rng.integers(0, 256, size=(3, 256, 256, 3), dtype=np.uint8)
+    return np.ascontiguousarray(np.concatenate([img[np.newaxis], noise]), dtype=np.uint8)
+
+
+def check_parity(model, uint8_model, batch):
+    # Current serving path: uint8 array fed to the float32 model (cast inside Keras)
+    reference = model.predict(batch, verbose=0)
+    exported = np.asarray(uint8_model.predict_on_batch(batch))
+
+    max_diff = float(np.max(np.abs(reference - exported)))
+    print(f"Max |diff|: {max_diff:.2e}")
+    print(f"Reference argmax: {np.argmax(reference, axis=1)}")
+    print(f"Exported argmax:  {np.argmax(exported, axis=1)}")
+
+    assert exported.shape == reference.shape
+    assert np.array_equal(np.argmax(reference, axis=1), np.argmax(exported, axis=1))
+    assert np.allclose(reference, exported, atol=ATOL)
+
+
+def test_uint8_parity():
+    model, uint8_model = load_models()
+    assert uint8_model.inputs[0].dtype.name == "uint8"
+    check_parity(model, uint8_model, sample_batch())
+
+
+@pytest.mark.parametrize("arch", ["cnn", "separable", "fast"])
+def test_uint8_parity_after_reload(arch, tmp_path):
+    model = train_model.build_model(arch, 5)
+    path = str(tmp_path / "model.keras")
+    uint8_path = str(tmp_path / "model_uint8.keras")
+    model.save(path)
+    build_uint8_model(keras.models.load_model(path)).save(uint8_path)
+    model = keras.models.load_model(path)
+    uint8_model = keras.models.load_model(uint8_path)
+    assert uint8_model.inputs[0].dtype.name == "uint8"
+    check_parity(model, uint8_model, sample_batch())
+
+
+if __name__ == "__main__":
+    try:
+        test_uint8_parity()
+    except pytest.skip.Exception as e:
+        print(f"❌ {e.msg}")
+        sys.exit(1)
+    except AssertionError:
+        print("❌ uint8 model does NOT match the current model!")
+        sys.exit(1)
+    print("✅ uint8 model matches the current model!")
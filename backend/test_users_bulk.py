@@ -0,0 +1,67 @@
+"""
+Test CSV validation for the bulk user import, the rows it hands to COPY and
+the counts it derives from the INSERT's RETURNING rows (canned here; the
+DISTINCT ON / ON CONFLICT semantics are PostgreSQL's own).
+
+    python -m pytest test_users_bulk.py
+"""
+import csv
+import io
+
+import pytest
+
+from fake_models import FakeConnection
+from users_bulk import CONFLICT_ACTIONS, IMPORT_SQL, import_users, parse_users_csv
+
+
+def test_parse_users_csv():
+    rows, errors = parse_users_csv(io.StringIO(
+        "name,email,password\n"
+        "Asha, Asha@Coop.org ,secret1\n"
+        "Short,short@coop.org,123\n"
+        ",,\n"
+    ))
+    assert rows == [(2, "Asha", "asha@coop.org", "secret1")]
+    assert [line for line, _ in errors] == [3, 4]
+
+
+def test_missing_columns_rejected():
+    with pytest.raises(ValueError, match="password"):
+        parse_users_csv(io.StringIO("name,email\nA,a@coop.org\n"))
+
+
+ROWS = [
+    (2, "Asha", "asha@coop.org", "secret1"),
+    (3, "Ben", "ben@coop.org", "secret2"),
+    (4, "Asha again", "asha@coop.org", "secret3"),
+    (5, "Chen", "chen@coop.org", "secret4"),
+]
+
+
+def returning(*inserted):
+    """Answer IMPORT_SQL with the given (xmax = 0) RETURNING rows."""
+    def respond(sql, params):
+        return [(flag,) for flag in inserted] if sql.startswith("INSERT INTO users") else None
+    return respond
+
+
+def test_import_copies_rows_and_uses_conflict_action():
+    conn = FakeConnection(returning(True, True, True))
+    import_users(conn, ROWS)
+    (copy_sql, data), = conn.copies
+    assert copy_sql.startswith("COPY users_import (line, name, email, password) FROM STDIN")
+    assert [tuple(row) for row in csv.reader(io.StringIO(data))] == [tuple(map(str, row)) for row in ROWS]
+    assert conn.statements[-1] == " ".join(IMPORT_SQL.format(action=CONFLICT_ACTIONS["skip"]).split())
+    assert conn.commits == 1
+
+
+def test_import_counts_inserted_and_skipped():
+    # asha and chen inserted, ben already registered
+    summary = import_users(FakeConnection(returning(True, True)), ROWS)
+    assert summary == {"rows": 4, "duplicates_in_file": 1, "inserted": 2, "updated": 0, "skipped_existing": 1}
+
+
+def test_import_counts_updated():
+    # asha inserted, ben and chen updated
+    summary = import_users(FakeConnection(returning(True, False, False)), ROWS, on_conflict="update")
+    assert summary == {"rows": 4, "duplicates_in_file": 1, "inserted": 1, "updated": 2, "skipped_existing": 0}
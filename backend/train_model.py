@@ -1,155 +1,598 @@
 """
 Train the plant disease detection CNN model.
 This script loads the training data and trains a model to replace the mock model.
+
+Architectures (--arch):
+    cnn        original 5-block CNN with a Flatten -> Dense(512) head
+    gap        same conv backbone, GlobalAveragePooling2D -> Dense(512) head
+    separable  depthwise-separable conv backbone with a GlobalAveragePooling2D head
+    mobilenet  frozen ImageNet MobileNetV2 backbone with a GlobalAveragePooling2D head
+    fast       small separable network on a 96x96 downscale; first stage of the
+               confidence-gated cascade (see cascade.py)
+
+Usage:
+    python train_model.py                          # train the original CNN
+    python train_model.py --arch gap               # train a single option
+    python train_model.py --compare                # train every option into compare/, report side by side
+    python train_model.py --compare --archs cnn gap separable
+    python train_model.py --arch fast --output plant_disease_model_fast.keras   # cascade first stage
+
+Faster training on CPU build servers:
+    python train_model.py --strategy cpu-mirrored --replicas 4   # split each batch over local cores
+    python train_model.py --strategy multi-worker                # one process per TF_CONFIG task
+    python train_model.py --mixed-precision                      # bfloat16 compute where the CPU supports it
+    python train_model.py --accum-steps 4                        # apply gradients every 4 batches
+
+Train on a cleaned file list from audit_dataset.py instead of every file on disk:
+    python train_model.py --dataset-manifest dataset_manifest.json
+
+Interrupted runs resume from the last completed epoch saved in training_checkpoints/.
 """
 
+import argparse
 import os
+import time
 import numpy as np
 import tensorflow as tf
 from tensorflow.keras.models import Sequential
-from tensorflow.keras.layers import Conv2D, MaxPooling2D, Flatten, Dense, Activation, Dropout
+from tensorflow.keras.layers import (
+    Conv2D, SeparableConv2D, MaxPooling2D, Flatten, GlobalAveragePooling2D,
+    Dense, Activation, Dropout, Rescaling, Resizing, Input,
+)
 from tensorflow.keras.optimizers import Adam
-from tensorflow.keras.callbacks import EarlyStopping, ReduceLROnPlateau
+from tensorflow.keras.callbacks import EarlyStopping, ReduceLROnPlateau, BackupAndRestore, Callback
 import json
 
+import model_manifest
+
 # Define paths
 backend_dir = os.path.dirname(os.path.abspath(__file__))
 dataset_dir = os.path.join(backend_dir, "..", "splitted_dataset")
-model_output_path = os.path.join(backend_dir, "plant_disease_model.keras")
-class_names_path = os.path.join(backend_dir, "class_names.json")
+checkpoint_dir = os.path.join(backend_dir, "training_checkpoints")
+# --compare outputs; kept apart from served files such as the cascade's plant_disease_model_fast.keras
+compare_dir = os.path.join(backend_dir, "compare")
 
 # Configuration
 IMG_SIZE = (256, 256)
+FAST_IMG_SIZE = (96, 96)  # the fast cascade model downscales inside the graph
 BATCH_SIZE = 8
 EPOCHS = 20
 
-print("=" * 60)
-print("🌿 Plant Disease Model Training")
-print("=" * 60)
-
-# Load training data
-print("\n📁 Loading training data...")
-train_ds = tf.keras.utils.image_dataset_from_directory(
-    os.path.join(dataset_dir, "train"),
-    labels="inferred",
-    label_mode="categorical",
-    batch_size=BATCH_SIZE,
-    image_size=IMG_SIZE,
-    shuffle=True
-)
+ARCHITECTURES = ("cnn", "gap", "separable", "mobilenet", "fast")
+STRATEGIES = ("default", "cpu-mirrored", "multi-worker")
 
-print("\n📁 Loading validation data...")
-val_ds = tf.keras.utils.image_dataset_from_directory(
-    os.path.join(dataset_dir, "val"),
-    labels="inferred",
-    label_mode="categorical",
-    batch_size=BATCH_SIZE,
-    image_size=IMG_SIZE,
-    shuffle=True
-)
+# Batch-1 CPU latency measurement
+LATENCY_WARMUP = 5
+LATENCY_RUNS = 50
 
-# Get class names from the training dataset
-class_names = train_ds.class_names
-num_classes = len(class_names)
-
-print(f"\n✅ Found {num_classes} classes:")
-for i, name in enumerate(class_names):
-    print(f"  {i:2d}: {name}")
-
-# Save class names to JSON
-print(f"\n💾 Saving class names to {class_names_path}...")
-with open(class_names_path, 'w') as f:
-    json.dump(class_names, f, indent=2)
-print("✅ Class names saved!")
-
-# Build the model
-print("\n🏗️  Building the CNN model...")
-model = Sequential([
-    Conv2D(32, (3, 3), input_shape=(256, 256, 3)),
-    Activation('relu'),
-    MaxPooling2D(pool_size=(2, 2)),
-    
-    Conv2D(64, (3, 3)),
-    Activation('relu'),
-    MaxPooling2D(pool_size=(2, 2)),
-    
-    Conv2D(128, (3, 3)),
-    Activation('relu'),
-    MaxPooling2D(pool_size=(2, 2)),
-    
-    Conv2D(256, (3, 3)),
-    Activation('relu'),
-    MaxPooling2D(pool_size=(2, 2)),
-    
-    Conv2D(512, (3, 3)),
-    Activation('relu'),
-    MaxPooling2D(pool_size=(2, 2)),
-    
-    Dropout(0.25),
-    Flatten(),
-    Dense(512),
-    Activation('relu'),
-    
-    Dropout(0.5),
-    Dense(num_classes),
-    Activation('softmax')
-])
-
-# Compile the model
-print("\n⚙️  Compiling the model...")
-model.compile(
-    loss='categorical_crossentropy',
-    optimizer=Adam(learning_rate=0.0001),
-    metrics=['accuracy']
-)
 
-print("\n📊 Model summary:")
-model.summary()
-
-# Set up callbacks
-callbacks = [
-    EarlyStopping(monitor="val_loss", patience=5, restore_best_weights=True),
-    ReduceLROnPlateau(monitor="val_loss", factor=0.2, patience=3, min_lr=1e-6),
-]
-
-# Train the model
-print("\n🚀 Training the model...")
-print(f"   Epochs: {EPOCHS}")
-print(f"   Batch size: {BATCH_SIZE}")
-print(f"   Training samples: {len(train_ds) * BATCH_SIZE}")
-print(f"   Validation samples: {len(val_ds) * BATCH_SIZE}")
-
-history = model.fit(
-    train_ds,
-    epochs=EPOCHS,
-    validation_data=val_ds,
-    callbacks=callbacks,
-    verbose=1
-)
+def load_split(split, shuffle, batch_size=BATCH_SIZE, dataset_manifest=None):
+    """
+    Load one split of splitted_dataset with the same settings as the notebook.
 
-# Evaluate on test set if available
-test_dir = os.path.join(dataset_dir, "test")
-if os.path.exists(test_dir):
-    print("\n📁 Loading test data...")
-    test_ds = tf.keras.utils.image_dataset_from_directory(
-        test_dir,
+    With a cleaned manifest from audit_dataset.py only its files are used;
+    decoding, resizing, labels and class_names match image_dataset_from_directory.
+    """
+    if dataset_manifest is not None:
+        return _load_manifest_split(dataset_manifest, split, shuffle, batch_size)
+    return tf.keras.utils.image_dataset_from_directory(
+        os.path.join(dataset_dir, split),
         labels="inferred",
         label_mode="categorical",
-        batch_size=BATCH_SIZE,
+        batch_size=batch_size,
         image_size=IMG_SIZE,
-        shuffle=False
+        shuffle=shuffle
     )
-    
-    print("\n🧪 Evaluating on test set...")
-    test_loss, test_acc = model.evaluate(test_ds, verbose=0)
-    print(f"   Test Accuracy: {test_acc:.4f}")
-    print(f"   Test Loss: {test_loss:.4f}")
-
-# Save the model
-print(f"\n💾 Saving trained model to {model_output_path}...")
-model.save(model_output_path)
-print("✅ Model trained and saved successfully!")
-
-print("\n" + "=" * 60)
-print("✨ Training complete! Restart your Flask app to use the new model.")
-print("=" * 60)
+
+
+def _load_manifest_split(dataset_manifest, split, shuffle, batch_size):
+    from audit_dataset import manifest_files
+
+    class_names = dataset_manifest["class_names"]
+    files = manifest_files(dataset_manifest, split)
+    paths = [path for path, _ in files]
+    labels = tf.one_hot([class_names.index(name) for _, name in files], len(class_names))
+
+    def load(path, label):
+        image = tf.io.decode_image(tf.io.read_file(path), channels=3, expand_animations=False)
+        image = tf.image.resize(image, IMG_SIZE)
+        image.set_shape(IMG_SIZE + (3,))
+        return image, label
+
+    dataset = tf.data.Dataset.from_tensor_slices((paths, labels))
+    if shuffle:
+        dataset = dataset.shuffle(len(paths), reshuffle_each_iteration=True)
+    dataset = dataset.map(load, num_parallel_calls=tf.data.AUTOTUNE)
+    dataset = dataset.batch(batch_size).prefetch(tf.data.AUTOTUNE)
+    dataset.class_names = class_names
+    print(f"Using {len(paths)} files from the dataset manifest for {split}.")
+    return dataset
+
+
+def cpu_supports_bfloat16():
+    """True if the CPU has native bfloat16 instructions (AVX512-BF16 or AMX-BF16)."""
+    try:
+        with open("/proc/cpuinfo") as f:
+            flags = f.read()
+    except OSError:
+        return False
+    return "avx512_bf16" in flags or "amx_bf16" in flags
+
+
+def create_strategy(name, replicas):
+    """
+    Create the distribution strategy. Must run before any other TensorFlow op.
+
+    cpu-mirrored splits the physical CPU into `replicas` logical devices and
+    mirrors the model across them, so each batch is computed in parallel by
+    several op schedulers instead of one. multi-worker expects TF_CONFIG to
+    describe the cluster (one process per task, on one or several hosts).
+    """
+    if name == "cpu-mirrored":
+        cpus = tf.config.list_physical_devices("CPU")
+        tf.config.set_logical_device_configuration(
+            cpus[0], [tf.config.LogicalDeviceConfiguration() for _ in range(replicas)]
+        )
+        devices = [d.name for d in tf.config.list_logical_devices("CPU")]
+        return tf.distribute.MirroredStrategy(devices=devices)
+    if name == "multi-worker":
+        return tf.distribute.MultiWorkerMirroredStrategy()
+    return tf.distribute.get_strategy()
+
+
+def is_chief():
+    """Only the chief task of a multi-worker run writes the final model and class names."""
+    tf_config = json.loads(os.environ.get("TF_CONFIG", "{}"))
+    task = tf_config.get("task", {})
+    if not task:
+        return True
+    if task.get("type") == "chief":
+        return True
+    return task.get("type") == "worker" and task.get("index") == 0 and "chief" not in tf_config.get("cluster", {})
+
+
+class GradientAccumulationModel(tf.keras.Model):
+    """
+    Functional wrapper that applies gradients once every `accum_steps` batches.
+
+    Gradients are summed into per-replica accumulators and divided by
+    `accum_steps`, which emulates a batch `accum_steps` times larger without
+    the memory cost. The wrapper shares its layers with the wrapped model, so
+    the plain model is what gets saved.
+    """
+
+    def __init__(self, *args, accum_steps=1, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.accum_steps = accum_steps
+        self._accum_counter = tf.Variable(
+            0, dtype=tf.int64, trainable=False,
+            synchronization=tf.VariableSynchronization.ON_READ,
+            aggregation=tf.VariableAggregation.ONLY_FIRST_REPLICA,
+        )
+        self._accum_grads = [
+            tf.Variable(
+                tf.zeros_like(v), trainable=False,
+                synchronization=tf.VariableSynchronization.ON_READ,
+                aggregation=tf.VariableAggregation.SUM,
+            )
+            for v in self.trainable_variables
+        ]
+
+    def _apply_accumulated(self):
+        self.optimizer.apply_gradients(zip(
+            [g.read_value() for g in self._accum_grads], self.trainable_variables
+        ))
+        for g in self._accum_grads:
+            g.assign(tf.zeros_like(g))
+
+    def train_step(self, data):
+        """Accumulate one batch; the update itself runs in make_train_function()."""
+        x, y = data
+        with tf.GradientTape() as tape:
+            y_pred = self(x, training=True)
+            loss = self.compiled_loss(y, y_pred, regularization_losses=self.losses)
+            scaled_loss = loss / self.accum_steps
+        grads = tape.gradient(scaled_loss, self.trainable_variables)
+        for acc, grad in zip(self._accum_grads, grads):
+            acc.assign_add(tf.cast(grad, acc.dtype))
+        self._accum_counter.assign_add(1)
+        self.compiled_metrics.update_state(y, y_pred)
+        return {m.name: m.result() for m in self.metrics}
+
+    def make_train_function(self, force=False):
+        """
+        Run the accumulated update as its own step after every `accum_steps` batches.
+
+        The update cannot sit behind a tf.cond inside train_step: under a
+        distribution strategy apply_gradients aggregates across replicas with
+        merge_call, which is not allowed inside a control-flow branch. Masking
+        the gradients and applying every batch is not equivalent either, since
+        Adam keeps moving the weights on zero gradients through its momentum.
+        """
+        if self.train_function is not None and not force:
+            return self.train_function
+        accumulate = super().make_train_function(force=force)
+        apply_accumulated = tf.function(lambda: self.distribute_strategy.run(self._apply_accumulated))
+
+        def train_function(iterator):
+            logs = accumulate(iterator)
+            if int(self._accum_counter.read_value()) % self.accum_steps == 0:
+                apply_accumulated()
+            return logs
+
+        self.train_function = train_function
+        return train_function
+
+
+class ThroughputCallback(Callback):
+    """Print wall-clock time and images/sec per epoch and for the whole run."""
+
+    def __init__(self, global_batch_size):
+        super().__init__()
+        self.global_batch_size = global_batch_size
+        self.wall_clock = 0.0
+        self.images_per_sec = 0.0
+
+    def on_train_begin(self, logs=None):
+        self.train_start = time.perf_counter()
+        self.total_steps = 0
+
+    def on_epoch_begin(self, epoch, logs=None):
+        self.epoch_start = time.perf_counter()
+        self.epoch_steps = 0
+
+    def on_train_batch_end(self, batch, logs=None):
+        self.epoch_steps += 1
+
+    def on_epoch_end(self, epoch, logs=None):
+        elapsed = time.perf_counter() - self.epoch_start
+        self.total_steps += self.epoch_steps
+        images = self.epoch_steps * self.global_batch_size
+        print(f"   ⏱️  Epoch {epoch + 1}: {elapsed:.1f}s, {images / elapsed:.1f} images/sec")
+
+    def on_train_end(self, logs=None):
+        self.wall_clock = time.perf_counter() - self.train_start
+        images = self.total_steps * self.global_batch_size
+        self.images_per_sec = images / self.wall_clock if self.wall_clock else 0.0
+        print(f"   ⏱️  Training wall-clock: {self.wall_clock:.1f}s, {self.images_per_sec:.1f} images/sec")
+
+
+def _conv_backbone():
+    """The original five Conv2D/MaxPooling2D blocks on raw 0-255 pixels."""
+    layers = []
+    for i, filters in enumerate((32, 64, 128, 256, 512)):
+        if i == 0:
+            layers.append(Conv2D(filters, (3, 3), input_shape=(256, 256, 3)))
+        else:
+            layers.append(Conv2D(filters, (3, 3)))
+        layers += [Activation('relu'), MaxPooling2D(pool_size=(2, 2))]
+    return layers
+
+
+def _separable_backbone():
+    """
+    Depthwise-separable version of the backbone.
+
+    A regular Conv2D stem keeps full cross-channel mixing on the RGB input;
+    the remaining blocks use SeparableConv2D, which needs roughly 1/9 of the
+    multiply-adds and weights of a 3x3 Conv2D with the same filter count.
+    """
+    layers = [
+        Rescaling(1.0 / 255, input_shape=(256, 256, 3)),
+        Conv2D(32, (3, 3), strides=2, padding='same'),
+        Activation('relu'),
+    ]
+    for filters in (64, 128, 256, 512):
+        layers += [
+            SeparableConv2D(filters, (3, 3), padding='same'),
+            Activation('relu'),
+            MaxPooling2D(pool_size=(2, 2)),
+        ]
+    return layers
+
+
+def _fast_backbone():
+    """
+    Small separable network for the cascade's first stage.
+
+    It still takes the full 256x256 input and resizes in the graph, so both
+    cascade stages share one preprocessed batch.
+    """
+    layers = [
+        Resizing(*FAST_IMG_SIZE, input_shape=(256, 256, 3)),
+        Rescaling(1.0 / 255),
+        Conv2D(16, (3, 3), strides=2, padding='same'),
+        Activation('relu'),
+    ]
+    for filters in (32, 64, 128, 256):
+        layers += [
+            SeparableConv2D(filters, (3, 3), padding='same'),
+            Activation('relu'),
+            MaxPooling2D(pool_size=(2, 2)),
+        ]
+    return layers
+
+
+def _classifier_head(num_classes):
+    """Dense(512) head shared by the full-size options (its activations are the image embedding)."""
+    return [
+        Dense(512),
+        Activation('relu'),
+        Dropout(0.5),
+        Dense(num_classes),
+        # Keep the softmax in float32 under a mixed-precision policy
+        Activation('softmax', dtype='float32'),
+    ]
+
+
+def build_model(arch, num_classes):
+    """Build the model for one of ARCHITECTURES. Every option takes raw 0-255 pixels."""
+    if arch == "cnn":
+        return Sequential(
+            _conv_backbone() + [Dropout(0.25), Flatten()] + _classifier_head(num_classes)
+        )
+
+    if arch == "gap":
+        return Sequential(
+            _conv_backbone() + [Dropout(0.25), GlobalAveragePooling2D()] + _classifier_head(num_classes)
+        )
+
+    if arch == "separable":
+        return Sequential(
+            _separable_backbone() + [Dropout(0.25), GlobalAveragePooling2D()] + _classifier_head(num_classes)
+        )
+
+    if arch == "mobilenet":
+        backbone = tf.keras.applications.MobileNetV2(
+            input_shape=(256, 256, 3), include_top=False, weights="imagenet"
+        )
+        backbone.trainable = False
+        return Sequential(
+            [
+                Input(shape=(256, 256, 3)),
+                # MobileNetV2 expects [-1, 1] inputs
+                Rescaling(1.0 / 127.5, offset=-1.0),
+                backbone,
+                GlobalAveragePooling2D(),
+            ] + _classifier_head(num_classes)
+        )
+
+    if arch == "fast":
+        # No Dense(512): the fast model only has to be confident on easy images
+        return Sequential(
+            _fast_backbone() + [
+                GlobalAveragePooling2D(),
+                Dropout(0.25),
+                Dense(num_classes),
+                Activation('softmax', dtype='float32'),
+            ]
+        )
+
+    raise ValueError(f"Unknown architecture '{arch}', expected one of {ARCHITECTURES}")
+
+
+def model_file_size(path):
+    """Size in bytes of a saved model (a single file or a SavedModel directory)."""
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            total += os.path.getsize(os.path.join(root, name))
+    return total
+
+
+def measure_cpu_latency(model):
+    """Median batch-1 CPU inference latency in milliseconds."""
+    image = np.random.randint(0, 256, size=(1,) + IMG_SIZE + (3,)).astype(np.float32)
+    timings = []
+    with tf.device("/CPU:0"):
+        for i in range(LATENCY_WARMUP + LATENCY_RUNS):
+            start = time.perf_counter()
+            model.predict_on_batch(image)
+            if i >= LATENCY_WARMUP:
+                timings.append((time.perf_counter() - start) * 1000)
+    return float(np.median(timings))
+
+
+def train_and_evaluate(arch, num_classes, train_ds, val_ds, eval_ds, output_path, epochs,
+                       strategy, global_batch_size, accum_steps=1):
+    """Train one architecture, save it and return its report row."""
+    print(f"\n🏗️  Building the '{arch}' model...")
+    with strategy.scope():
+        model = build_model(arch, num_classes)
+        trainer = model
+        if accum_steps > 1:
+            trainer = GradientAccumulationModel(
+                inputs=model.inputs, outputs=model.outputs, accum_steps=accum_steps
+            )
+
+        # Compile the model
+        print("\n⚙️  Compiling the model...")
+        trainer.compile(
+            loss='categorical_crossentropy',
+            optimizer=Adam(learning_rate=0.0001),
+            metrics=['accuracy']
+        )
+
+    print("\n📊 Model summary:")
+    model.summary()
+
+    # Set up callbacks. BackupAndRestore resumes an interrupted run from its
+    # last completed epoch and removes the backup once training finishes.
+    throughput = ThroughputCallback(global_batch_size)
+    callbacks = [
+        BackupAndRestore(backup_dir=os.path.join(checkpoint_dir, arch)),
+        EarlyStopping(monitor="val_loss", patience=5, restore_best_weights=True),
+        ReduceLROnPlateau(monitor="val_loss", factor=0.2, patience=3, min_lr=1e-6),
+        throughput,
+    ]
+
+    # Train the model
+    print("\n🚀 Training the model...")
+    print(f"   Epochs: {epochs}")
+    print(f"   Replicas: {strategy.num_replicas_in_sync}")
+    print(f"   Global batch size: {global_batch_size}")
+    if accum_steps > 1:
+        print(f"   Gradient accumulation: {accum_steps} steps "
+              f"(effective batch {global_batch_size * accum_steps})")
+    print(f"   Training samples: {len(train_ds) * global_batch_size}")
+    print(f"   Validation samples: {len(val_ds) * global_batch_size}")
+
+    trainer.fit(
+        train_ds,
+        epochs=epochs,
+        validation_data=val_ds,
+        callbacks=callbacks,
+        verbose=1
+    )
+
+    print("\n🧪 Evaluating...")
+    eval_loss, eval_acc = trainer.evaluate(eval_ds, verbose=0)
+    print(f"   Accuracy: {eval_acc:.4f}")
+    print(f"   Loss: {eval_loss:.4f}")
+
+    # Save the model (non-chief workers must still save, but to a scratch path)
+    if not is_chief():
+        output_path = os.path.join(checkpoint_dir, f"worker_{os.getpid()}_{arch}.keras")
+    print(f"\n💾 Saving trained model to {output_path}...")
+    model.save(output_path)
+
+    return {
+        "arch": arch,
+        "params": model.count_params(),
+        "size_mb": model_file_size(output_path) / (1024 * 1024),
+        "latency_ms": measure_cpu_latency(model),
+        "accuracy": eval_acc,
+        "wall_clock_s": throughput.wall_clock,
+        "images_per_sec": throughput.images_per_sec,
+    }
+
+
+def print_report(rows, eval_split):
+    """Print the per-architecture comparison table."""
+    print("\n📊 Architecture comparison")
+    print(
+        f"   {'arch':<10} {'params':>12} {'size (MB)':>10} {'CPU b=1 (ms)':>13} "
+        f"{eval_split + ' acc':>10} {'train (s)':>10} {'img/s':>8}"
+    )
+    for row in rows:
+        print(
+            f"   {row['arch']:<10} {row['params']:>12,} {row['size_mb']:>10.1f} "
+            f"{row['latency_ms']:>13.1f} {row['accuracy']:>10.4f} "
+            f"{row['wall_clock_s']:>10.1f} {row['images_per_sec']:>8.1f}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train the plant disease detection model")
+    parser.add_argument("--arch", choices=ARCHITECTURES, default="cnn",
+                        help="Architecture to train (default: the original CNN)")
+    parser.add_argument("--compare", action="store_true",
+                        help="Train every architecture in --archs and report them side by side")
+    parser.add_argument("--archs", nargs="+", choices=ARCHITECTURES, default=list(ARCHITECTURES),
+                        help="Architectures to train with --compare")
+    parser.add_argument("--epochs", type=int, default=EPOCHS)
+    parser.add_argument("--strategy", choices=STRATEGIES, default="default",
+                        help="Distribution strategy across local cores or processes")
+    parser.add_argument("--replicas", type=int, default=os.cpu_count() // 2 or 1,
+                        help="Logical CPU devices for --strategy cpu-mirrored")
+    parser.add_argument("--mixed-precision", action="store_true",
+                        help="Use a mixed_bfloat16 policy if the CPU supports bfloat16")
+    parser.add_argument("--accum-steps", type=int, default=1,
+                        help="Accumulate gradients over this many batches before applying them")
+    parser.add_argument("--dataset-manifest",
+                        help="Cleaned file list from audit_dataset.py --write-manifest")
+    parser.add_argument("--output",
+                        help="Save the trained model here instead of publishing it as the served model")
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("🌿 Plant Disease Model Training")
+    print("=" * 60)
+
+    strategy = create_strategy(args.strategy, args.replicas)
+    global_batch_size = BATCH_SIZE * strategy.num_replicas_in_sync
+    print(f"\n🖥️  Strategy: {args.strategy} ({strategy.num_replicas_in_sync} replica(s))")
+
+    if args.mixed_precision:
+        if cpu_supports_bfloat16():
+            tf.keras.mixed_precision.set_global_policy("mixed_bfloat16")
+            print("✅ Mixed precision: mixed_bfloat16")
+        else:
+            print("⚠️  CPU has no native bfloat16 support, training in float32")
+
+    dataset_manifest = None
+    if args.dataset_manifest:
+        from audit_dataset import load_dataset_manifest
+        dataset_manifest = load_dataset_manifest(args.dataset_manifest)
+        print(f"\n🧹 Dataset manifest {args.dataset_manifest}: "
+              f"{dataset_manifest['dropped']} audited files left out")
+
+    # Load training data
+    print("\n📁 Loading training data...")
+    train_ds = load_split("train", shuffle=True, batch_size=global_batch_size,
+                          dataset_manifest=dataset_manifest)
+
+    print("\n📁 Loading validation data...")
+    val_ds = load_split("val", shuffle=True, batch_size=global_batch_size,
+                        dataset_manifest=dataset_manifest)
+
+    # Get class names from the training dataset
+    class_names = train_ds.class_names
+    num_classes = len(class_names)
+
+    print(f"\n✅ Found {num_classes} classes:")
+    for i, name in enumerate(class_names):
+        print(f"  {i:2d}: {name}")
+
+    # Evaluate on test set if available, otherwise on the validation set
+    test_dir = os.path.join(dataset_dir, "test")
+    has_test = bool(dataset_manifest["splits"].get("test")) if dataset_manifest else os.path.exists(test_dir)
+    if has_test:
+        print("\n📁 Loading test data...")
+        eval_ds = load_split("test", shuffle=False, batch_size=global_batch_size,
+                             dataset_manifest=dataset_manifest)
+        eval_split = "test"
+    else:
+        eval_ds, eval_split = val_ds, "val"
+
+    if args.compare:
+        # Keep the served models (and the cascade's fast model) untouched; each option gets its own file
+        os.makedirs(compare_dir, exist_ok=True)
+        rows = []
+        for arch in args.archs:
+            output_path = os.path.join(compare_dir, f"plant_disease_model_{arch}.keras")
+            rows.append(train_and_evaluate(arch, num_classes, train_ds, val_ds, eval_ds,
+                                           output_path, args.epochs, strategy,
+                                           global_batch_size, args.accum_steps))
+            tf.keras.backend.clear_session()
+        print_report(rows, eval_split)
+        print("\n✅ To serve an option, retrain it with --arch <name> (without --compare) to publish it.")
+    elif args.output:
+        row = train_and_evaluate(args.arch, num_classes, train_ds, val_ds, eval_ds,
+                                 os.path.abspath(args.output), args.epochs, strategy,
+                                 global_batch_size, args.accum_steps)
+        print_report([row], eval_split)
+        print(f"\n✅ Saved to {args.output} (the served model is unchanged).")
+    else:
+        # A new file per version: the served file is never overwritten while in use.
+        # The version is only taken when publishing, as other runs may publish first.
+        output_path = model_manifest.staging_model_path()
+        row = train_and_evaluate(args.arch, num_classes, train_ds, val_ds, eval_ds,
+                                 output_path, args.epochs, strategy,
+                                 global_batch_size, args.accum_steps)
+        print_report([row], eval_split)
+        if is_chief():
+            # Also writes class_names.json; --output and --compare leave the served classes alone
+            manifest = model_manifest.publish_staged(output_path, class_names,
+                                                     source=f"train_model --arch {args.arch}")
+            print(f"✅ Model v{manifest['version']} trained and saved successfully!")
+
+    print("\n" + "=" * 60)
+    print("✨ Training complete! Restart your Flask app to use the new model.")
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    main()
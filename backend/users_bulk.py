@@ -0,0 +1,157 @@
+"""
+Bulk user import and export, e.g. for onboarding a partner cooperative.
+
+Import reads a CSV with name,email,password columns, applies the /signup
+validation, streams the valid rows into a temporary table with one COPY and
+inserts them with a single INSERT ... SELECT ... ON CONFLICT (email). Existing
+emails are skipped (or updated with --on-conflict update). Repeated emails
+inside the file keep their first row.
+
+Export streams the users table to CSV with COPY ... TO STDOUT.
+
+Usage:
+    python users_bulk.py import partner_users.csv
+    python users_bulk.py import partner_users.csv --on-conflict update
+    python users_bulk.py export users.csv
+    python users_bulk.py export users.csv --include-passwords
+"""
+
+import argparse
+import csv
+import io
+import os
+import sys
+
+import psycopg2
+from dotenv import load_dotenv
+
+import migrations
+
+REQUIRED_COLUMNS = ("name", "email", "password")
+MIN_PASSWORD_LENGTH = 6
+MAX_FIELD_LENGTH = 255
+
+IMPORT_SQL = """
+    INSERT INTO users (name, email, password)
+    SELECT DISTINCT ON (email) name, email, password
+    FROM users_import
+    ORDER BY email, line
+    ON CONFLICT (email) {action}
+    RETURNING (xmax = 0) AS inserted
+"""
+CONFLICT_ACTIONS = {
+    "skip": "DO NOTHING",
+    "update": "DO UPDATE SET name = EXCLUDED.name, password = EXCLUDED.password",
+}
+
+
+def parse_users_csv(file):
+    """
+    Validated (line, name, email, password) rows and (line, error) pairs.
+
+    Emails are stripped and lower-cased like /signup does.
+    """
+    reader = csv.DictReader(file)
+    missing = [column for column in REQUIRED_COLUMNS if column not in (reader.fieldnames or [])]
+    if missing:
+        raise ValueError(f"CSV is missing columns: {', '.join(missing)}")
+
+    rows, errors = [], []
+    for record in reader:
+        line = reader.line_num
+        name = (record["name"] or "").strip()
+        email = (record["email"] or "").strip().lower()
+        password = record["password"] or ""
+        if not name or not email or not password:
+            errors.append((line, "All fields are required"))
+        elif len(password) < MIN_PASSWORD_LENGTH:
+            errors.append((line, f"Password must be at least {MIN_PASSWORD_LENGTH} characters"))
+        elif max(len(name), len(email), len(password)) > MAX_FIELD_LENGTH:
+            errors.append((line, f"Fields are limited to {MAX_FIELD_LENGTH} characters"))
+        else:
+            rows.append((line, name, email, password))
+    return rows, errors
+
+
+def import_users(conn, rows, on_conflict="skip"):
+    """Insert validated rows in one transaction; returns inserted/updated/skipped counts."""
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    buffer.seek(0)
+
+    with conn.cursor() as cursor:
+        cursor.execute("""
+            CREATE TEMP TABLE users_import (
+                line INTEGER,
+                name VARCHAR(255),
+                email VARCHAR(255),
+                password VARCHAR(255)
+            ) ON COMMIT DROP
+        """)
+        cursor.copy_expert(
+            "COPY users_import (line, name, email, password) FROM STDIN WITH (FORMAT csv)", buffer
+        )
+        cursor.execute(IMPORT_SQL.format(action=CONFLICT_ACTIONS[on_conflict]))
+        results = [row[0] for row in cursor.fetchall()]
+    conn.commit()
+
+    unique_emails = len({row[2] for row in rows})
+    inserted = sum(results)
+    updated = len(results) - inserted
+    return {
+        "rows": len(rows),
+        "duplicates_in_file": len(rows) - unique_emails,
+        "inserted": inserted,
+        "updated": updated,
+        "skipped_existing": unique_emails - inserted - updated,
+    }
+
+
+def export_users(conn, file, include_passwords=False):
+    """Write every user to `file` as CSV with a header row."""
+    columns = "id, name, email, password, created_at" if include_passwords else "id, name, email, created_at"
+    with conn.cursor() as cursor:
+        cursor.copy_expert(f"COPY (SELECT {columns} FROM users ORDER BY id) TO STDOUT WITH (FORMAT csv, HEADER)",
+                           file)
+        count = cursor.rowcount
+    conn.rollback()
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk import or export users")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    import_parser = subparsers.add_parser("import", help="Import users from a name,email,password CSV")
+    import_parser.add_argument("path")
+    import_parser.add_argument("--on-conflict", choices=CONFLICT_ACTIONS, default="skip",
+                               help="What to do with emails that are already registered")
+    export_parser = subparsers.add_parser("export", help="Export users to CSV")
+    export_parser.add_argument("path")
+    export_parser.add_argument("--include-passwords", action="store_true")
+    args = parser.parse_args()
+
+    load_dotenv()
+    conn = psycopg2.connect(os.getenv('DB_URL'))
+    try:
+        migrations.migrate(conn)
+        if args.command == "import":
+            with open(args.path, newline='', encoding='utf-8-sig') as f:
+                rows, errors = parse_users_csv(f)
+            for line, error in errors:
+                print(f"⚠️  Line {line}: {error}")
+            summary = import_users(conn, rows, args.on_conflict)
+            print(f"✅ {summary['inserted']} users created, {summary['updated']} updated, "
+                  f"{summary['skipped_existing']} already registered, "
+                  f"{summary['duplicates_in_file']} repeated in the file, {len(errors)} invalid")
+            if errors:
+                sys.exit(1)
+        else:
+            with open(args.path, 'w', newline='', encoding='utf-8') as f:
+                count = export_users(conn, f, args.include_passwords)
+            print(f"✅ Exported {count} users to {args.path}")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -14,6 +14,7 @@ import { Image } from "expo-image";
 import { LinearGradient } from 'expo-linear-gradient';
 import { useRouter } from 'expo-router';
 import { API_ENDPOINTS } from '../config/api';
+import { useAuth } from '../contexts/AuthContext';
 
 interface PredictionResponse {
   predicted_class: string;
@@ -29,6 +30,7 @@ export default function PredictionScreen() {
   const [result, setResult] = useState<PredictionResponse | null>(null);
   const [hasPermission, setHasPermission] = useState<boolean | null>(null);
   const router = useRouter();
+  const { user } = useAuth();
 
   useEffect(() => {
     (async () => {
@@ -104,6 +106,10 @@ export default function PredictionScreen() {
         name: filename,
         type,
       } as any);
+      // Lets the backend record this diagnosis in the user's history
+      if (user) {
+        formData.append("user_id", String(user.id));
+      }
 
       const response = await fetch(API_ENDPOINTS.PREDICT, {
         method: "POST",
@@ -16,4 +16,5 @@ export const API_ENDPOINTS = {
   SIGNUP: `${API_BASE_URL}/signup`,
   PREDICT: `${API_BASE_URL}/predict`,
   USERS: `${API_BASE_URL}/users`,
+  HISTORY: `${API_BASE_URL}/history`,
 };